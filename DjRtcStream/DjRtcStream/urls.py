@@ -24,4 +24,9 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path('', TemplateView.as_view(template_name='index.html'), name='home'),
     path('offer', views.offer, name='offer'),  # signaling endpoint
+    path('session/<str:session_id>/close', views.session_close, name='session_close'),
+    path('session/<str:session_id>/candidates', views.session_candidates_view, name='session_candidates'),
+    path('session/<str:session_id>/stats', views.session_stats_view, name='session_stats'),
+    path('sessions', views.sessions_view, name='sessions'),  # counts, for scaling
+    path('metrics', views.metrics_view, name='metrics'),  # Prometheus scrape target
 ]
@@ -0,0 +1,375 @@
+"""
+Synthetic viewers for capacity planning: N headless aiortc clients negotiate through
+/offer, consume the media, and we report per step (N = 10, 50, 100, ...):
+
+- offer latency (POST /offer -> answer) and time-to-first-frame percentiles,
+- sustained fps per viewer over the hold window,
+- failures (non-200 answers, e.g. 503 from the offer gate or the session caps),
+- server CPU % and RSS, scraped from /metrics (process_* samples; RSS needs psutil).
+
+Against a running server (HTTP):
+    RTC_FILE_TO_STREAM=none uvicorn DjRtcStream.asgi:application      # deterministic testsrc
+    python loadtest.py --url http://127.0.0.1:8000 --steps 10,50,100,200 --processes 4
+
+In-process (no ASGI server needed: the Django ASGI app is called directly on our loop;
+CPU/RSS then include the clients):
+    python loadtest.py --in-process --steps 5,10,20
+
+All HTTP viewers come from one address: raise sessions.MAX_SESSIONS_PER_IP on the server
+first (in-process viewers get an address each). By default frames are only counted as
+they leave the jitter buffer (--decode also decodes them, at the clients' CPU cost).
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import statistics
+import time
+import urllib.parse
+
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+# ---------------------------------------------------------------------------
+# Talking to the server: HTTP, or the ASGI app in this process
+# ---------------------------------------------------------------------------
+
+class HttpClient:
+    """Just enough HTTP/1.1 for POST /offer and GET /metrics (stdlib only)."""
+
+    def __init__(self, url):
+        parts = urllib.parse.urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+
+    async def request(self, method, path, body=b"", client=None):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            head = (f"{method} {self.prefix}{path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n")
+            writer.write(head.encode() + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            return status, await reader.read()
+        finally:
+            writer.close()
+
+
+class AsgiClient:
+    """Calls the Django ASGI application directly (same process, same event loop)."""
+
+    def __init__(self):
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "DjRtcStream.settings")
+        from DjRtcStream.asgi import application
+        self.app = application
+
+    async def request(self, method, path, body=b"", client=None):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+            "client": (client or "127.0.0.1", 50000), "server": ("localhost", 80),
+        }
+        sent = False
+        status, chunks = None, []
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()   # never disconnects; Django cancels this when done
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, b"".join(chunks)
+
+
+async def scrape(client):
+    """(cpu seconds, rss bytes or None, open sessions) summed over the server's processes."""
+    status, body = await client.request("GET", "/metrics")
+    if status != 200:
+        return None
+    cpu, rss, sessions = 0.0, None, 0
+    for line in body.decode().splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+        name, value = line.rsplit(" ", 1)
+        name = name.split("{", 1)[0]
+        if name == "process_cpu_seconds_total":
+            cpu += float(value)
+        elif name == "process_resident_memory_bytes":
+            rss = (rss or 0) + float(value)
+        elif name == "webrtc_sessions":
+            sessions += float(value)
+    return cpu, rss, int(sessions)
+
+
+# ---------------------------------------------------------------------------
+# One synthetic viewer
+# ---------------------------------------------------------------------------
+
+class CountingQueue(queue.Queue):
+    """Stands in for a receiver's decoder queue: counts complete frames, decodes nothing."""
+
+    def __init__(self, on_frame):
+        super().__init__()
+        self.on_frame = on_frame
+
+    def put(self, item, block=True, timeout=None):
+        if item is None:
+            super().put(item, block, timeout)   # lets aiortc's decoder thread exit
+        else:
+            self.on_frame()
+
+
+class Viewer:
+    def __init__(self, name, decode):
+        self.name = name
+        self.decode = decode
+        self.pc = RTCPeerConnection()
+        self.frames = 0
+        self.started = None
+        self.offer_latency = None
+        self.first_frame = None     # seconds from POST /offer to the first video frame
+        self.error = None
+        self.task = None
+
+    def _frame(self):
+        if self.first_frame is None:
+            self.first_frame = time.perf_counter() - self.started
+        self.frames += 1
+
+    async def _read(self, track):
+        while True:
+            try:
+                await track.recv()
+            except MediaStreamError:
+                return
+            if track.kind == "video":
+                self._frame()
+
+    async def start(self, client, address):
+        pc = self.pc
+        pc.addTransceiver("video", direction="recvonly")
+        pc.addTransceiver("audio", direction="recvonly")
+
+        @pc.on("track")
+        def on_track(track):
+            if self.decode:
+                asyncio.ensure_future(self._read(track))
+            elif track.kind == "video":
+                receiver = next(t.receiver for t in pc.getTransceivers() if t.receiver.track is track)
+                receiver._RTCRtpReceiver__decoder_queue = CountingQueue(self._frame)
+
+        await pc.setLocalDescription(await pc.createOffer())
+        body = json.dumps({"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}).encode()
+        self.started = time.perf_counter()
+        try:
+            status, reply = await client.request("POST", "/offer", body, client=address)
+        except OSError as e:
+            self.error = f"connect: {e}"
+            return
+        self.offer_latency = time.perf_counter() - self.started
+        if status != 200:
+            self.error = f"{status} {reply[:80].decode(errors='replace')}"
+            return
+        answer = json.loads(reply)
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=answer["sdp"], type=answer["type"]))
+
+    async def close(self):
+        await self.pc.close()
+
+
+# ---------------------------------------------------------------------------
+# Steps: ramp to N viewers, hold, measure
+# ---------------------------------------------------------------------------
+
+async def drive(args, share, index, checkpoint, report):
+    """
+    Run this process's share of every step. `checkpoint(step, phase)` is awaited once
+    ramped ("ramped") and after the hold ("held"); `report(result)` gets each step's numbers.
+    """
+    client = AsgiClient() if args.in_process else HttpClient(args.url)
+    viewers = []
+    for step, total in enumerate(share):
+        new = []
+        while len(viewers) < total:
+            n = len(viewers)
+            viewer = Viewer(f"p{index}v{n}", args.decode)
+            viewers.append(viewer)
+            new.append(viewer)
+            # every in-process viewer its own address (per-IP session cap)
+            address = f"10.{index}.{n // 250}.{n % 250 + 1}"
+            viewer.task = asyncio.ensure_future(viewer.start(client, address))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*(v.task for v in new))
+        # Give newcomers the chance to see their first frame before the window opens
+        deadline = time.perf_counter() + args.settle
+        while time.perf_counter() < deadline and any(v.first_frame is None and not v.error for v in new):
+            await asyncio.sleep(0.1)
+
+        await checkpoint(step, "ramped")
+        before = {v.name: v.frames for v in viewers}
+        window = time.perf_counter()
+        await asyncio.sleep(args.hold)
+        elapsed = time.perf_counter() - window
+        await checkpoint(step, "held")
+
+        report({
+            "step": step,
+            "viewers": len(viewers),
+            "failed": sum(1 for v in viewers if v.error),
+            "errors": sorted({v.error for v in new if v.error})[:3],
+            "offer_latency": [v.offer_latency for v in new if v.offer_latency is not None and not v.error],
+            "first_frame": [v.first_frame for v in new if v.first_frame is not None],
+            "no_frame": sum(1 for v in new if v.first_frame is None and not v.error),
+            "fps": [(v.frames - before[v.name]) / elapsed for v in viewers if not v.error],
+        })
+    for viewer in viewers:
+        await viewer.close()
+
+
+def split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def summarize(step, total, results, server_before, server_after, seconds):
+    merged = {key: [x for r in results for x in r[key]] for key in ("offer_latency", "first_frame", "fps")}
+    row = {
+        "viewers": total,
+        "failed": sum(r["failed"] for r in results),
+        "no_frame": sum(r["no_frame"] for r in results),
+        "errors": sorted({e for r in results for e in r["errors"]})[:3],
+        "offer_p50_ms": percentile(merged["offer_latency"], 50) * 1000,
+        "offer_p95_ms": percentile(merged["offer_latency"], 95) * 1000,
+        "offer_p99_ms": percentile(merged["offer_latency"], 99) * 1000,
+        "ttff_p50_ms": percentile(merged["first_frame"], 50) * 1000,
+        "ttff_p95_ms": percentile(merged["first_frame"], 95) * 1000,
+        "fps_mean": statistics.fmean(merged["fps"]) if merged["fps"] else float("nan"),
+        "fps_p5": percentile(merged["fps"], 5),
+    }
+    if server_before and server_after:
+        row["server_cpu_pct"] = (server_after[0] - server_before[0]) / seconds * 100
+        row["server_rss_mb"] = server_after[1] / 2**20 if server_after[1] else None
+        row["server_sessions"] = server_after[2]
+    return row
+
+
+def print_row(row):
+    server = ""
+    if "server_cpu_pct" in row:
+        rss = f"{row['server_rss_mb']:.0f} MB" if row["server_rss_mb"] else "n/a"
+        server = f" | server cpu {row['server_cpu_pct']:6.1f}%  rss {rss}  sessions {row['server_sessions']}"
+    print(f"[load] N={row['viewers']:4d}  failed {row['failed']:3d}  "
+          f"offer p50/p95/p99 {row['offer_p50_ms']:6.0f}/{row['offer_p95_ms']:6.0f}/{row['offer_p99_ms']:6.0f} ms  "
+          f"ttff p50/p95 {row['ttff_p50_ms']:6.0f}/{row['ttff_p95_ms']:6.0f} ms  "
+          f"fps mean {row['fps_mean']:5.1f} p5 {row['fps_p5']:5.1f}" + server)
+    for error in row["errors"]:
+        print(f"[load]        e.g. {error}")
+
+
+async def run_single(args, steps):
+    client = AsgiClient() if args.in_process else HttpClient(args.url)
+    rows, results, marks = [], [], {}
+
+    async def checkpoint(step, phase):
+        marks[phase] = (time.perf_counter(), await scrape(client))
+
+    def report(result):
+        (t0, before), (t1, after) = marks["ramped"], marks["held"]
+        row = summarize(result["step"], steps[result["step"]], [result], before, after, t1 - t0)
+        print_row(row)
+        rows.append(row)
+
+    await drive(args, steps, 0, checkpoint, report)
+    if args.in_process:
+        # the server side lives on this loop too: shut its sessions (and players) down with it
+        from rtcapp.views import SESSIONS
+        for session_id in list(SESSIONS.sessions):
+            await SESSIONS.close(session_id, "load test over")
+    return rows
+
+
+def worker(index, args, share, barrier, results):
+    """One client process: its share of the viewers, in step with the others (barrier)."""
+    async def checkpoint(step, phase):
+        await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+
+    asyncio.run(drive(args, share, index, checkpoint, results.put))
+
+
+def run_multi(args, steps):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(args.processes + 1)   # every client process + us (we scrape)
+    results = ctx.Queue()
+    shares = list(zip(*[split(n, args.processes) for n in steps]))
+    procs = [ctx.Process(target=worker, args=(i, args, list(shares[i]), barrier, results), daemon=True)
+             for i in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    client = HttpClient(args.url)
+    rows = []
+    for step, total in enumerate(steps):
+        barrier.wait()                                      # everyone ramped
+        t0, before = time.perf_counter(), asyncio.run(scrape(client))
+        barrier.wait()                                      # hold over
+        t1, after = time.perf_counter(), asyncio.run(scrape(client))
+        step_results = [results.get(timeout=60) for _ in procs]
+        row = summarize(step, total, step_results, before, after, t1 - t0)
+        print_row(row)
+        rows.append(row)
+    for proc in procs:
+        proc.join(timeout=30)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the /offer endpoint with headless aiortc viewers.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="server base URL")
+    parser.add_argument("--in-process", action="store_true", help="call the Django ASGI app in this process")
+    parser.add_argument("--steps", default="10,50,100,200", help="viewer counts, comma-separated")
+    parser.add_argument("--processes", type=int, default=1, help="client processes (HTTP mode)")
+    parser.add_argument("--rate", type=float, default=20.0, help="new viewers per second (per process)")
+    parser.add_argument("--hold", type=float, default=10.0, help="seconds measured at every step")
+    parser.add_argument("--settle", type=float, default=10.0, help="max seconds to wait for first frames")
+    parser.add_argument("--decode", action="store_true", help="decode the media (costs client CPU)")
+    parser.add_argument("--json", help="also write the per-step results to this file")
+    args = parser.parse_args()
+    steps = sorted(int(n) for n in args.steps.split(","))
+    if args.in_process and args.processes > 1:
+        parser.error("--in-process runs one process")
+
+    print(f"[load] steps {steps} against {'the in-process ASGI app' if args.in_process else args.url}, "
+          f"{args.processes} client process(es), {'decoding' if args.decode else 'counting frames only'}")
+    rows = run_multi(args, steps) if args.processes > 1 else asyncio.run(run_single(args, steps))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"[load] results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from fractions import Fraction
+from pathlib import Path
+
+import av
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+# Pre-encoded asset library: a library file is encoded ONCE (ingest) into WebRTC-ready
+# bitstreams, and viewers are served those packets as they are. aiortc only packetizes
+# an av.Packet (see broadcast.EncodedTrack), so a VOD viewer costs no decode, no encode.
+#
+#   <ASSET_DIR>/<asset key>/index.json          renditions + per-packet tables
+#   <ASSET_DIR>/<asset key>/<rendition>.bin     the packets, back to back (mmapped)
+#
+# The asset key is the file stem plus a hash of the file's resolved path, so
+# a/intro.mp4 and b/intro.mp4 don't overwrite each other.
+#
+# Ingest:  python manage.py ingest_assets videos/sample.mp4
+# Both ingest_assets and the server read RTC_ASSET_DIR, so they always agree on where assets live.
+
+ASSET_DIR = Path(os.environ.get("RTC_ASSET_DIR", Path(__file__).resolve().parents[1] / "assets"))
+
+# (mime, height, bits/s) of every video rendition; heights above the source are capped to it
+RENDITIONS = [
+    ("video/VP8", 720, 2_500_000),
+    ("video/VP8", 480, 1_000_000),
+    ("video/VP8", 240, 300_000),
+    ("video/H264", 720, 2_500_000),
+    ("video/H264", 480, 1_000_000),
+    ("video/H264", 240, 300_000),
+]
+AUDIO_BITRATE = 96_000          # Opus, 48 kHz stereo, 20 ms packets
+ASSET_GOP = 60                  # frames between keyframes: how far a new viewer may have to seek back
+
+VIDEO_TIME_BASE = Fraction(1, 90000)   # RTP video clock, so pack() never has to rescale
+AUDIO_TIME_BASE = Fraction(1, 48000)
+
+
+def rendition_name(mime: str, height: int, bitrate: int) -> str:
+    return f"{mime.split('/')[1].lower()}-{height}p-{bitrate // 1000}k"
+
+
+def _open_encoder(mime: str, width: int, height: int, bitrate: int):
+    if mime == "video/VP8":
+        codec = av.CodecContext.create("libvpx", "w")
+        # Offline: spend the CPU here, once. No alt-ref frames (aiortc sends one frame per packet).
+        codec.options = {"deadline": "good", "cpu-used": "2", "auto-alt-ref": "0"}
+    else:
+        codec = av.CodecContext.create("libx264", "w")
+        # Baseline (no B-frames) + SPS/PPS repeated on every IDR, as browsers expect
+        codec.options = {"level": "31", "preset": "medium", "bf": "0", "x264-params": "repeat-headers=1"}
+        codec.profile = "Baseline"
+    codec.width, codec.height = width, height
+    codec.pix_fmt = "yuv420p"
+    codec.bit_rate = bitrate
+    codec.gop_size = ASSET_GOP
+    codec.time_base = VIDEO_TIME_BASE
+    return codec
+
+
+class _RenditionWriter:
+    """Ingest side of one rendition: encoder + output file + packet table."""
+
+    def __init__(self, directory: Path, name: str, kind: str, codec, time_base):
+        self.name = name
+        self.kind = kind
+        self.codec = codec
+        self.time_base = time_base
+        self.file = open(directory / f"{name}.bin", "wb")
+        self.packets = []       # [pts, offset, size, keyframe]
+        self.offset = 0
+
+    def write(self, packets):
+        for packet in packets:
+            data = bytes(packet)
+            self.file.write(data)
+            self.packets.append([packet.pts, self.offset, len(data), int(packet.is_keyframe)])
+            self.offset += len(data)
+
+    def finish(self) -> dict:
+        self.write(self.codec.encode(None))   # flush
+        self.file.close()
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "width": getattr(self.codec, "width", None),
+            "height": getattr(self.codec, "height", None),
+            "bitrate": self.codec.bit_rate,
+            "time_base": [self.time_base.numerator, self.time_base.denominator],
+            "packets": self.packets,
+        }
+
+
+def asset_key(source) -> str:
+    """Directory name of `source`'s asset: "<stem>-<hash of the resolved path>"."""
+    resolved = str(Path(source).resolve())
+    return f"{Path(resolved).stem}-{hashlib.sha1(resolved.encode()).hexdigest()[:10]}"
+
+
+def _duration(info: dict) -> float:
+    """Seconds from the first packet to the end of the last one (one packet interval after it)."""
+    pts = [p[0] for p in info["packets"]]
+    if not pts:
+        return 0.0
+    step = (pts[-1] - pts[0]) / (len(pts) - 1) if len(pts) > 1 else 0
+    return float((pts[-1] + step) * Fraction(*info["time_base"]))
+
+
+def ingest(source, renditions=RENDITIONS, asset_dir=ASSET_DIR) -> Path:
+    """
+    Decode `source` once and encode every rendition (plus Opus audio) from it.
+    Returns the asset directory. Safe to re-run: the old asset is replaced.
+    """
+    source = Path(source)
+    directory = Path(asset_dir) / asset_key(source)
+    directory.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    with av.open(str(source)) as container:
+        video_in = container.streams.video[0] if container.streams.video else None
+        audio_in = container.streams.audio[0] if container.streams.audio else None
+        if video_in is None:
+            raise ValueError(f"{source}: no video stream")
+        src_w, src_h = video_in.codec_context.width, video_in.codec_context.height
+
+        video, seen = [], set()
+        for mime, height, bitrate in renditions:
+            height = min(height, src_h // 2 * 2)   # never upscale: taller renditions become one at source height
+            if (mime, height) in seen:
+                continue
+            seen.add((mime, height))
+            width = int(src_w * height / src_h) // 2 * 2
+            name = rendition_name(mime, height, bitrate)
+            video.append((mime, _RenditionWriter(directory, name, "video",
+                                                 _open_encoder(mime, width, height, bitrate), VIDEO_TIME_BASE)))
+        if not video:
+            raise ValueError(f"{source}: no renditions to encode")
+
+        audio = resampler = None
+        if audio_in is not None:
+            codec = av.CodecContext.create("libopus", "w")
+            codec.sample_rate, codec.layout, codec.format = 48000, "stereo", "s16"
+            codec.bit_rate = AUDIO_BITRATE
+            codec.time_base = AUDIO_TIME_BASE
+            audio = _RenditionWriter(directory, "opus", "audio", codec, AUDIO_TIME_BASE)
+            resampler = av.AudioResampler(format="s16", layout="stereo", rate=48000, frame_size=960)
+
+        streams = [s for s in (video_in, audio_in) if s is not None]
+        for frame in container.decode(*streams):
+            if frame.pts is None:
+                continue
+            if isinstance(frame, av.VideoFrame):
+                pts = int(round(frame.time / VIDEO_TIME_BASE))
+                for mime, writer in video:
+                    # Scale serially: every rendition reads the same decoded frame
+                    scaled = frame.reformat(width=writer.codec.width, height=writer.codec.height, format="yuv420p")
+                    scaled.pts, scaled.time_base = pts, VIDEO_TIME_BASE
+                    writer.write(writer.codec.encode(scaled))
+            elif audio is not None:
+                for chunk in resampler.resample(frame):
+                    audio.write(audio.codec.encode(chunk))
+        if audio is not None:
+            for chunk in resampler.resample(None):
+                audio.write(audio.codec.encode(chunk))
+
+    index = {
+        "source": str(source.resolve()),
+        "source_mtime": source.stat().st_mtime,
+        "renditions": [dict(writer.finish(), mime=mime) for mime, writer in video],
+        "audio": audio.finish() if audio is not None else None,
+    }
+    index["duration"] = max(_duration(r) for r in index["renditions"])
+    (directory / "index.json").write_text(json.dumps(index))
+    names = ", ".join(r["name"] for r in index["renditions"]) + (", opus" if audio is not None else "")
+    print(f"[assets] ingested {source} -> {directory} ({names}) in {time.perf_counter() - started:.1f}s")
+    return directory
+
+
+class Rendition:
+    """One pre-encoded bitstream of an asset: packet table + mmapped packet file."""
+
+    def __init__(self, directory: Path, info: dict):
+        self.name = info["name"]
+        self.kind = info["kind"]
+        self.mime = info.get("mime", "audio/opus")
+        self.width, self.height = info["width"], info["height"]
+        self.bitrate = info["bitrate"]
+        self.time_base = Fraction(*info["time_base"])
+        self.pts, self.offset, self.size, self.keyframe = (list(c) for c in zip(*info["packets"])) \
+            if info["packets"] else ([], [], [], [])
+        self.keyframe_pos = [n for n, key in enumerate(self.keyframe) if key]
+        self.keyframe_pts = [self.pts[n] for n in self.keyframe_pos]   # sorted: bisect target for seeks
+        self._file = open(directory / f"{self.name}.bin", "rb")
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.pts else b""
+        self.view = memoryview(self.mm)   # slicing a memoryview doesn't copy; slicing the mmap does
+
+    def packet(self, n: int, pts_offset: int = 0) -> av.Packet:
+        start = self.offset[n]
+        # PyAV wraps the buffer it is given: the packet points straight into the mmap (no copy)
+        packet = av.Packet(self.view[start:start + self.size[n]])
+        packet.pts = packet.dts = self.pts[n] + pts_offset
+        packet.time_base = self.time_base
+        packet.is_keyframe = bool(self.keyframe[n])
+        return packet
+
+    def seek(self, seconds: float) -> int:
+        """Packet number of the last keyframe at or before `seconds` (O(log n))."""
+        i = bisect.bisect_right(self.keyframe_pts, seconds / self.time_base) - 1
+        return self.keyframe_pos[max(i, 0)] if self.keyframe_pos else 0
+
+    def first_at(self, seconds: float) -> int:
+        """Packet number of the first packet at or after `seconds` (audio: no keyframes)."""
+        return bisect.bisect_left(self.pts, seconds / self.time_base)
+
+    def close(self):
+        self.view.release()
+        if self.pts:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass   # packets still in flight hold the mapping; it is unmapped when the last one is freed
+        self._file.close()
+
+
+class Asset:
+    """An ingested library file: its video renditions and (optional) Opus track."""
+
+    def __init__(self, directory: Path):
+        index = json.loads((directory / "index.json").read_text())
+        self.directory = directory
+        self.source = index["source"]
+        self.source_mtime = index["source_mtime"]
+        self.duration = index["duration"]
+        self.renditions = [Rendition(directory, info) for info in index["renditions"]]
+        self.audio = Rendition(directory, index["audio"]) if index["audio"] else None
+
+    def pick(self, mime: str, height=None):
+        """The tallest `mime` rendition not above `height` (any height: the tallest; else the smallest)."""
+        candidates = sorted((r for r in self.renditions if r.mime == mime), key=lambda r: r.height)
+        if not candidates:
+            return None
+        if height is None:
+            return candidates[-1]
+        fitting = [r for r in candidates if r.height <= height]
+        return fitting[-1] if fitting else candidates[0]
+
+    def close(self):
+        for rendition in self.renditions + ([self.audio] if self.audio else []):
+            rendition.close()
+
+
+ASSETS = {}   # resolved source path -> Asset
+_assets_lock = threading.Lock()
+
+
+def find_asset(source, asset_dir=ASSET_DIR):
+    """The ingested Asset of `source`, or None if it was never ingested or the file changed since."""
+    source = Path(source).resolve()
+    with _assets_lock:
+        asset = ASSETS.get(str(source))
+        if asset is None:
+            directory = Path(asset_dir) / asset_key(source)
+            if not (directory / "index.json").exists():
+                return None
+            asset = Asset(directory)
+            if asset.source != str(source):
+                print(f"[assets] {directory} holds {asset.source}, not {source}; re-run ingest_assets")
+                asset.close()
+                return None
+            ASSETS[str(source)] = asset
+    if source.exists() and abs(source.stat().st_mtime - asset.source_mtime) > 1e-3:
+        print(f"[assets] {source} changed since ingest; re-run ingest_assets")
+        return None
+    return asset
+
+
+class PreencodedTrack(MediaStreamTrack):
+    """
+    Streams one rendition's packets, paced to their timestamps. recv() returns
+    av.Packet objects, which aiortc's RTCRtpSender packetizes without encoding.
+    Keyframe requests (PLI) can't be honoured: viewers start on a keyframe, and a
+    lost one is repaired by the next one (ASSET_GOP).
+    """
+
+    def __init__(self, player: "PreencodedPlayer", rendition: Rendition):
+        super().__init__()
+        self.kind = rendition.kind
+        self.player = player
+        self.rendition = rendition
+        self.n = None
+        self.loops = 0
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        rendition = self.rendition
+        if self.n is None:
+            self.n = self.player.start_packet(rendition)
+        if self.n >= len(rendition.pts):
+            if not self.player.loop or not rendition.pts:
+                self.stop()
+                raise MediaStreamError
+            self.n = 0
+            self.loops += 1
+        offset = int(round(self.loops * self.player.asset.duration / rendition.time_base))
+        packet = rendition.packet(self.n, offset)
+        self.n += 1
+
+        # Real-time pacing against the player's shared clock
+        seconds = float(packet.pts * rendition.time_base) - self.player.start
+        delay = self.player.clock() + seconds - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return packet
+
+
+class PreencodedPlayer:
+    """
+    MediaPlayer-like (.video / .audio) over an Asset, for ONE viewer: reading packets
+    is an mmap slice, so every viewer can have its own position at no real cost.
+    start: seconds into the file; playback begins at the keyframe at or before it.
+    """
+
+    def __init__(self, asset: Asset, rendition: Rendition, audio=True, start=0.0, loop=False):
+        self.asset = asset
+        self.loop = loop
+        n = rendition.seek(start)
+        self.start = float(rendition.pts[n] * rendition.time_base) if rendition.pts else 0.0
+        self._clock = None
+        self.video = PreencodedTrack(self, rendition)
+        self.audio = PreencodedTrack(self, asset.audio) if audio and asset.audio else None
+
+    def start_packet(self, rendition: Rendition) -> int:
+        return rendition.seek(self.start) if rendition.kind == "video" else rendition.first_at(self.start)
+
+    def clock(self):
+        """Wall-clock time of the start position (set by whichever track asks first)."""
+        if self._clock is None:
+            self._clock = time.time()
+        return self._clock
+
+    def stop(self):
+        for track in (self.video, self.audio):
+            if track is not None:
+                track.stop()
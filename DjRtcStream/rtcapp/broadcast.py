@@ -0,0 +1,231 @@
+import asyncio
+import time
+
+import av
+from aiortc import MediaStreamTrack, RTCRtpSender
+from aiortc.mediastreams import MediaStreamError
+from aiortc.sdp import SessionDescription
+
+from .metrics import ENCODE_TIME
+
+# Codecs we can encode once and hand to aiortc as pre-encoded packets, in preference order.
+BROADCAST_CODECS = ["video/VP8", "video/H264"]
+
+BROADCAST_BITRATE = 1_500_000   # bits/s of every shared encoder
+BROADCAST_GOP = 60              # frames between keyframes (~2 s at 30 fps)
+SUBSCRIBER_QUEUE = 30           # packets a viewer may lag behind before it is resynced
+
+
+def pick_codec(offer_sdp: str, codecs=BROADCAST_CODECS):
+    """Return the first of `codecs` (mime types) present in the offer's m-lines (or None)."""
+    offered = set()
+    for media in SessionDescription.parse(offer_sdp).media:
+        offered.update(c.mimeType for c in media.rtp.codecs)
+    for mime in codecs:
+        if mime in offered:
+            return mime
+    return None
+
+
+def prefer_codec(transceiver, mime: str):
+    """Restrict a transceiver to `mime` (+ RTX), so the negotiated codec matches the shared encoder."""
+    caps = RTCRtpSender.getCapabilities(mime.split("/")[0]).codecs
+    transceiver.setCodecPreferences(
+        [c for c in caps if c.mimeType == mime] + [c for c in caps if c.mimeType == "video/rtx"]
+    )
+
+
+class EncodedTrack(MediaStreamTrack):
+    """
+    A per-viewer track that returns already-encoded av.Packet objects.
+    aiortc's RTCRtpSender sees a Packet (not a Frame) and only packetizes it,
+    so each viewer costs RTP packetization + SRTP, never an encode.
+    """
+
+    kind = "video"
+
+    def __init__(self, encoder: "SharedEncoder"):
+        super().__init__()
+        self.encoder = encoder
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self.waiting_keyframe = True   # a new viewer can only start decoding on a keyframe
+
+    def push(self, packet):
+        """Called by the shared encoder for every packet it produces."""
+        if self.waiting_keyframe:
+            if not packet.is_keyframe:
+                return
+            self.waiting_keyframe = False
+        try:
+            self.queue.put_nowait(packet)
+        except asyncio.QueueFull:
+            # Viewer fell behind: dropping single inter-frames would corrupt the picture,
+            # so flush everything and restart from the next keyframe.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.waiting_keyframe = True
+            self.encoder.request_keyframe()
+
+    def end(self):
+        """No more packets: recv() raises MediaStreamError once the queue is drained."""
+        if self.queue.full():
+            self.queue.get_nowait()   # a dropped packet beats a viewer that never ends
+        self.queue.put_nowait(None)
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        packet = await self.queue.get()
+        if packet is None:
+            self.stop()
+            raise MediaStreamError
+        return packet
+
+    def stop(self):
+        super().stop()
+        if self.encoder is not None:
+            self.encoder.unsubscribe(self)
+            self.encoder = None
+
+
+class SharedEncoder:
+    """
+    One encoder per (source, codec, resolution) variant.
+    It reads decoded frames from a relay proxy of the shared source, encodes each
+    frame once (in a worker thread), and pushes the same packet to every viewer.
+    """
+
+    def __init__(self, key, source_track, mime: str, height=None):
+        self.key = key
+        self.source_track = source_track
+        self.mime = mime
+        self.height = height
+        self.codec = None
+        self.subscribers = set()   # EncodedTracks to push packets to
+        self.pcs = set()           # peer connections holding a reference (for the registry)
+        self.force_keyframe = True
+        self.task = None
+
+    def subscribe(self) -> EncodedTrack:
+        track = EncodedTrack(self)
+        self.subscribers.add(track)
+        self.request_keyframe()   # don't make the new viewer wait a whole GOP
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+        return track
+
+    def unsubscribe(self, track: EncodedTrack):
+        self.subscribers.discard(track)
+
+    def request_keyframe(self):
+        self.force_keyframe = True
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.source_track.stop()
+
+    def _open_codec(self, width: int, height: int, time_base):
+        if self.mime == "video/VP8":
+            codec = av.CodecContext.create("libvpx", "w")
+            codec.options = {"deadline": "realtime", "cpu-used": "-6", "lag-in-frames": "0"}
+        else:
+            codec = av.CodecContext.create("libx264", "w")
+            codec.options = {"level": "31", "tune": "zerolatency"}
+            codec.profile = "Baseline"
+        codec.width, codec.height = width, height
+        codec.pix_fmt = "yuv420p"
+        codec.bit_rate = BROADCAST_BITRATE
+        codec.gop_size = BROADCAST_GOP
+        # Same time base as the source frames, so PyAV never has to rebase (mutate) them.
+        codec.time_base = time_base
+        return codec
+
+    def _encode(self, frame, force_keyframe: bool):
+        """Runs in a worker thread: scale (if needed), encode, return packets."""
+        pts, time_base = frame.pts, frame.time_base
+        shared = frame
+        if self.height and frame.height > self.height:
+            width = int(frame.width * self.height / frame.height) // 2 * 2
+            frame = frame.reformat(width=width, height=self.height, format="yuv420p")
+        elif frame.format.name != "yuv420p":
+            frame = frame.reformat(format="yuv420p")
+        # else: the relay's shared frame itself (already yuv420p, see sources.Yuv420pTrack)
+
+        if self.codec is None or (self.codec.width, self.codec.height) != (frame.width, frame.height):
+            self.codec = self._open_codec(frame.width, frame.height, time_base)
+            force_keyframe = True
+
+        if force_keyframe:
+            if frame is shared:
+                # Other variants of this source encode the shared frame at the same time:
+                # mark a private copy as the keyframe, never the frame they see.
+                frame = av.VideoFrame.from_ndarray(frame.to_ndarray(), format="yuv420p")
+                frame.pts, frame.time_base = pts, time_base
+            frame.pict_type = av.video.frame.PictureType.I
+        started = time.perf_counter()
+        packets = self.codec.encode(frame)
+        ENCODE_TIME.observe(time.perf_counter() - started, self.mime)
+        for packet in packets:
+            # aiortc's packer reads pts/time_base to build the RTP timestamp
+            packet.pts, packet.time_base = pts, time_base
+        return packets
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    frame = await self.source_track.recv()
+                except MediaStreamError:
+                    break
+                force_keyframe, self.force_keyframe = self.force_keyframe, False
+                packets = await loop.run_in_executor(None, self._encode, frame, force_keyframe)
+                for packet in packets:
+                    for track in list(self.subscribers):
+                        track.push(packet)
+        finally:
+            for track in list(self.subscribers):
+                track.end()
+
+
+class EncoderRegistry:
+    """
+    (source key, codec, height) -> SharedEncoder, reference counted by pc.
+    Server CPU then grows with the number of distinct variants, not viewers.
+    """
+
+    def __init__(self):
+        self.encoders = {}   # variant key -> SharedEncoder
+        self.by_pc = {}      # pc -> (SharedEncoder, EncodedTrack)
+
+    def acquire(self, pc, source, mime: str, height=None) -> EncodedTrack:
+        """Subscribe `pc` to the encoder variant for `source` (a sources.SharedSource)."""
+        key = (source.key, mime, height)
+        encoder = self.encoders.get(key)
+        if encoder is None:
+            proxy = source.relay.subscribe(source.video, buffered=False)
+            encoder = SharedEncoder(key, proxy, mime, height)
+            self.encoders[key] = encoder
+            print(f"[webrtc] encoder started: {key}")
+        track = encoder.subscribe()
+        encoder.pcs.add(pc)
+        self.by_pc[pc] = (encoder, track)
+        return track
+
+    def release(self, pc):
+        """Drop `pc`'s subscription; stop the encoder after its last viewer. Idempotent."""
+        entry = self.by_pc.pop(pc, None)
+        if entry is None:
+            return
+        encoder, track = entry
+        track.stop()   # usually already stopped by aiortc when the pc's sender shut down
+        encoder.pcs.discard(pc)
+        if not encoder.pcs:
+            self.encoders.pop(encoder.key, None)
+            encoder.close()
+            print(f"[webrtc] encoder stopped: {encoder.key}")
+
+    def variant_count(self):
+        return len(self.encoders)
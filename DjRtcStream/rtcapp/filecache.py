@@ -0,0 +1,248 @@
+# filecache.py — file sources demuxed ONCE, then played from memory
+#
+# MediaPlayer opens and demuxes the file again for every player (every viewer,
+# every loop). Here:
+# - get_index(path) demuxes the file once into a FileIndex: per stream a packet table
+#   (pts, byte offset, size, keyframe flag) plus a sorted keyframe index; the file
+#   itself is mmap'ed, and PyAV wraps the buffer it is given, so a packet points
+#   straight into the page cache (no read(), no copy).
+# - Any number of CachedPlayers share that index. Seeking is a bisect over the
+#   keyframe times (no container seek), looping is "packet 0 again".
+# - Players still DECODE (aiortc re-encodes per peer anyway); decoding runs in a
+#   worker thread, pacing against a shared per-player clock like MediaPlayer.
+#
+#   player = CachedPlayer(get_index("sample.mp4"), start=30.0, loop=True)
+#   pc.addTrack(player.video); pc.addTrack(player.audio)
+
+import asyncio
+import bisect
+import mmap
+import threading
+import time
+
+import av
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+# Per-stream packet tables are kept as parallel lists (one entry per packet, in dts order).
+
+
+class StreamIndex:
+    """Packet table + codec parameters of one audio/video stream."""
+
+    def __init__(self, stream):
+        ctx = stream.codec_context
+        self.kind = stream.type
+        self.codec = ctx.name
+        self.extradata = ctx.extradata
+        self.time_base = stream.time_base
+        self.width = getattr(ctx, "width", None)
+        self.height = getattr(ctx, "height", None)
+        self.sample_rate = getattr(ctx, "sample_rate", None)
+        self.pts = []          # presentation time (stream time base)
+        self.times = []        # ... the same in seconds
+        self.offset = []       # byte offset in the file, or -1 if kept in `inline`
+        self.size = []
+        self.keyframe = []
+        self.keyframes = []    # times (s) of keyframes, sorted: bisect target for seeks
+        self.keyframe_pos = [] # ... and their packet numbers
+        self.inline = {}       # packet number -> bytes, when the file bytes don't match the packet
+        self.duration = 0.0
+
+    def seek(self, seconds):
+        """Packet number of the last keyframe at or before `seconds` (O(log n))."""
+        i = bisect.bisect_right(self.keyframes, seconds) - 1
+        return self.keyframe_pos[max(i, 0)] if self.keyframe_pos else 0
+
+    def first_at(self, seconds):
+        """Packet number of the first packet at or after `seconds` (audio: no keyframes)."""
+        return bisect.bisect_left(self.times, seconds)
+
+
+class FileIndex:
+    """
+    A media file demuxed ONCE: packet tables, keyframe index and codec parameters
+    of its first video and audio stream, with the file itself memory-mapped.
+    Any number of CachedPlayers read packets from it without reopening the file.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.streams = {}      # "video" / "audio" -> StreamIndex
+        started = time.perf_counter()
+        with av.open(self.path) as container:
+            wanted = {}
+            for kind, streams in (("video", container.streams.video), ("audio", container.streams.audio)):
+                if streams:
+                    wanted[streams[0].index] = self.streams[kind] = StreamIndex(streams[0])
+            self._file = open(self.path, "rb")
+            self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mm)   # slicing this doesn't copy, slicing mm does
+            for packet in container.demux(*[container.streams[i] for i in wanted]):
+                if packet.size == 0 or packet.pts is None:
+                    continue   # flush packets
+                index = wanted[packet.stream.index]
+                n = len(index.pts)
+                pos = packet.pos if packet.pos is not None else -1
+                # MP4 stores samples as-is, so the packet IS a slice of the file; other
+                # layouts (laced MKV blocks, ...) keep their bytes here instead.
+                if pos < 0 or self.view[pos:pos + packet.size] != memoryview(packet):
+                    index.inline[n] = bytes(packet)
+                    pos = -1
+                index.pts.append(packet.pts)
+                index.offset.append(pos)
+                index.size.append(packet.size)
+                index.keyframe.append(packet.is_keyframe)
+                seconds = float(packet.pts * index.time_base)
+                index.times.append(seconds)
+                if packet.is_keyframe and index.kind == "video":
+                    index.keyframes.append(seconds)
+                    index.keyframe_pos.append(n)
+                index.duration = max(index.duration, seconds + float((packet.duration or 0) * index.time_base))
+        for index in self.streams.values():
+            order = sorted(range(len(index.keyframes)), key=index.keyframes.__getitem__)
+            index.keyframes = [index.keyframes[i] for i in order]
+            index.keyframe_pos = [index.keyframe_pos[i] for i in order]
+        self.duration = max((s.duration for s in self.streams.values()), default=0.0)
+        print(f"[cache] indexed {self.path}: "
+              + ", ".join(f"{k} {s.codec} {len(s.pts)} packets" for k, s in self.streams.items())
+              + f" in {time.perf_counter() - started:.2f}s")
+
+    def packet(self, kind, n):
+        """Packet n of stream `kind`, pointing into the mmap (no file open, no demux, no copy)."""
+        index = self.streams[kind]
+        data = index.inline.get(n)
+        if data is None:
+            start = index.offset[n]
+            data = self.view[start:start + index.size[n]]
+        packet = av.Packet(data)
+        packet.pts = packet.dts = index.pts[n]
+        packet.time_base = index.time_base
+        return packet
+
+    def close(self):
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            pass   # packets still in flight hold the mapping; it is unmapped when the last one is freed
+        self._file.close()
+
+
+CACHE = {}   # path -> FileIndex
+_cache_lock = threading.Lock()
+
+
+def get_index(path):
+    """The FileIndex of `path`, built on first use and shared afterwards."""
+    key = str(path)
+    with _cache_lock:
+        index = CACHE.get(key)
+        if index is None:
+            index = CACHE[key] = FileIndex(key)
+        return index
+
+
+class CachedTrack(MediaStreamTrack):
+    """
+    One audio or video track of a CachedPlayer: packets from the FileIndex, decoded
+    in a worker thread, paced to real time like MediaPlayer does.
+    """
+
+    def __init__(self, player, kind):
+        super().__init__()
+        self.kind = kind
+        self.player = player
+        self.index = player.index.streams[kind]
+        self.decoder = None
+        self.resampler = None
+        self.pending = []      # decoded frames not returned yet
+        self.n = None          # next packet number
+        self.offset = 0.0      # seconds added to pts after each loop
+
+    def _open_decoder(self):
+        decoder = av.CodecContext.create(self.index.codec, "r")
+        if self.index.extradata:
+            decoder.extradata = self.index.extradata
+        if self.kind == "audio":
+            # aiortc's audio encoders take s16 stereo 48 kHz, as MediaPlayer delivers it
+            self.resampler = av.AudioResampler(format="s16", layout="stereo", rate=48000)
+        return decoder
+
+    def _convert(self, frames):
+        out = []
+        for frame in frames:
+            frame.time_base = self.index.time_base
+            out.extend(self.resampler.resample(frame) if self.kind == "audio" else [frame])
+        return out
+
+    def _decode_next(self):
+        """Runs in a worker thread: decode packets until at least one frame comes out."""
+        if self.decoder is None:
+            self.decoder = self._open_decoder()
+            self.n = self.player.start_packet(self.kind)
+        frames = []
+        while not frames:
+            if self.n >= len(self.index.pts):
+                frames = self._convert(self.decoder.decode(None))   # drain: last frames of this pass
+                if frames:
+                    break
+                if not self.player.loop:
+                    return None
+                self.decoder = self._open_decoder()         # loop: from the top, later in time
+                self.n = 0
+                self.offset += self.player.index.duration
+                continue
+            packet = self.player.index.packet(self.kind, self.n)
+            self.n += 1
+            frames = self._convert(self.decoder.decode(packet))
+        return frames
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        if not self.pending:
+            frames = await asyncio.get_running_loop().run_in_executor(None, self._decode_next)
+            if frames is None:
+                self.stop()
+                raise MediaStreamError
+            self.pending = frames
+        frame = self.pending.pop(0)
+
+        # Real-time pacing against the player's shared clock
+        seconds = float(frame.pts * frame.time_base) + self.offset - self.player.start
+        delay = self.player.clock() + seconds - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        frame.pts = int(round((seconds + self.player.start) / frame.time_base))
+        return frame
+
+
+class CachedPlayer:
+    """
+    Drop-in for aiortc's MediaPlayer (.video / .audio) that plays from a FileIndex.
+    start: seconds into the file; video begins at the keyframe at or before it.
+    """
+
+    def __init__(self, index, start=0.0, loop=False):
+        self.index = index
+        self.loop = loop
+        video = index.streams.get("video")
+        if video is not None:
+            self.start = video.keyframes[bisect.bisect_right(video.keyframes, start) - 1] \
+                if video.keyframes and start >= video.keyframes[0] else 0.0
+        else:
+            self.start = start
+        self._clock = None
+        self.video = CachedTrack(self, "video") if "video" in index.streams else None
+        self.audio = CachedTrack(self, "audio") if "audio" in index.streams else None
+
+    def start_packet(self, kind):
+        stream = self.index.streams[kind]
+        return stream.seek(self.start) if kind == "video" else stream.first_at(self.start)
+
+    def clock(self):
+        """Wall-clock time of the start position (set by whichever track asks first)."""
+        if self._clock is None:
+            self._clock = time.time()
+        return self._clock
@@ -0,0 +1,22 @@
+import av
+from django.core.management.base import BaseCommand, CommandError
+
+from rtcapp.assets import ASSET_DIR, RENDITIONS, ingest
+
+
+class Command(BaseCommand):
+    help = ("Pre-encode library files into the WebRTC-ready renditions served by rtcapp.assets. "
+            "Output goes to RTC_ASSET_DIR, the directory the server reads.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="media files to ingest")
+        parser.add_argument("--max-height", type=int, help="skip renditions taller than this")
+
+    def handle(self, *args, **options):
+        renditions = [r for r in RENDITIONS if not options["max_height"] or r[1] <= options["max_height"]]
+        for path in options["files"]:
+            try:
+                directory = ingest(path, renditions, ASSET_DIR)
+            except (OSError, ValueError, av.FFmpegError) as e:
+                raise CommandError(f"{path}: {e}")
+            self.stdout.write(self.style.SUCCESS(f"{path} -> {directory}"))
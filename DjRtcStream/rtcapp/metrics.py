@@ -0,0 +1,203 @@
+import asyncio
+import threading
+import time
+
+try:
+    import psutil   # optional: only needed for process_resident_memory_bytes
+except ImportError:
+    psutil = None
+
+# Prometheus text exposition (format 0.0.4), without the prometheus_client dependency.
+#
+# - Histograms (offer->answer, ICE gathering, broadcast encode time) are updated
+#   where the work happens; an observe() is a couple of additions.
+# - Per-track numbers (bitrate, fps, loss, RTT) come from getStats(), which is far
+#   too slow to call per scrape for hundreds of sessions. StatsSampler calls it every
+#   SAMPLE_INTERVAL on a background task and keeps the result; /metrics only formats
+#   that cached snapshot, so a scrape never touches a peer connection.
+# - collect() returns plain (name, labels, value) samples, so worker processes can
+#   send theirs to the Django process, which merges them (see workers.py).
+
+SAMPLE_INTERVAL = 5.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ENCODE_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25)
+
+# metric family -> (type, help)
+FAMILIES = {
+    "webrtc_sessions": ("gauge", "Open sessions by state."),
+    "webrtc_sessions_closed_total": ("counter", "Closed sessions by reason."),
+    "webrtc_offer_answer_seconds": ("histogram", "Time from receiving an offer to returning the answer."),
+    "webrtc_ice_gathering_seconds": ("histogram", "Time spent gathering our ICE candidates."),
+    "webrtc_encode_seconds": ("histogram", "Encode time per frame of the shared broadcast encoders."),
+    "webrtc_offers_rejected_total": ("counter", "Offers turned away (busy / session caps)."),
+    "webrtc_outbound_bitrate_bps": ("gauge", "Outbound bitrate per track over the last sample."),
+    "webrtc_outbound_fps": ("gauge", "Frames (packets for pre-encoded media) sent per second per track."),
+    "webrtc_packets_lost": ("gauge", "Packets lost per track, as reported by the viewer."),
+    "webrtc_fraction_lost": ("gauge", "Fraction of packets lost per track in the viewer's last report."),
+    "webrtc_rtt_seconds": ("gauge", "Round-trip time per track from the viewer's last report."),
+    "webrtc_stats_sample_seconds": ("gauge", "Duration of the last getStats() sampling pass."),
+    "process_cpu_seconds_total": ("counter", "User + system CPU time of this process."),
+    "process_resident_memory_bytes": ("gauge", "Resident set size of this process (needs psutil)."),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by one label."""
+
+    def __init__(self, name: str, buckets=LATENCY_BUCKETS, label: str = None):
+        self.name = name
+        self.buckets = buckets
+        self.label = label
+        self.series = {}   # label value -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()   # encoders observe from worker threads
+
+    def observe(self, value: float, label_value: str = ""):
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self.lock:
+            snapshot = [(label_value, list(series)) for label_value, series in self.series.items()]
+        for label_value, series in snapshot:
+            labels = {self.label: label_value} if self.label else {}
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", dict(labels, le=f"{bound:g}"), count
+            yield f"{self.name}_bucket", dict(labels, le="+Inf"), series[-2]
+            yield f"{self.name}_count", labels, series[-2]
+            yield f"{self.name}_sum", labels, series[-1]
+
+
+OFFER_ANSWER = Histogram("webrtc_offer_answer_seconds")
+ICE_GATHERING = Histogram("webrtc_ice_gathering_seconds")
+ENCODE_TIME = Histogram("webrtc_encode_seconds", ENCODE_BUCKETS, label="codec")
+REJECTED = {}      # reason -> count
+
+
+def count_frames(track):
+    """Count what `track` hands to its sender (track.frames_sent), for the fps gauge."""
+    track.frames_sent = 0
+    recv = track.recv
+
+    async def counting_recv():
+        frame = await recv()
+        track.frames_sent += 1
+        return frame
+
+    track.recv = counting_recv
+    return track
+
+
+class StatsSampler:
+    """Samples every session's senders on a background task; collect() reads the cache."""
+
+    def __init__(self, sessions):
+        self.sessions = sessions       # a sessions.SessionManager
+        self.samples = []              # cached (name, labels, value) from the last pass
+        self.previous = {}             # (session id, kind) -> (time, bytes, frames)
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                samples = await self._sample()
+            except Exception as e:
+                print("[webrtc] stats sampling failed:", e)
+                samples = []
+            duration = time.monotonic() - started
+            samples.append(("webrtc_stats_sample_seconds", {}, duration))
+            self.samples = samples
+            await asyncio.sleep(max(SAMPLE_INTERVAL - duration, 0.5))
+
+    async def _sample(self):
+        samples, seen = [], {}
+        now = time.monotonic()
+        for session in list(self.sessions.sessions.values()):
+            for sender in session.pc.getSenders():
+                track = sender.track
+                if track is None or session.pc.connectionState != "connected":
+                    continue
+                key = (session.id, track.kind)
+                labels = {"session": session.id[:8], "kind": track.kind}
+                sent, remote = 0, None
+                for stat in (await sender.getStats()).values():
+                    if stat.type == "outbound-rtp":
+                        sent += stat.bytesSent
+                    elif stat.type == "remote-inbound-rtp":
+                        remote = stat
+                frames = getattr(track, "frames_sent", 0)
+                seen[key] = (now, sent, frames)
+                if key in self.previous:
+                    then, sent_then, frames_then = self.previous[key]
+                    elapsed = max(now - then, 1e-6)
+                    samples.append(("webrtc_outbound_bitrate_bps", labels, (sent - sent_then) * 8 / elapsed))
+                    samples.append(("webrtc_outbound_fps", labels, (frames - frames_then) / elapsed))
+                if remote is not None:
+                    samples.append(("webrtc_packets_lost", labels, remote.packetsLost))
+                    samples.append(("webrtc_fraction_lost", labels, remote.fractionLost))
+                    samples.append(("webrtc_rtt_seconds", labels, remote.roundTripTime))
+                await asyncio.sleep(0)   # let media tasks run between senders
+        self.previous = seen
+        return samples
+
+    def collect(self):
+        counts = self.sessions.counts()
+        yield "webrtc_sessions", {"state": "connected"}, counts["connected"]
+        yield "webrtc_sessions", {"state": "connecting"}, counts["connecting"]
+        for reason, n in counts["closed"].items():
+            yield "webrtc_sessions_closed_total", {"reason": reason}, n
+        yield from self.samples
+
+
+def collect(sampler=None) -> list:
+    """Every sample of this process as JSON-friendly [name, labels, value] lists."""
+    samples = []
+    for histogram in (OFFER_ANSWER, ICE_GATHERING, ENCODE_TIME):
+        samples.extend(histogram.collect())
+    for reason, n in REJECTED.items():
+        samples.append(("webrtc_offers_rejected_total", {"reason": reason}, n))
+    samples.append(("process_cpu_seconds_total", {}, time.process_time()))
+    if psutil is not None:
+        samples.append(("process_resident_memory_bytes", {}, psutil.Process().memory_info().rss))
+    if sampler is not None:
+        samples.extend(sampler.collect())
+    return [list(s) for s in samples]
+
+
+def _family(name: str) -> str:
+    for suffix in ("_bucket", "_count", "_sum"):
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(samples) -> str:
+    """Samples (from any number of processes) -> Prometheus text, grouped by family."""
+    families = {}
+    for name, labels, value in samples:
+        families.setdefault(_family(name), []).append((name, labels, value))
+    lines = []
+    for family, rows in families.items():
+        kind, help_text = FAMILIES.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for name, labels, value in rows:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,150 @@
+import asyncio
+import collections
+import time
+
+# Session lifecycle: every viewer's peer connection, the media it holds and when it was
+# last seen sending. connectionstatechange alone misses abandoned tabs and half-open
+# sessions (a pc can sit in "new"/"connecting" forever, or stay "connected" with
+# nothing flowing), so a reaper task also closes:
+# - sessions that never connect within CONNECT_TIMEOUT,
+# - connected sessions whose outbound byte count has not moved for IDLE_TIMEOUT.
+# Caps: MAX_SESSIONS overall and MAX_SESSIONS_PER_IP per client address (per process:
+# in sharded mode every worker enforces them on its own sessions).
+
+MAX_SESSIONS = 500
+MAX_SESSIONS_PER_IP = 8
+CONNECT_TIMEOUT = 30.0     # seconds from the offer to "connected"
+IDLE_TIMEOUT = 20.0        # seconds without a single byte of media sent
+REAP_INTERVAL = 5.0
+
+
+class SessionLimit(Exception):
+    """Raised by SessionManager.admit() when a cap would be exceeded."""
+
+
+class Session:
+    """One viewer: its pc, the media it holds, and enough history to tell if it is alive."""
+
+    def __init__(self, session_id: str, pc, client: str):
+        self.id = session_id
+        self.pc = pc
+        self.client = client
+        self.created = time.monotonic()
+        self.connected = None          # monotonic time of "connected", if reached
+        self.player = None             # a per-session player to stop on close (shared ones: cleanup)
+        self.cleanup = []              # callables(pc) run once on close (registry releases, ...)
+        self.bytes_sent = 0            # outbound bytes at the last reaper pass
+        self.last_activity = self.created
+
+    def tracks(self):
+        return [s.track for s in self.pc.getSenders() if s.track is not None]
+
+
+class SessionManager:
+    """
+    session id -> Session, with admission caps, idempotent close and an idle reaper.
+
+        SESSIONS.admit(client)                    # raises SessionLimit
+        session = SESSIONS.add(session_id, pc, client)
+        session.cleanup.append(SOURCES.release)
+        ...
+        await SESSIONS.close(session_id, "client closed")
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, max_per_ip=MAX_SESSIONS_PER_IP):
+        self.max_sessions = max_sessions
+        self.max_per_ip = max_per_ip
+        self.sessions = {}                     # session id -> Session
+        self.per_ip = collections.Counter()    # client -> open sessions
+        self.reaped = collections.Counter()    # close reason -> count
+        self.on_close = []                     # callables(session) run after every close
+        self.reaper = None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, session_id: str):
+        return self.sessions.get(session_id)
+
+    def admit(self, client: str):
+        if len(self.sessions) >= self.max_sessions:
+            raise SessionLimit(f"server full ({len(self.sessions)} sessions)")
+        if client and self.per_ip[client] >= self.max_per_ip:
+            raise SessionLimit(f"too many sessions from {client} ({self.per_ip[client]})")
+
+    def add(self, session_id: str, pc, client: str = "") -> Session:
+        self.admit(client)
+        session = Session(session_id, pc, client)
+        self.sessions[session_id] = session
+        self.per_ip[client] += 1
+
+        @pc.on("connectionstatechange")
+        async def _on_state_change():
+            if pc.connectionState == "connected" and session.connected is None:
+                session.connected = session.last_activity = time.monotonic()
+            elif pc.connectionState in ("failed", "closed", "disconnected"):
+                await self.close(session_id, pc.connectionState)
+
+        if self.reaper is None:
+            self.reaper = asyncio.ensure_future(self._reap())
+        return session
+
+    async def close(self, session_id: str, reason: str = "closed") -> bool:
+        """Close a session and release everything it holds. Safe to call more than once."""
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.per_ip[session.client] -= 1
+        if self.per_ip[session.client] <= 0:
+            del self.per_ip[session.client]
+        self.reaped[reason] += 1
+        tracks = session.tracks()
+        await session.pc.close()
+        for track in tracks:
+            track.stop()
+        if session.player is not None:
+            session.player.stop()
+        for release in session.cleanup:
+            release(session.pc)
+        for callback in self.on_close:
+            callback(session)
+        print(f"[webrtc] session {session_id[:8]} closed ({reason}), "
+              f"{time.monotonic() - session.created:.0f}s old, {len(self.sessions)} left")
+        return True
+
+    def counts(self) -> dict:
+        """Numbers to scale on (plain JSON)."""
+        connected = sum(1 for s in self.sessions.values() if s.connected is not None)
+        return {
+            "sessions": len(self.sessions),
+            "connected": connected,
+            "connecting": len(self.sessions) - connected,
+            "clients": len(self.per_ip),
+            "max_sessions": self.max_sessions,
+            "closed": dict(self.reaped),
+        }
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                try:
+                    reason = await self._check(session, now)
+                except Exception as e:
+                    # a fixed reason: it becomes a metrics label (see metrics.py)
+                    print(f"[webrtc] session {session.id[:8]}: stats failed: {e!r}")
+                    reason = "stats_failed"
+                if reason:
+                    await self.close(session.id, reason)
+
+    async def _check(self, session: Session, now: float):
+        """Why `session` should be reaped, or None if it is alive."""
+        if session.connected is None:
+            return "never connected" if now - session.created > CONNECT_TIMEOUT else None
+        sent = sum(stat.bytesSent for stat in (await session.pc.getStats()).values()
+                   if stat.type == "outbound-rtp")
+        if sent > session.bytes_sent:
+            session.bytes_sent, session.last_activity = sent, now
+            return None
+        return "idle" if now - session.last_activity > IDLE_TIMEOUT else None
@@ -0,0 +1,108 @@
+import av
+
+from aiortc import MediaStreamTrack
+from aiortc.contrib.media import MediaPlayer, MediaRelay
+
+
+class Yuv420pTrack(MediaStreamTrack):
+    """
+    Convert decoded frames to yuv420p ONCE, before they are fanned out.
+    The encoders want yuv420p anyway; without this every viewer's encoder thread
+    would call frame.reformat() on the very same shared frame at the same time.
+    """
+
+    kind = "video"
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+
+    async def recv(self):
+        frame = await self.source.recv()
+        if frame.format.name != "yuv420p":
+            out = frame.reformat(format="yuv420p")
+            out.pts, out.time_base = frame.pts, frame.time_base
+            frame = out
+        # Decoders tag frames with their source picture type (every lavfi/raw frame is "I");
+        # encoders take that as "make a keyframe". Clear it once, here, before the frame is
+        # shared: keyframes then follow the GOP and explicit requests only.
+        frame.pict_type = av.video.frame.PictureType.NONE
+        return frame
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
+
+
+class SharedSource:
+    """
+    One decoded media source (a MediaPlayer) fanned out to many peer connections.
+    Every subscriber gets its own relay proxy track, but ffmpeg decodes only once.
+    """
+
+    def __init__(self, key, player: MediaPlayer):
+        self.key = key
+        self.player = player
+        self.relay = MediaRelay()
+        self.subscribers = set()
+        self.video = Yuv420pTrack(player.video) if player.video else None
+        self.audio = player.audio
+
+    def subscribe(self):
+        """
+        Return (video, audio) proxy tracks for a new viewer (either may be None).
+        buffered=False -> a slow viewer skips to the newest frame instead of
+        piling up a private queue of decoded frames.
+        """
+        video = self.relay.subscribe(self.video, buffered=False) if self.video else None
+        audio = self.relay.subscribe(self.audio, buffered=False) if self.audio else None
+        return video, audio
+
+    def close(self):
+        """Stop the underlying player tracks; this ends the decode thread."""
+        for track in (self.video, self.audio):
+            if track is not None:
+                track.stop()
+
+
+class SourceRegistry:
+    """
+    Server-wide registry: source key -> SharedSource, reference counted by pc.
+
+    - acquire() opens the player on the FIRST subscriber of a key.
+    - release() closes it after the LAST subscriber leaves.
+    """
+
+    def __init__(self):
+        self.sources = {}   # key -> SharedSource
+        self.by_pc = {}     # pc  -> SharedSource it subscribed to
+
+    def acquire(self, pc, key, open_player):
+        """
+        Subscribe `pc` to the source identified by `key`.
+        `open_player` is a zero-arg callable used only when the source is not running yet.
+        Returns the SharedSource; call .subscribe() on it to get the proxy tracks.
+        """
+        source = self.sources.get(key)
+        if source is None:
+            source = SharedSource(key, open_player())
+            self.sources[key] = source
+            print(f"[webrtc] source started: {key}")
+        source.subscribers.add(pc)
+        self.by_pc[pc] = source
+        return source
+
+    def release(self, pc):
+        """Drop `pc` from its source. Safe to call more than once per pc."""
+        source = self.by_pc.pop(pc, None)
+        if source is None:
+            return
+        source.subscribers.discard(pc)
+        if not source.subscribers:
+            self.sources.pop(source.key, None)
+            source.close()
+            print(f"[webrtc] source stopped: {source.key}")
+
+    def subscriber_count(self, key):
+        source = self.sources.get(key)
+        return len(source.subscribers) if source else 0
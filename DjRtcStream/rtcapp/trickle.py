@@ -0,0 +1,61 @@
+import asyncio
+
+from aiortc.sdp import SessionDescription, candidate_to_sdp
+
+# session id -> asyncio.Task running pc.setLocalDescription() (i.e. ICE gathering)
+GATHERING = {}
+
+
+def start_gathering(session_id: str, pc, answer):
+    """
+    Apply our answer in the background. aiortc gathers every local candidate inside
+    setLocalDescription(), so we return the candidate-less answer SDP to the client
+    right away and let it fetch our candidates later (see wait_for_candidates).
+    """
+    task = asyncio.ensure_future(pc.setLocalDescription(answer))
+    GATHERING[session_id] = task
+
+    def _done(_):
+        if GATHERING.get(session_id) is task:
+            del GATHERING[session_id]
+        if not task.cancelled() and task.exception() is not None:
+            print("[webrtc] trickle gathering failed:", task.exception())
+
+    task.add_done_callback(_done)
+    return task
+
+
+def local_candidates(pc) -> list:
+    """Our gathered candidates in browser addIceCandidate() form."""
+    if pc.localDescription is None:
+        return []
+    out = []
+    for index, media in enumerate(SessionDescription.parse(pc.localDescription.sdp).media):
+        for candidate in media.ice_candidates:
+            out.append({
+                "candidate": "candidate:" + candidate_to_sdp(candidate),
+                "sdpMid": media.rtp.muxId,
+                "sdpMLineIndex": index,
+            })
+    return out
+
+
+async def wait_for_candidates(session_id: str, pc, since: int = 0, timeout: float = 10.0) -> dict:
+    """
+    Long-poll: return the candidates after index `since`, waiting (up to `timeout`)
+    while gathering is still running. "complete" tells the client to stop polling.
+    """
+    task = GATHERING.get(session_id)
+    if task is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except Exception:
+            pass  # pc closed while gathering, etc. -- report what we have (logged in _done)
+    candidates = local_candidates(pc)
+    return {
+        "candidates": candidates[since:],
+        "next": len(candidates),
+        "complete": session_id not in GATHERING,
+    }
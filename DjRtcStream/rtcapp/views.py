@@ -1,36 +1,98 @@
 import json
+import os
+import uuid
 import asyncio
 import shutil
+import time
 from pathlib import Path
 
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
 
 from aiortc import RTCPeerConnection, RTCSessionDescription
 from aiortc.contrib.media import MediaPlayer
 
+from .assets import PreencodedPlayer, find_asset
+from .broadcast import BROADCAST_CODECS, EncoderRegistry, pick_codec, prefer_codec
+from .filecache import CachedPlayer, get_index
+from . import metrics
+from .pool import RETRY_AFTER, OfferBusy, OfferGate
+from .sessions import SessionLimit, SessionManager
+from .sources import SourceRegistry
+from .trickle import start_gathering, wait_for_candidates
+from .workers import WorkerError, get_pool, summarize_stats
+
 BASE_DIR = Path(__file__).resolve().parents[1]
 
 # >>> Set your file path here (absolute OK) <<<
-FILE_TO_STREAM = Path(r"D:\MinervaWorks\aiortc-learning\DjRtcStream\videos\sample.mp4")
+# (or in RTC_FILE_TO_STREAM; a path that doesn't exist streams the testsrc pattern)
+FILE_TO_STREAM = Path(os.environ.get(
+    "RTC_FILE_TO_STREAM", r"D:\MinervaWorks\aiortc-learning\DjRtcStream\videos\sample.mp4"))
+
+# session id -> Session (in this process): caps, cleanup and idle reaping (see sessions.py)
+SESSIONS = SessionManager()
+
+# getStats() of every session, sampled in the background for /metrics (see metrics.py)
+SAMPLER = metrics.StatsSampler(SESSIONS)
+
+# Sharded mode: >0 hands every new session to one of N worker processes,
+# each with its own event loop (see workers.py). 0 -> everything runs here.
+WORKERS = 0
+
+# One decoder per source, shared by every viewer (see sources.py)
+SOURCES = SourceRegistry()
+
+# Broadcast mode: encode once per (codec, resolution) variant and let every viewer
+# only packetize (see broadcast.py). False -> each pc encodes its own copy.
+BROADCAST = True
+ENCODERS = EncoderRegistry()
+
+# File cache: demux FILE_TO_STREAM once (packet table + keyframe index, file mmapped)
+# and play every source from that index instead of reopening it through ffmpeg
+# (see filecache.py). False -> a fresh MediaPlayer per source.
+FILE_CACHE = True
+
+# Pre-encoded: if FILE_TO_STREAM was ingested (python manage.py ingest_assets, see
+# assets.py), every viewer gets the stored packets of the rendition that fits it:
+# no decode, no encode per viewer. Falls back to the modes above when there is none.
+PREENCODED = True
 
-PCS = set()
+# Burst protection (see pool.py): a cap on concurrent offers with a bounded queue (503 beyond it).
+GATE = OfferGate()
 
 async def wait_for_ice_gathering_complete(pc: RTCPeerConnection, timeout: float = 6.0):
     """Wait until the server finishes gathering ICE candidates (single-shot signaling)."""
-    # Poll a few times; break when gathering complete.
-    step = 0.05
-    tries = int(timeout / step)
-    for _ in range(tries):
+    # Event-driven: wake up on "icegatheringstatechange" instead of polling.
+    if pc.iceGatheringState == "complete":
+        return
+    done = asyncio.Event()
+
+    def _on_gathering_state():
         if pc.iceGatheringState == "complete":
-            break
-        await asyncio.sleep(step)
+            done.set()
+
+    pc.on("icegatheringstatechange", _on_gathering_state)
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        print("[webrtc] ICE gathering still", pc.iceGatheringState, "after", timeout, "s")
+    finally:
+        pc.remove_listener("icegatheringstatechange", _on_gathering_state)
+
+def source_key(start: float = 0.0) -> str:
+    """Identify what build_player() would open, so viewers of the same source share it."""
+    key = str(FILE_TO_STREAM) if FILE_TO_STREAM.exists() else "lavfi:testsrc"
+    return f"{key}@{start:g}" if start and FILE_CACHE else key
 
-def build_player() -> MediaPlayer:
+def build_player(start: float = 0.0):
     """
-    Try to open the requested file with ffmpeg.
+    Try to open the requested file (from the file cache, or with ffmpeg).
     If it fails (no video stream or ffmpeg missing), fall back to a test pattern.
+    `start` (seconds, file cache only): begin at the keyframe at or before it.
     """
+    if FILE_CACHE and FILE_TO_STREAM.exists():
+        print(f"[webrtc] streaming from cache: {FILE_TO_STREAM} @ {start:g}s")
+        return CachedPlayer(get_index(FILE_TO_STREAM), start=start)
     if not shutil.which("ffmpeg"):
         print("[webrtc] ffmpeg not found on PATH — MediaPlayer will fail. Install ffmpeg.")
     if FILE_TO_STREAM.exists():
@@ -43,59 +105,218 @@ def build_player() -> MediaPlayer:
     # (Works even if your file path is wrong; ensures pipeline is good.)
     return MediaPlayer("testsrc=size=1280x720:rate=30", format="lavfi")
 
-@csrf_exempt
-async def offer(request):
-    if request.method != "POST":
-        return HttpResponseBadRequest("POST only")
+async def create_session(session_id: str, params: dict) -> dict:
+    """
+    Build, answer and register one viewer's peer connection; returns the answer.
+    Runs in the Django process, or inside a worker process in sharded mode (see workers.py).
+    Raises KeyError/ValueError on a bad request.
+    """
+    client = params.get("client", "")          # set by the offer view: the caller's address
 
+    SESSIONS.admit(client)  # SessionLimit before any work is done
+    pc = RTCPeerConnection()
+    session = SESSIONS.add(session_id, pc, client)
+    session.cleanup += [ENCODERS.release, SOURCES.release]
+    SAMPLER.start()
     try:
-        params = json.loads(request.body)
-        sdp = params["sdp"]; sdp_type = params["type"]
-    except Exception as e:
-        return HttpResponseBadRequest(f"Invalid JSON: {e}")
+        return await negotiate(session, params)
+    except BaseException:
+        # Malformed SDP, bad params, a caller that went away: free the slot now,
+        # not after CONNECT_TIMEOUT.
+        await SESSIONS.close(session_id, "offer failed")
+        raise
 
-    pc = RTCPeerConnection()
-    PCS.add(pc)
+async def negotiate(session, params: dict) -> dict:
+    """Attach media to a freshly added session and answer its offer (see create_session)."""
+    session_id, pc = session.id, session.pc
+    sdp = params["sdp"]; sdp_type = params["type"]
+    height = params.get("height")  # optional: ask for a downscaled broadcast variant
+    height = int(height) if height else None
+    start = float(params.get("start") or 0)  # optional: seconds into the file (file cache)
+    preencoded = None
 
     @pc.on("connectionstatechange")
     async def _on_state_change():
         print("[webrtc] pc state:", pc.connectionState)
-        if pc.connectionState in ("failed", "closed", "disconnected"):
-            await pc.close()
-            PCS.discard(pc)
 
     @pc.on("iceconnectionstatechange")
     async def _on_ice_state():
         print("[webrtc] ice state:", pc.iceConnectionState)
 
-    # Create player (file, or test pattern fallback)
-    player = build_player()
+    loop = asyncio.get_running_loop()
+    # Pre-encoded asset in a codec this viewer offers? (index loaded off the loop, once)
+    asset = await loop.run_in_executor(None, find_asset, FILE_TO_STREAM) if PREENCODED else None
+    mime = pick_codec(sdp, [m for m in BROADCAST_CODECS if asset.pick(m)]) if asset else None
+    audio_mime = "audio/opus" if asset and asset.audio and pick_codec(sdp, ["audio/opus"]) else None
+
+    if mime:
+        rendition = asset.pick(mime, height)
+        preencoded = session.player = PreencodedPlayer(asset, rendition, audio=bool(audio_mime), start=start)
+        video, audio = preencoded.video, preencoded.audio
+        print(f"[webrtc] streaming pre-encoded: {asset.directory.name}/{rendition.name} @ {preencoded.start:g}s")
+    else:
+        audio_mime = None
+        # Build the file index off the event loop the first time (a no-op afterwards)
+        if FILE_CACHE and FILE_TO_STREAM.exists():
+            await loop.run_in_executor(None, get_index, FILE_TO_STREAM)
+
+        # Subscribe to the shared player (file, or test pattern fallback).
+        # The first viewer opens it; later viewers get relay proxies of the same decode.
+        source = SOURCES.acquire(pc, source_key(start), lambda: build_player(start))
+        video, audio = source.subscribe()
+
+        # Broadcast: swap the decoded video for the shared encoder's packets.
+        mime = pick_codec(sdp) if BROADCAST and video else None
+        if mime:
+            video.stop()   # unused relay proxy: otherwise the relay keeps feeding it
+            video = ENCODERS.acquire(pc, source, mime, height)
 
     # Add outbound tracks BEFORE answering (no extra transceivers to avoid m-line mismatch)
     sent_any = False
-    if getattr(player, "video", None):
-        pc.addTrack(player.video)
-        print("[webrtc] added VIDEO track from player")
+    if video:
+        sender = pc.addTrack(metrics.count_frames(video))
+        if mime:
+            # Pin the negotiated codec to the one the shared encoder (or the asset) produces
+            prefer_codec(next(t for t in pc.getTransceivers() if t.sender is sender), mime)
+        print("[webrtc] added VIDEO track", "(pre-encoded)" if preencoded else "from shared source",
+              f"({mime})" if mime else "")
         sent_any = True
     else:
         print("[webrtc] WARNING: player.video is None (no video stream decoded)")
 
-    if getattr(player, "audio", None):
-        pc.addTrack(player.audio)
-        print("[webrtc] added AUDIO track from player")
+    if audio:
+        sender = pc.addTrack(metrics.count_frames(audio))
+        if audio_mime:
+            prefer_codec(next(t for t in pc.getTransceivers() if t.sender is sender), audio_mime)
+        print("[webrtc] added AUDIO track", "(pre-encoded)" if preencoded else "from shared source")
         sent_any = True
     else:
         print("[webrtc] (info) player.audio is None")
 
     if not sent_any:
-        return HttpResponseBadRequest("No media tracks available to send.")
+        await SESSIONS.close(session_id, "no media")
+        raise ValueError("No media tracks available to send.")
 
     # Handshake
     await pc.setRemoteDescription(RTCSessionDescription(sdp=sdp, type=sdp_type))
     answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
 
-    # Wait for OUR ICE candidates before replying (since we don't trickle)
+    if params.get("trickle"):
+        # Trickle: reply now; the client long-polls /session/<id>/candidates for ours.
+        gathering_started = time.perf_counter()
+        start_gathering(session_id, pc, answer).add_done_callback(
+            lambda _: metrics.ICE_GATHERING.observe(time.perf_counter() - gathering_started))
+        return {"sdp": answer.sdp, "type": answer.type, "trickle": True}
+
+    # aiortc gathers inside setLocalDescription(); wait for OUR candidates (non-trickle clients)
+    gathering_started = time.perf_counter()
+    await pc.setLocalDescription(answer)
     await wait_for_ice_gathering_complete(pc)
+    metrics.ICE_GATHERING.observe(time.perf_counter() - gathering_started)
+    return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
+
+async def close_session(session_id: str) -> bool:
+    """Close a session by id and release what it holds."""
+    return await SESSIONS.close(session_id, "client closed")
+
+async def session_candidates(session_id: str, since: int = 0):
+    """Long-poll our ICE candidates for a trickle session, or None if it is unknown/gone."""
+    session = SESSIONS.get(session_id)
+    if session is None:
+        return None
+    return await wait_for_candidates(session_id, session.pc, since)
+
+async def session_stats(session_id: str):
+    """JSON-friendly stats of one session, or None if it is unknown/gone."""
+    session = SESSIONS.get(session_id)
+    if session is None:
+        return None
+    return summarize_stats(session.pc, await session.pc.getStats())
+
+@csrf_exempt
+async def offer(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST only")
+
+    try:
+        params = json.loads(request.body)
+        params["sdp"]; params["type"]
+    except Exception as e:
+        return HttpResponseBadRequest(f"Invalid JSON: {e}")
+
+    session_id = uuid.uuid4().hex
+    received = time.perf_counter()
+    params["client"] = request.META.get("REMOTE_ADDR", "")  # for the per-IP session cap
+    try:
+        # At most OFFER_CONCURRENCY negotiations at once; the rest queue (or get a 503)
+        async with GATE.admit():
+            if WORKERS:
+                # Sharded: a worker process owns the pc; we only proxy the SDP answer back.
+                answer = await (await get_pool(WORKERS)).offer(session_id, params)
+            else:
+                answer = await create_session(session_id, params)
+    except OfferBusy as e:
+        print("[webrtc] offer rejected:", e)
+        metrics.REJECTED["busy"] = metrics.REJECTED.get("busy", 0) + 1
+        response = JsonResponse({"error": f"server busy: {e}"}, status=503)
+        response["Retry-After"] = str(RETRY_AFTER)
+        return response
+    except SessionLimit as e:
+        print("[webrtc] session refused:", e)
+        metrics.REJECTED["session limit"] = metrics.REJECTED.get("session limit", 0) + 1
+        response = JsonResponse({"error": str(e)}, status=503)
+        response["Retry-After"] = str(RETRY_AFTER)
+        return response
+    except (KeyError, ValueError, WorkerError) as e:
+        return HttpResponseBadRequest(str(e))
+
+    metrics.OFFER_ANSWER.observe(time.perf_counter() - received)
+    answer["session"] = session_id
+    return JsonResponse(answer)
+
+@csrf_exempt
+async def session_close(request, session_id):
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST only")
+    if WORKERS:
+        closed = await (await get_pool(WORKERS)).close(session_id)
+    else:
+        closed = await close_session(session_id)
+    return JsonResponse({"session": session_id, "closed": closed})
+
+async def session_candidates_view(request, session_id):
+    try:
+        since = int(request.GET.get("since", 0))
+    except ValueError:
+        return HttpResponseBadRequest("since must be an integer")
+    if WORKERS:
+        result = await (await get_pool(WORKERS)).candidates(session_id, since)
+    else:
+        result = await session_candidates(session_id, since)
+    if result is None:
+        return JsonResponse({"session": session_id, "error": "unknown session"}, status=404)
+    return JsonResponse({"session": session_id, **result})
+
+async def session_stats_view(request, session_id):
+    if WORKERS:
+        stats = await (await get_pool(WORKERS)).stats(session_id)
+    else:
+        stats = await session_stats(session_id)
+    if stats is None:
+        return JsonResponse({"session": session_id, "error": "unknown session"}, status=404)
+    return JsonResponse({"session": session_id, **stats})
+
+async def sessions_view(request):
+    """Session counts of this server (summed over the workers in sharded mode)."""
+    if WORKERS:
+        counts = await (await get_pool(WORKERS)).counts()
+    else:
+        counts = SESSIONS.counts()
+    return JsonResponse(counts)
 
-    return JsonResponse({"sdp": pc.localDescription.sdp, "type": pc.localDescription.type})
+async def metrics_view(request):
+    """Prometheus scrape endpoint: formats cached samples, never calls getStats() itself."""
+    samples = metrics.collect(None if WORKERS else SAMPLER)
+    if WORKERS:
+        samples += await (await get_pool(WORKERS)).metrics()
+    return HttpResponse(metrics.render(samples), content_type="text/plain; version=0.0.4; charset=utf-8")
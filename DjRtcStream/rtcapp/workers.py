@@ -0,0 +1,224 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import threading
+
+from .sessions import SessionLimit
+
+
+class WorkerError(Exception):
+    """A worker process refused or failed a request."""
+
+
+def summarize_stats(pc, report) -> dict:
+    """Reduce an RTCStatsReport to plain JSON numbers (usable across processes)."""
+    out = {"connectionState": pc.connectionState, "outbound": [], "remote": []}
+    for stat in report.values():
+        if stat.type == "outbound-rtp":
+            out["outbound"].append({
+                "kind": stat.kind, "packetsSent": stat.packetsSent, "bytesSent": stat.bytesSent,
+            })
+        elif stat.type == "remote-inbound-rtp":
+            out["remote"].append({
+                "kind": stat.kind, "packetsLost": stat.packetsLost,
+                "fractionLost": stat.fractionLost, "roundTripTime": stat.roundTripTime,
+            })
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Inside a worker process
+# ---------------------------------------------------------------------------
+
+def worker_main(index: int, ready, ended):
+    """Entry point of one worker process: its own event loop, its own SESSIONS/SOURCES/ENCODERS."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "DjRtcStream.settings")
+    asyncio.run(_serve(index, ready, ended))
+
+
+async def _serve(index: int, ready, ended):
+    from . import metrics, views  # this process's own copy of the session state
+
+    # Sessions also end here on their own (peer left, reaper): tell the Django process,
+    # so its session -> worker map (and the load it picks workers by) stays true.
+    views.SESSIONS.on_close.append(lambda session: ended.put(session.id))
+
+    async def handle(reader, writer):
+        # One JSON request line -> one JSON reply line.
+        try:
+            req = json.loads(await reader.readline())
+            op, session_id = req["op"], req["session"]
+            if op == "offer":
+                reply = await views.create_session(session_id, req["params"])
+            elif op == "close":
+                reply = {"closed": await views.close_session(session_id)}
+            elif op == "candidates":
+                reply = {"result": await views.session_candidates(session_id, req.get("since", 0))}
+            elif op == "stats":
+                reply = {"stats": await views.session_stats(session_id)}
+            elif op == "counts":
+                reply = {"counts": views.SESSIONS.counts()}
+            elif op == "metrics":
+                reply = {"samples": metrics.collect(views.SAMPLER)}
+            else:
+                reply = {"error": f"unknown op {op!r}"}
+        except SessionLimit as e:
+            reply = {"error": str(e), "limit": True}
+        except Exception as e:
+            reply = {"error": str(e)}
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    ready.put((index, server.sockets[0].getsockname()[1]))
+    print(f"[webrtc] worker {index} (pid {os.getpid()}) ready")
+    async with server:
+        await server.serve_forever()
+
+
+# ---------------------------------------------------------------------------
+# Inside the Django process
+# ---------------------------------------------------------------------------
+
+class WorkerPool:
+    """
+    N worker processes, each listening on a localhost port for JSON-line requests.
+    Keeps session id -> worker index so close/stats reach the process that owns the pc;
+    workers report every session that ends, so the map only holds live sessions.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.procs = []
+        self.ports = [None] * size
+        self.sessions = {}  # session id -> worker index
+
+    async def start(self, timeout: float = 30.0):
+        ctx = multiprocessing.get_context("spawn")  # fresh interpreter: no inherited event loop
+        ready, ended = ctx.Queue(), ctx.Queue()
+        self.procs = [
+            ctx.Process(target=worker_main, args=(i, ready, ended), daemon=True, name=f"rtc-worker-{i}")
+            for i in range(self.size)
+        ]
+        for proc in self.procs:
+            proc.start()
+        loop = asyncio.get_running_loop()
+        for _ in range(self.size):
+            # Blocking queue read off the loop: workers need a moment to import aiortc.
+            try:
+                index, port = await loop.run_in_executor(None, ready.get, True, timeout)
+            except queue.Empty:
+                missing = [self._describe(i) for i, port in enumerate(self.ports) if port is None]
+                raise WorkerError(f"no ready signal within {timeout:g}s from {', '.join(missing)}") from None
+            self.ports[index] = port
+        threading.Thread(target=self._watch_ended, args=(ended, loop), daemon=True,
+                         name="rtc-worker-ended").start()
+
+    def _describe(self, index: int) -> str:
+        proc = self.procs[index]
+        return f"{proc.name} ({'still starting' if proc.is_alive() else f'exit code {proc.exitcode}'})"
+
+    def _watch_ended(self, ended, loop):
+        """Thread: forget sessions the workers closed themselves (blocking reads, off the loop)."""
+        while True:
+            session_id = ended.get()
+            loop.call_soon_threadsafe(self.sessions.pop, session_id, None)
+
+    def pick(self) -> int:
+        """Least-loaded worker by its live sessions."""
+        load = [0] * len(self.ports)
+        for index in self.sessions.values():
+            load[index] += 1
+        return load.index(min(load))
+
+    async def _call(self, index: int, request: dict) -> dict:
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.ports[index])
+        try:
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            reply = json.loads(await reader.readline())
+        finally:
+            writer.close()
+        if reply.get("limit"):
+            raise SessionLimit(reply["error"])
+        if "error" in reply:
+            raise WorkerError(reply["error"])
+        return reply
+
+    async def offer(self, session_id: str, params: dict) -> dict:
+        index = self.pick()
+        self.sessions[session_id] = index
+        try:
+            return await self._call(index, {"op": "offer", "session": session_id, "params": params})
+        except Exception:
+            self.sessions.pop(session_id, None)
+            raise
+
+    async def close(self, session_id: str) -> bool:
+        index = self.sessions.pop(session_id, None)
+        if index is None:
+            return False
+        reply = await self._call(index, {"op": "close", "session": session_id})
+        return reply["closed"]
+
+    async def candidates(self, session_id: str, since: int = 0):
+        index = self.sessions.get(session_id)
+        if index is None:
+            return None
+        request = {"op": "candidates", "session": session_id, "since": since}
+        return (await self._call(index, request))["result"]
+
+    async def stats(self, session_id: str):
+        index = self.sessions.get(session_id)
+        if index is None:
+            return None
+        stats = (await self._call(index, {"op": "stats", "session": session_id}))["stats"]
+        if stats is None:
+            # The worker already tore it down (peer left); forget the mapping.
+            self.sessions.pop(session_id, None)
+        return stats
+
+    async def counts(self) -> dict:
+        """SessionManager.counts() of every worker, summed."""
+        total = {"sessions": 0, "connected": 0, "connecting": 0, "clients": 0, "max_sessions": 0, "closed": {}}
+        replies = await asyncio.gather(*[
+            self._call(i, {"op": "counts", "session": None}) for i in range(len(self.ports))
+        ])
+        for reply in replies:
+            for key, value in reply["counts"].items():
+                if key == "closed":
+                    for reason, n in value.items():
+                        total["closed"][reason] = total["closed"].get(reason, 0) + n
+                else:
+                    total[key] += value
+        total["workers"] = len(replies)
+        return total
+
+    async def metrics(self) -> list:
+        """metrics.collect() of every worker, each sample labelled with its worker."""
+        replies = await asyncio.gather(*[
+            self._call(i, {"op": "metrics", "session": None}) for i in range(len(self.ports))
+        ])
+        return [
+            [name, dict(labels, worker=str(i)), value]
+            for i, reply in enumerate(replies) for name, labels, value in reply["samples"]
+        ]
+
+
+POOL = None
+_POOL_LOCK = None
+
+async def get_pool(size: int) -> WorkerPool:
+    """Start the worker pool on first use (inside the Django process only)."""
+    global POOL, _POOL_LOCK
+    if _POOL_LOCK is None:
+        _POOL_LOCK = asyncio.Lock()
+    async with _POOL_LOCK:
+        if POOL is None:
+            pool = WorkerPool(size)
+            await pool.start()
+            POOL = pool
+    return POOL
@@ -17,91 +17,79 @@
 #   pip install aiortc opencv-python av
 
 import asyncio
-import cv2
 from aiortc import RTCPeerConnection, RTCSessionDescription   # WebRTC peer + SDP container
 from aiortc.contrib.signaling import TcpSocketSignaling      # TCP-based signaling helper
+from relay_signaling import RelaySignaling                   # room-scoped signaling through server.py
 from av import VideoFrame                                    # aiortc/PyAV video frame wrapper
+from render import Renderer                                  # render thread + latest-frame mailbox
+from recorder import Recorder                                # headless: tracks -> rolling files
 
 # --- Signaling relay address: must match your server.py and sender ---
 HOST, PORT = "127.0.0.1", 10001
 
+# --- Optional: signal through server.py in a ROOM (only peers in that room see our answer) ---
+ROOM = None  # e.g. "movie1"; must match the sender's ROOM
+RELAY_PORT = 10000
+
 # --- Max display size for the preview window (in pixels) ---
 # Choose something that fits your laptop screen; aspect ratio is preserved.
 MAX_DISPLAY_WIDTH  = 960
 MAX_DISPLAY_HEIGHT = 540
 
+# --- Optional: record instead of display (headless archive, see recorder.py) ---
+RECORD_DIR = None      # e.g. "recordings": every track -> rolling segments, no window
+RECORD_FORMAT = "mkv"  # "mkv" / "webm" / "mp4"
+
 
 async def display_frames(track):
     """
-    Pull frames from an incoming WebRTC video track and display them.
-    We scale frames down to fit within MAX_DISPLAY_WIDTH x MAX_DISPLAY_HEIGHT,
+    Pull frames from an incoming WebRTC video track and hand them to a render thread
+    (render.py). It scales them down to fit within MAX_DISPLAY_WIDTH x MAX_DISPLAY_HEIGHT,
     preserving aspect ratio and avoiding upscaling for better quality.
     Press 'q' in the window to quit.
     """
     print("display_frames started")
 
-    # Make the window resizable and set an initial window size (optional).
-    # This affects only the OS window; we still resize the image for quality.
-    window_title = "Receiver (press q)"
-    cv2.namedWindow(window_title, cv2.WINDOW_NORMAL)
-    cv2.resizeWindow(window_title, MAX_DISPLAY_WIDTH, MAX_DISPLAY_HEIGHT)
+    # The window (resizable, initial size MAX_DISPLAY_*) lives on the render thread.
+    # Scaling is done in the same pass as YUV -> BGR: frame.reformat(w, h, "bgr24").
+    renderer = Renderer("Receiver (press q)", MAX_DISPLAY_WIDTH, MAX_DISPLAY_HEIGHT).start()
 
-    while True:
+    while not renderer.closed:
         try:
             # Await the next frame from the WebRTC pipeline.
             frame = await track.recv()
 
-            # Convert PyAV VideoFrame -> NumPy BGR (what OpenCV expects).
+            # Newest frame wins: if the display is behind, the frame it hasn't shown is dropped.
             if isinstance(frame, VideoFrame):
-                img = frame.to_ndarray(format="bgr24")
-
-                # Current frame size.
-                h, w = img.shape[:2]
-
-                # Compute a scale factor that fits within our max display size.
-                # min(..., 1.0) ensures we never UPSCALE (keeps things crisp).
-                scale = min(
-                    MAX_DISPLAY_WIDTH  / w,
-                    MAX_DISPLAY_HEIGHT / h,
-                    1.0
-                )
-
-                # If the frame is bigger than the window, downscale it.
-                if scale < 1.0:
-                    new_w = int(w * scale)
-                    new_h = int(h * scale)
-                    # INTER_AREA is recommended for downscaling.
-                    img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-
-                # Show the (possibly resized) frame.
-                cv2.imshow(window_title, img)
-
-                # Exit cleanly when user presses 'q'.
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    print("q pressed")
-                    break
+                renderer.offer(frame)
 
         except Exception as e:
             # Any exception (e.g., connection closed) -> stop displaying.
             print("display_frames error:", e)
             break
 
-    # Close the OpenCV window(s) when leaving the loop.
-    cv2.destroyAllWindows()
+    # Stop the render thread (closes the window, prints rendered / dropped counts).
+    renderer.stop()
 
 
 async def main():
     # 1) Create the signaling helper that talks to your TCP relay.
-    signaling = TcpSocketSignaling(HOST, PORT)
+    signaling = RelaySignaling(HOST, RELAY_PORT, ROOM, "receiver") if ROOM else TcpSocketSignaling(HOST, PORT)
 
     # 2) Create the WebRTC peer connection (the "receiver" peer).
     pc = RTCPeerConnection()
 
+    # Optional recorder: compressed packets go to disk as they arrive (no decode when possible).
+    recorder = Recorder(RECORD_DIR, RECORD_FORMAT) if RECORD_DIR else None
+
     # 3) When a media track arrives from the sender, start reading frames.
     @pc.on("track")
     def on_track(track):
         print("Track received:", track.kind)
-        if track.kind == "video":
+        if recorder:
+            # Archive every track (video AND audio) instead of showing it.
+            recorder.add(pc, track, "receiver")
+        elif track.kind == "video":
             # Start the frame-reading task (async loop).
             asyncio.create_task(display_frames(track))
 
@@ -130,6 +118,8 @@ async def main():
     finally:
         # 8) Clean up the WebRTC peer when done.
         await pc.close()
+        if recorder:
+            await recorder.close()   # finish + fsync the open segments
         print("Receiver closed")
 
 
@@ -0,0 +1,104 @@
+# render.py — show frames on a render thread, never on the asyncio loop
+#
+# to_ndarray / resize / imshow / waitKey can take tens of ms. Done inline in the
+# receiver's async loop, that time is stolen from aiortc's jitter buffer and RTCP.
+# Here the loop only drops the newest frame into a ONE-SLOT mailbox; the render
+# thread shows whatever is newest when it gets there. Frames it never got to are
+# counted as dropped, so a slow display costs frames, not latency.
+#
+# Downscaling happens inside the YUV -> BGR conversion itself:
+#   frame.reformat(width, height, format="bgr24")   (one swscale pass, no cv2.resize)
+#
+# (OpenCV windows off the main thread work on Windows and Linux; macOS wants the
+#  main thread for GUI calls.)
+#
+#   renderer = Renderer("Receiver (press q)", 960, 540); renderer.start()
+#   renderer.offer(frame)          # from the asyncio loop, never blocks
+#   renderer.closed                # True once 'q' was pressed
+#   on_render=callback             # optional: called with each frame right after it is shown
+#   renderer.stop()                # prints rendered / dropped
+
+import threading
+import time
+
+import cv2
+
+REPORT_EVERY = 5.0     # seconds between "rendered / dropped" lines (0 = only at the end)
+
+
+class Renderer:
+    def __init__(self, title, max_width=None, max_height=None, on_render=None):
+        self.title = title
+        self.on_render = on_render  # e.g. latency.ReceiverTracer.rendered (runs on this thread)
+        self.max_width = max_width
+        self.max_height = max_height
+        self.cond = threading.Condition()
+        self.slot = None            # newest frame not rendered yet
+        self.rendered = 0
+        self.dropped = 0
+        self.closed = False         # set when the user presses 'q' (or after stop())
+        self.thread = threading.Thread(target=self._loop, name=f"render-{title}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def offer(self, frame):
+        """Hand over the newest frame; a frame still waiting in the slot is dropped."""
+        with self.cond:
+            if self.slot is not None:
+                self.dropped += 1
+            self.slot = frame
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        print(f"[render] {self.title}: {self.rendered} rendered, {self.dropped} dropped")
+
+    def size_for(self, width, height):
+        """Fit within max_width x max_height, keep the aspect ratio, never upscale."""
+        scale = 1.0
+        if self.max_width:
+            scale = min(scale, self.max_width / width)
+        if self.max_height:
+            scale = min(scale, self.max_height / height)
+        if scale >= 1.0:
+            return width, height
+        return max(2, int(width * scale) & ~1), max(2, int(height * scale) & ~1)
+
+    def _loop(self):
+        if self.max_width and self.max_height:
+            cv2.namedWindow(self.title, cv2.WINDOW_NORMAL)
+            cv2.resizeWindow(self.title, self.max_width, self.max_height)
+        last_report = time.monotonic()
+        try:
+            while True:
+                with self.cond:
+                    while self.slot is None and not self.closed:
+                        self.cond.wait(timeout=0.1)
+                    if self.closed:
+                        break
+                    frame, self.slot = self.slot, None
+
+                width, height = self.size_for(frame.width, frame.height)
+                # Scale + convert in one pass (straight from the decoder's yuv420p)
+                img = frame.reformat(width=width, height=height, format="bgr24").to_ndarray()
+                cv2.imshow(self.title, img)
+                self.rendered += 1
+                if self.on_render:
+                    self.on_render(frame)
+
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    print("q pressed")
+                    self.closed = True
+                    break
+
+                if REPORT_EVERY and time.monotonic() - last_report >= REPORT_EVERY:
+                    last_report = time.monotonic()
+                    print(f"[render] {self.title}: {self.rendered} rendered, {self.dropped} dropped")
+        finally:
+            cv2.destroyAllWindows()
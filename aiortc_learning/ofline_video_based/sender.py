@@ -2,25 +2,40 @@
 import asyncio
 from aiortc import RTCPeerConnection, RTCSessionDescription
 from aiortc.contrib.signaling import TcpSocketSignaling
+from relay_signaling import RelaySignaling
 from aiortc.contrib.media import MediaPlayer
+from adaptive import AdaptiveController, AdaptiveVideoTrack
+from filecache import CachedPlayer, get_index
 
 HOST, PORT = "127.0.0.1", 10001
+ROOM = None  # e.g. "movie1": signal through server.py rooms (RELAY_PORT) instead of direct TCP
+RELAY_PORT = 10000
 VIDEO_PATH = "sample.mp4"
+FILE_CACHE = True  # play from a one-time demux index of VIDEO_PATH (filecache.py) instead of ffmpeg reopening it
+START = 0.0        # seconds into the file (FILE_CACHE): starts at the keyframe at or before it
+ADAPTIVE = True  # scale bitrate/resolution/fps to the receiver's RTCP feedback (adaptive.py)
 
 async def main():
-    signaling = TcpSocketSignaling(HOST, PORT)
+    signaling = RelaySignaling(HOST, RELAY_PORT, ROOM, "sender") if ROOM else TcpSocketSignaling(HOST, PORT)
     pc = RTCPeerConnection()
 
-    # Create the MediaPlayer. Some aiortc versions don't support "loop".
-    # We try with loop=True, and if that arg isn't supported, we retry without it.
-    try:
-        player = MediaPlayer(VIDEO_PATH, loop=True)   # modern aiortc
-    except TypeError:
-        player = MediaPlayer(VIDEO_PATH)              # older aiortc (no loop)
+    # Create the player. With FILE_CACHE the file is indexed once (mmap + packet table)
+    # and looped from memory; otherwise MediaPlayer. Some aiortc versions don't support
+    # "loop": we try with loop=True, and if that arg isn't supported, we retry without it.
+    if FILE_CACHE:
+        player = CachedPlayer(get_index(VIDEO_PATH), start=START, loop=True)
+    else:
+        try:
+            player = MediaPlayer(VIDEO_PATH, loop=True)   # modern aiortc
+        except TypeError:
+            player = MediaPlayer(VIDEO_PATH)              # older aiortc (no loop)
 
     # Add video track if present
-    if player.video:
-        pc.addTrack(player.video)
+    video, video_sender, controller = player.video, None, None
+    if video:
+        if ADAPTIVE:
+            video = AdaptiveVideoTrack(video)
+        video_sender = pc.addTrack(video)
         print("Added video track from file")
 
     # Add audio track if present
@@ -45,6 +60,9 @@ async def main():
         if isinstance(obj, RTCSessionDescription):
             await pc.setRemoteDescription(obj)
             print("Answer received; streaming file…")
+            if ADAPTIVE and video_sender:
+                controller = AdaptiveController(video_sender, video, "file")
+                controller.start()
             break
         if obj is None:
             print("Signaling ended.")
@@ -55,6 +73,8 @@ async def main():
         while pc.connectionState not in ("failed", "closed"):
             await asyncio.sleep(0.5)
     finally:
+        if controller:
+            controller.stop()
         await pc.close()
         print("Sender closed")
 
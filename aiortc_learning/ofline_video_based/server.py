@@ -1,29 +1,298 @@
 import asyncio
+import zlib
+
+try:
+    import zstandard   # optional: better ratio than zlib on SDP
+except ImportError:
+    zstandard = None
+
+# Each client gets its own bounded outbound queue + writer task, so one slow
+# peer never stalls delivery to the others (or the sender's read loop).
+QUEUE_SIZE = 64          # messages a client may fall behind
+POLICY = "disconnect"    # when the queue is full: "disconnect" the laggard, or "drop" its oldest message
+
+# Framing v1 (default, what every existing client speaks):
+#   2-byte big-endian length + payload   -> one payload of at most 65,535 bytes.
+#
+# Framing v2 (opt-in): the client's FIRST bytes on the connection are V2_MAGIC, then every frame is
+#   varint length | flags(1) | body
+#   flags FLAG_BATCH: body = several (varint length + payload) back to back
+#   flags FLAG_ZLIB / FLAG_ZSTD: body is compressed (applied after batching)
+# A v1 client's first length can be 0x524C ("RL", 21,068 bytes): if the next two bytes are not
+# "Y2" they are read as the start of that v1 payload. Only a 21,068-byte first v1 payload that
+# itself starts with "Y2" is mistaken for the magic.
+# Both kinds of client share rooms; the relay re-frames every payload for each receiver.
+#
+# Payloads (same in v1 and v2):
+# - Plain payload (e.g. JSON SDP): broadcast to every other client that never joined a room
+#   (the original behaviour).
+# - Routed payload: starts with ROUTED (0x00), then
+#       op(1) | room_len(1) | room | peer_len(1) | peer | body
+#   op JOIN:  join `room` under id `peer`
+#   op LEAVE: leave the current room
+#   op MSG:   deliver `body` to `peer` in my room ("" = everyone else in my room);
+#             the relay rewrites `peer` to the SENDER's id before forwarding.
+#   op SUBSCRIBE / UNSUBSCRIBE: ask `peer` in my room (e.g. the SFU, sfu.py) to start /
+#             stop sending me media; routed exactly like MSG.
+#   op ERROR: relay -> client, body is a short reason.
+#   Relay -> client, JOIN / LEAVE with `peer` = someone who joined / left my room
+#   (on joining, I get a JOIN for every peer already there). Clients may ignore them.
+ROUTED = 0x00
+JOIN, LEAVE, MSG, ERROR = b"J"[0], b"L"[0], b"M"[0], b"E"[0]
+SUBSCRIBE, UNSUBSCRIBE = b"S"[0], b"U"[0]
+
+V2_MAGIC = b"RLY2"
+FLAG_ZLIB, FLAG_BATCH, FLAG_ZSTD = 0x01, 0x02, 0x04
+COMPRESS_MIN = 512               # don't bother compressing tiny frames
+MAX_FRAME = 16 * 1024 * 1024     # v2 upper bound (compressed and decompressed)
+V1_MAX = 0xFFFF
+
+
+def pack_routed(op, room=b"", peer=b"", body=b""):
+    """Build a routed payload (no length prefix; see frame_v1 / frame_v2)."""
+    return bytes([ROUTED, op, len(room)]) + room + bytes([len(peer)]) + peer + body
+
+
+def unpack_routed(payload):
+    """payload (without length prefix) -> (op, room, peer, body)."""
+    op, room_len = payload[1], payload[2]
+    room = payload[3:3 + room_len]
+    pos = 3 + room_len
+    peer_len = payload[pos]
+    peer = payload[pos + 1:pos + 1 + peer_len]
+    return op, room, peer, payload[pos + 1 + peer_len:]
+
+
+def encode_varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(buf, pos=0):
+    """-> (value, new position)"""
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+async def read_varint(reader):
+    value = shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+        shift += 7
+        if shift > 35:
+            raise ValueError("varint too long")
+
+
+def frame_v1(payloads):
+    """Old clients: one 2-byte-length frame per payload (payloads that don't fit are skipped)."""
+    out = []
+    for p in payloads:
+        if len(p) > V1_MAX:
+            print(f"relay: {len(p)} B message too big for a v1 client, skipped")
+            continue
+        out.append(len(p).to_bytes(2, "big") + p)
+    return b"".join(out)
+
+
+def frame_v2(payloads, compress=True):
+    """New clients: ONE frame for the whole burst, compressed when it pays off."""
+    flags = 0
+    if len(payloads) == 1:
+        body = payloads[0]
+    else:
+        flags |= FLAG_BATCH
+        body = b"".join(encode_varint(len(p)) + p for p in payloads)
+    if compress and len(body) >= COMPRESS_MIN:
+        if zstandard is not None:
+            packed, flag = zstandard.ZstdCompressor(level=3).compress(body), FLAG_ZSTD
+        else:
+            packed, flag = zlib.compress(body, 6), FLAG_ZLIB
+        if len(packed) < len(body):
+            body, flags = packed, flags | flag
+    frame = bytes([flags]) + body
+    return encode_varint(len(frame)) + frame
+
+
+def unframe_v2(frame):
+    """flags + body (one v2 frame, length already stripped) -> list of payloads."""
+    flags, body = frame[0], frame[1:]
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd frame but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body, max_output_size=MAX_FRAME)
+    elif flags & FLAG_ZLIB:
+        d = zlib.decompressobj()
+        body = d.decompress(body, MAX_FRAME)
+        if d.unconsumed_tail:
+            raise ValueError("frame inflates beyond MAX_FRAME")
+    if not flags & FLAG_BATCH:
+        return [body]
+    payloads, pos = [], 0
+    while pos < len(body):
+        size, pos = decode_varint(body, pos)
+        payloads.append(body[pos:pos + size])
+        pos += size
+    return payloads
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.version = 1
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.dropped = 0
+        self.room = None     # room name (bytes) once joined
+        self.peer = None     # our id inside that room
+        self.task = asyncio.create_task(self.write_loop())
+
+    def send(self, payload):
+        """Queue one payload (framed later, per our version); never blocks the caller."""
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            if POLICY == "drop":
+                self.queue.get_nowait()
+                self.queue.put_nowait(payload)
+                self.dropped += 1
+            else:
+                print("relay: client too slow, disconnecting")
+                self.close()
+
+    async def write_loop(self):
+        try:
+            while True:
+                payloads = [await self.queue.get()]
+                while not self.queue.empty():      # batch whatever piled up: one drain per burst
+                    payloads.append(self.queue.get_nowait())
+                self.writer.write(frame_v2(payloads) if self.version == 2 else frame_v1(payloads))
+                await self.writer.drain()
+        except Exception:
+            pass
+        finally:
+            self.close()
+
+    def join(self, room, peer):
+        members = handle.rooms.setdefault(room, {})
+        if peer in members and members[peer] is not self:
+            self.send(pack_routed(ERROR, room, peer, b"peer id taken"))
+            return
+        self.leave()
+        members = handle.rooms.setdefault(room, {})   # leave() may have dropped it if now empty
+        for other in list(members):
+            members[other].send(pack_routed(JOIN, room, peer))
+            self.send(pack_routed(JOIN, room, other))
+        members[peer] = self
+        self.room, self.peer = room, peer
+
+    def leave(self):
+        if self.room is None:
+            return
+        members = handle.rooms.get(self.room, {})
+        if members.get(self.peer) is self:
+            del members[self.peer]
+            for c in list(members.values()):
+                c.send(pack_routed(LEAVE, self.room, self.peer))
+        if not members:
+            handle.rooms.pop(self.room, None)
+        self.room = self.peer = None
+
+    def close(self):
+        self.leave()
+        handle.clients.discard(self)
+        self.writer.close()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
+
+def route(me, payload):
+    """Handle one routed payload from `me`: O(1) for a direct message, O(room) for a room broadcast."""
+    op, room, peer, body = unpack_routed(payload)
+    if op == JOIN:
+        me.join(room, peer)
+    elif op == LEAVE:
+        me.leave()
+    elif op in (MSG, SUBSCRIBE, UNSUBSCRIBE):
+        if me.room is None:
+            me.send(pack_routed(ERROR, body=b"join a room first"))
+            return
+        members = handle.rooms.get(me.room, {})
+        out = pack_routed(op, me.room, me.peer, body)
+        if peer:
+            target = members.get(peer)
+            if target is None:
+                me.send(pack_routed(ERROR, me.room, peer, b"no such peer"))
+            else:
+                target.send(out)
+        else:
+            for c in list(members.values()):
+                if c is not me:
+                    c.send(out)
+
+
+def dispatch(me, payload):
+    if payload[:1] == bytes([ROUTED]):
+        route(me, payload)
+        return
+    # Legacy broadcast: only to clients that are not in a room
+    for c in list(handle.clients):
+        if c is not me and c.room is None:
+            c.send(payload)
+
+
 async def handle(reader, writer):
+    me = Client(writer)
+    handle.clients.add(me)
     try:
+        head = await reader.readexactly(2)
+        start = b""    # bytes of the first v1 payload already read while looking for the magic
+        if head == V2_MAGIC[:2]:
+            start = await reader.readexactly(2)
+            if start == V2_MAGIC[2:]:
+                me.version = 2
+                head, start = None, b""
+            # else: a v1 client whose first payload is 0x524C bytes long; start is part of it
         while True:
-            size_bytes = await reader.readexactly(2)
-            size = int.from_bytes(size_bytes, "big")
-            data = await reader.readexactly(size)
-            for t in list(asyncio.all_tasks()):
-                pass
-            for w in list(handle.clients):
-                if w is not writer:
-                    w.write(size_bytes + data); await w.drain()
+            if me.version == 2:
+                size = await read_varint(reader)
+                if not 0 < size <= MAX_FRAME:
+                    break
+                payloads = unframe_v2(await reader.readexactly(size))
+            else:
+                size_bytes = head or await reader.readexactly(2)
+                head = None
+                size = int.from_bytes(size_bytes, "big")
+                payloads = [start + await reader.readexactly(size - len(start))]
+                start = b""
+            for payload in payloads:
+                if payload:
+                    dispatch(me, payload)
     except Exception:
         pass
     finally:
-        handle.clients.discard(writer)
-        writer.close(); 
+        me.close()
         try: await writer.wait_closed()
         except: pass
 handle.clients = set()
+handle.rooms = {}   # room -> {peer id -> Client}
 
 async def main(host="127.0.0.1", port=10000):
-    server = await asyncio.start_server(
-        lambda r,w: (handle.clients.add(w), asyncio.create_task(handle(r,w)))[1],
-        host, port
-    )
+    server = await asyncio.start_server(handle, host, port)
     print(f"Signaling relay listening on ({host}, {port})")
     async with server:
         await server.serve_forever()
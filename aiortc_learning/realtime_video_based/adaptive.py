@@ -0,0 +1,186 @@
+# adaptive.py — scale bitrate, resolution and frame rate to what the receiver can take
+#
+# Without this, the sender always encodes the full source resolution and frame rate,
+# and on a congested link the receiver just sees frozen frames and growing delay.
+#
+# Two pieces:
+# - AdaptiveVideoTrack wraps any video track (CameraTrack, MediaPlayer's video) and
+#   downscales / drops frames according to its current `scale` and `fps`.
+# - AdaptiveController watches the RTCP feedback the receiver sends for that track:
+#     * receiver-report loss (packetsLost / packetsReceived deltas from getStats())
+#     * round-trip time (also from the receiver reports)
+#     * REMB, the receiver's estimated maximum bitrate
+#   and every INTERVAL seconds decides a target bitrate, then picks the LADDER rung
+#   (scale, fps) that fits it. The decision is in `controller.decision` and printed
+#   as "[adapt] ..." whenever it changes.
+#   (aiortc does not negotiate transport-cc, so REMB + loss is all the feedback there is.)
+#
+#   track = AdaptiveVideoTrack(CameraTrack(0))
+#   sender = pc.addTrack(track)
+#   ...after the answer is set:
+#   controller = AdaptiveController(sender, track, "camera"); controller.start()
+
+import asyncio
+import time
+
+from aiortc.mediastreams import MediaStreamTrack
+from aiortc.rtp import RTCP_PSFB_APP, RtcpPsfbPacket, unpack_remb_fci
+
+INTERVAL = 1.0                 # seconds between decisions
+MIN_BITRATE = 150_000
+MAX_BITRATE = 2_500_000
+START_BITRATE = 1_000_000
+
+LOSS_HIGH = 0.10               # above: back off (bitrate *= 1 - loss / 2)
+LOSS_LOW = 0.02                # below: probe up (bitrate *= INCREASE)
+INCREASE = 1.08
+RTT_HIGH = 0.4                 # seconds; above this, treat the link as congested too
+UP_HOLD = 3                    # decisions in a row that must allow a higher rung before we climb
+
+# (minimum bitrate, resolution scale, max fps or None = source rate), best rung first
+LADDER = [
+    (1_000_000, 1.0, None),
+    (600_000, 0.75, None),
+    (350_000, 0.5, 24),
+    (0, 0.25, 15),
+]
+
+
+class AdaptiveVideoTrack(MediaStreamTrack):
+    kind = "video"
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        self.scale = 1.0       # set by AdaptiveController
+        self.fps = None
+        self._last_time = None
+
+    async def recv(self):
+        while True:
+            frame = await self.source.recv()
+            if self.fps and frame.pts is not None and frame.time_base is not None:
+                t = float(frame.pts * frame.time_base)
+                last = self._last_time
+                if last is not None and last <= t < last + 1 / self.fps - 0.002:
+                    continue   # too soon for the target frame rate: drop it
+                self._last_time = t
+            if self.scale < 1.0:
+                # even sizes for yuv420p; the encoder restarts itself at the new size
+                width = max(2, int(frame.width * self.scale) & ~1)
+                height = max(2, int(frame.height * self.scale) & ~1)
+                small = frame.reformat(width=width, height=height, format="yuv420p")
+                # keep the capture time too (latency.SenderTracer reads it); older PyAV drops it on reformat
+                small.pts, small.time_base, small.opaque = frame.pts, frame.time_base, frame.opaque
+                frame = small
+            return frame
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
+
+
+class AdaptiveController:
+    def __init__(self, sender, track, label="video", ladder=LADDER):
+        self.sender = sender
+        self.track = track
+        self.label = label
+        self.ladder = ladder       # e.g. simulcast.LAYER_LADDER to pick simulcast layers
+        self.bitrate = START_BITRATE
+        self.remb = None           # last REMB from the receiver (bps)
+        self.rung = 0
+        self.up_votes = 0
+        self.decision = {}
+        self._last_lost = self._last_received = None
+        self._task = None
+
+    def start(self):
+        self._hook_rtcp()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _hook_rtcp(self):
+        # aiortc applies REMB to its encoder internally and keeps no copy of it;
+        # wrap the sender's RTCP handler to see it (and re-apply our own cap after it).
+        original = self.sender._handle_rtcp_packet
+
+        async def handle(packet):
+            await original(packet)
+            if isinstance(packet, RtcpPsfbPacket) and packet.fmt == RTCP_PSFB_APP:
+                try:
+                    bitrate, ssrcs = unpack_remb_fci(packet.fci)
+                except ValueError:
+                    return
+                if self.sender._ssrc in ssrcs:
+                    self.remb = bitrate
+                    self._apply_bitrate()
+
+        self.sender._handle_rtcp_packet = handle
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(INTERVAL)
+            loss, rtt = None, None
+            for s in (await self.sender.getStats()).values():
+                if s.type == "remote-inbound-rtp":
+                    rtt = s.roundTripTime
+                    if self._last_lost is not None:
+                        lost = s.packetsLost - self._last_lost
+                        received = s.packetsReceived - self._last_received
+                        if lost + received > 0:
+                            loss = max(0, lost) / (lost + received)
+                    self._last_lost, self._last_received = s.packetsLost, s.packetsReceived
+            self.update(loss, rtt)
+
+    def update(self, loss, rtt):
+        """One decision from this interval's feedback (loss fraction / RTT seconds, None = no report)."""
+        if loss is not None and loss > LOSS_HIGH:
+            self.bitrate *= 1 - loss / 2
+            reason = f"loss {loss:.0%}"
+        elif rtt is not None and rtt > RTT_HIGH:
+            self.bitrate *= 0.85
+            reason = f"rtt {rtt * 1000:.0f} ms"
+        elif loss is not None and loss < LOSS_LOW:
+            self.bitrate *= INCREASE
+            reason = "probe"
+        else:
+            reason = "hold"
+        if self.remb is not None:
+            self.bitrate = min(self.bitrate, self.remb)
+        self.bitrate = int(max(MIN_BITRATE, min(self.bitrate, MAX_BITRATE)))
+
+        wanted = next(i for i, (floor, _, _) in enumerate(self.ladder) if self.bitrate >= floor)
+        if wanted > self.rung:
+            self.rung, self.up_votes = wanted, 0        # step down right away
+        elif wanted < self.rung:
+            self.up_votes += 1                          # step up only after UP_HOLD good intervals
+            if self.up_votes >= UP_HOLD:
+                self.rung, self.up_votes = self.rung - 1, 0
+        else:
+            self.up_votes = 0
+
+        _, self.track.scale, self.track.fps = self.ladder[self.rung]
+        self._apply_bitrate()
+
+        decision = {
+            "bitrate": self.bitrate, "scale": self.track.scale, "fps": self.track.fps,
+            "rung": self.rung, "remb": self.remb, "loss": loss, "rtt": rtt,
+        }
+        changed = (decision["rung"], decision["bitrate"] // 50_000) != (
+            self.decision.get("rung"), self.decision.get("bitrate", 0) // 50_000)
+        self.decision = dict(decision, reason=reason, time=time.time())
+        if changed:
+            print(f"[adapt] {self.label}: {self.bitrate / 1000:.0f} kbps, scale {self.track.scale}, "
+                  f"fps {self.track.fps or 'source'} ({reason})")
+        return self.decision
+
+    def _apply_bitrate(self):
+        # The encoder is created lazily on the first frame and has no public handle;
+        # aiortc itself clamps target_bitrate to the codec's own min/max.
+        encoder = getattr(self.sender, "_RTCRtpSender__encoder", None)
+        if encoder is not None and hasattr(encoder, "target_bitrate"):
+            target = self.bitrate if self.remb is None else min(self.bitrate, self.remb)
+            encoder.target_bitrate = target
@@ -0,0 +1,113 @@
+# bench_capture.py — µs and allocations per frame for CameraTrack's capture path
+#
+# WHAT THIS DOES
+# - Feeds CameraTrack from a fake camera (no webcam needed) that behaves like
+#   cv2.VideoCapture.read(): it fills the caller's `image` buffer when given one.
+# - Times three ways of getting an ENCODER-READY (yuv420p) VideoFrame:
+#     legacy   : read() new array -> cvtColor to RGB -> from_ndarray(rgb24) -> reformat(yuv420p)
+#     bgr24    : read into a ring buffer -> from_numpy_buffer(bgr24), wraps it -> reformat(yuv420p)
+#                (CAPTURE_FORMAT="bgr24")
+#     yuv420p  : read into scratch BGR -> cvtColor into an I420 ring buffer
+#                -> from_numpy_buffer(yuv420p), wraps it: no copy, no reformat
+#   (the reformat() is what aiortc's VP8/H.264 encoder does when the frame isn't yuv420p)
+# - Reports µs/frame, plus Python-visible allocations per frame (tracemalloc:
+#   NumPy arrays and other objects). PyAV's AVFrame buffers live in C and are not counted;
+#   the ring paths allocate none (the frame points into the ring), legacy allocates one per frame.
+#
+# HOW TO RUN
+#   python bench_capture.py [--width 1920 --height 1080 --frames 300]
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from av import VideoFrame
+
+import sender
+
+
+class FakeCapture:
+    """Stands in for cv2.VideoCapture: copies a fixed BGR image into the output buffer."""
+
+    def __init__(self, width, height):
+        self.src = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        if image is None or image.shape != self.src.shape:
+            return True, self.src.copy()      # a real camera returns a fresh array here
+        np.copyto(image, self.src)
+        return True, image
+
+    def release(self):
+        pass
+
+
+def legacy_frame(cap):
+    # The original CameraTrack.recv body.
+    ok, frame = cap.read()
+    cv2.putText(frame, "2025-01-01 00:00:00.000", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return VideoFrame.from_ndarray(frame_rgb, format="rgb24")
+
+
+def encoder_ready(make_frame):
+    vf = make_frame()
+    if vf.format.name != "yuv420p":
+        vf = vf.reformat(format="yuv420p")    # what the encoder would do
+    return vf
+
+
+def run(make_frame, frames):
+    """-> (µs per frame, allocated blocks per frame, allocated KiB per frame)"""
+    for _ in range(10):
+        encoder_ready(make_frame)             # warm up (ring / I420 buffers get allocated here)
+
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        encoder_ready(make_frame)
+    us = (time.perf_counter() - t0) / frames * 1e6
+
+    # Count every allocation, even the short-lived ones freed before the next frame:
+    # snapshot the peak around each frame.
+    tracemalloc.start()
+    blocks = nbytes = 0
+    for _ in range(frames):
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        encoder_ready(make_frame)
+        nbytes += tracemalloc.get_traced_memory()[1] - base
+        diff = tracemalloc.take_snapshot().compare_to(before, "lineno")
+        blocks += sum(s.count_diff for s in diff if s.count_diff > 0)
+    tracemalloc.stop()
+    return us, blocks / frames, nbytes / frames / 1024
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--width", type=int, default=1280)
+    ap.add_argument("--height", type=int, default=720)
+    ap.add_argument("--frames", type=int, default=300)
+    args = ap.parse_args()
+
+    print(f"{args.width}x{args.height}, {args.frames} frames, until an encoder-ready yuv420p VideoFrame")
+    print(f"{'path':>8} {'us/frame':>10} {'blocks/frame':>13} {'peak KiB/frame':>15}")
+
+    cap = FakeCapture(args.width, args.height)
+    us, blocks, kib = run(lambda: legacy_frame(cap), args.frames)
+    print(f"{'legacy':>8} {us:>10.0f} {blocks:>13.1f} {kib:>15.1f}")
+
+    for fmt in ("bgr24", "yuv420p"):
+        sender.CAPTURE_FORMAT = fmt
+        track = sender.CameraTrack(capture=FakeCapture(args.width, args.height))
+        us, blocks, kib = run(track.capture_frame, args.frames)
+        print(f"{fmt:>8} {us:>10.0f} {blocks:>13.1f} {kib:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
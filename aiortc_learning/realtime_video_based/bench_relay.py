@@ -0,0 +1,141 @@
+# bench_relay.py — fan-out latency of the signaling relay vs. number of clients
+#
+# WHAT THIS DOES
+# - Starts a relay in its own process (the queued one from server.py, or the old
+#   "write + drain to each client in turn" loop with --legacy).
+# - Connects N receivers + 1 STALLED client (tiny receive buffer, never reads),
+#   then a sender pushes timestamped messages through the relay.
+# - Prints delivered count and p50 / p99 / max delivery latency per N.
+#   Queued relay: the stalled client is disconnected (or dropped) and everyone
+#   else keeps getting every message in a few ms, whatever N is.
+#   --legacy: once the stalled client's socket fills, every message waits behind
+#   its drain() -> "delivered" falls short and the receivers time out.
+#   (Receivers share this process's event loop, so part of the growth with N is
+#   the benchmark's own reading cost, not the relay's.)
+#
+# HOW TO RUN
+#   python bench_relay.py            # queued relay (server.py)
+#   python bench_relay.py --legacy   # original per-client drain loop, for comparison
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import statistics
+import time
+
+import server
+
+MESSAGES = 400
+PAYLOAD = 16000           # a large SDP offer (bundled candidates)
+INTERVAL = 0.005          # seconds between sends
+
+
+async def legacy_handle(reader, writer):
+    # The relay as it was: one client after another, each awaiting drain().
+    try:
+        while True:
+            size_bytes = await reader.readexactly(2)
+            size = int.from_bytes(size_bytes, "big")
+            data = await reader.readexactly(size)
+            for w in list(legacy_handle.clients):
+                if w is not writer:
+                    w.write(size_bytes + data); await w.drain()
+    except Exception:
+        pass
+    finally:
+        legacy_handle.clients.discard(writer)
+        writer.close()
+legacy_handle.clients = set()
+
+
+def run_relay(port, legacy):
+    async def serve():
+        if legacy:
+            cb = lambda r, w: (legacy_handle.clients.add(w), asyncio.create_task(legacy_handle(r, w)))[1]
+        else:
+            cb = server.handle
+        srv = await asyncio.start_server(cb, "127.0.0.1", port)
+        async with srv:
+            await srv.serve_forever()
+    asyncio.run(serve())
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def receiver(port, latencies, expected):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for _ in range(expected):
+            size = int.from_bytes(await asyncio.wait_for(reader.readexactly(2), 10), "big")
+            data = await reader.readexactly(size)
+            sent_ns = int.from_bytes(data[1:9], "big")
+            latencies.append((time.perf_counter_ns() - sent_ns) / 1e6)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def stalled_client(port):
+    # Small receive buffer + never reading = the relay's writes to us back up quickly.
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    return sock
+
+
+async def run_once(port, n):
+    stalled = await stalled_client(port)
+    latencies = []
+    tasks = [asyncio.create_task(receiver(port, latencies, MESSAGES)) for _ in range(n)]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await asyncio.sleep(0.3)  # let every connection register with the relay
+
+    pad = b"x" * (PAYLOAD - 9)
+    for _ in range(MESSAGES):
+        # Leading "{" like a JSON message: a 0x00 first byte would mean "routed frame" to the relay
+        data = b"{" + time.perf_counter_ns().to_bytes(8, "big") + pad
+        writer.write(len(data).to_bytes(2, "big") + data)
+        await writer.drain()
+        await asyncio.sleep(INTERVAL)
+
+    await asyncio.gather(*tasks)
+    writer.close()
+    stalled.close()
+    return latencies
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--legacy", action="store_true", help="benchmark the original drain-per-client relay")
+    ap.add_argument("--clients", default="1,10,50,100,200")
+    args = ap.parse_args()
+
+    print(f"relay: {'legacy drain loop' if args.legacy else 'queued (server.py)'}, "
+          f"{MESSAGES} msgs x {PAYLOAD} B, +1 stalled client")
+    print(f"{'clients':>8} {'delivered':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for n in [int(x) for x in args.clients.split(",")]:
+        port = free_port()
+        proc = multiprocessing.Process(target=run_relay, args=(port, args.legacy), daemon=True)
+        proc.start()
+        time.sleep(0.5)
+        try:
+            lat = asyncio.run(run_once(port, n))
+        finally:
+            proc.terminate(); proc.join()
+        if not lat:
+            print(f"{n:>8} {0:>10} {'-':>8} {'-':>8} {'-':>8}")
+            continue
+        lat.sort()
+        p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+        print(f"{n:>8} {len(lat):>10} {statistics.median(lat):>8.2f} {p99:>8.2f} {lat[-1]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
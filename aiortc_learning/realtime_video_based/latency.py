@@ -0,0 +1,270 @@
+# latency.py — where does a frame's time go, from camera to screen?
+#
+# Every video frame is stamped at each stage, on both sides:
+#   sender:    capture (camera read) -> handed (to aiortc) -> encoded -> sent (last RTP packet out)
+#   receiver:  received (complete in the jitter buffer) -> decoded -> rendered (imshow)
+# Frames are matched by their RTP timestamp ON THE WIRE. aiortc can't add custom
+# RTP header extensions, so the sender ships its stamps over a side data channel
+# ("latency"); the receiver pings through the same channel to estimate the clock
+# offset between the machines (NTP style, keeping the lowest-RTT sample).
+#
+# The receiver keeps a histogram per stage, prints percentiles, and can export a
+# Chrome trace (open in chrome://tracing or https://ui.perfetto.dev): one row per
+# stage, one bar per frame.
+#
+#   sender:    tracer = SenderTracer(pc, video_sender)       # before createOffer()
+#   receiver:  tracer = ReceiverTracer(pc)                   # before setRemoteDescription()
+#              tracer.attach(pc, track)                      # in pc's "track" event
+#              tracer.decoded(frame); tracer.rendered(frame) # where they happen
+#              tracer.report(); tracer.export("latency-trace.json")
+
+import asyncio
+import bisect
+import json
+import threading
+import time
+
+from recorder import TapQueue   # stands in for aiortc's decoder queue
+
+CHANNEL = "latency"
+FLUSH_EVERY = 0.5      # seconds between batches of sender stamps
+PING_EVERY = 1.0       # seconds between clock-offset pings
+REPORT_EVERY = 5.0     # seconds between receiver summaries (0 = only at the end)
+KEEP_SECONDS = 10.0    # unmatched stamps older than this are dropped
+MAX_TRACE_FRAMES = 10000
+
+STAGES = [             # (name, from stamp, to stamp)
+    ("queue", "capture", "handed"),       # camera read -> aiortc takes the frame
+    ("encode", "handed", "encoded"),
+    ("packetize+send", "encoded", "sent"),
+    ("network+jitter", "sent", "received"),
+    ("decode", "received", "decoded"),
+    ("render", "decoded", "rendered"),
+    ("total", "capture", "rendered"),
+]
+BUCKETS_MS = [1, 2, 5, 10, 20, 33, 50, 100, 200, 500, 1000]
+
+
+class SenderTracer:
+    """Stamps every outgoing video frame and sends the stamps over the "latency" channel."""
+
+    def __init__(self, pc, sender):
+        self.sender = sender
+        self.channel = pc.createDataChannel(CHANNEL)
+        self.batch = []
+        self.current = None     # stamps of the frame aiortc is encoding now
+        self.previous = None    # ... of the frame whose packets went out last
+        self.task = None
+
+        @self.channel.on("open")
+        def on_open():
+            self.task = asyncio.ensure_future(self._flush())
+
+        @self.channel.on("message")
+        def on_message(message):
+            ping = json.loads(message)
+            if "ping" in ping:
+                self.channel.send(json.dumps({"pong": ping["ping"], "t": time.time()}))
+
+        # aiortc has no per-frame hooks: wrap the sender's "get next encoded frame" step
+        next_encoded_frame = sender._next_encoded_frame
+
+        async def traced_next_encoded_frame(codec):
+            self._sent()          # aiortc only asks for a frame once the last one is on the wire
+            enc_frame = await next_encoded_frame(codec)
+            if enc_frame is not None and self.current is not None:
+                self.current["encoded"] = time.time()
+                self.previous, self.current = self.current, None
+            return enc_frame
+
+        sender._next_encoded_frame = traced_next_encoded_frame
+        track = sender.track
+        recv = track.recv
+
+        async def traced_recv():
+            frame = await recv()
+            now = time.time()
+            captured = frame.opaque if isinstance(frame.opaque, float) else now
+            self.current = {"capture": captured, "handed": now}
+            return frame
+
+        track.recv = traced_recv
+
+    def _sent(self):
+        if self.previous is None:
+            return
+        stamps, self.previous = self.previous, None
+        stamps["sent"] = time.time()
+        # RTP timestamp of the last packet sent, origin included: what the receiver sees
+        stamps["rtp"] = self.sender._RTCRtpSender__rtp_timestamp
+        self.batch.append(stamps)
+
+    async def _flush(self):
+        while self.channel.readyState == "open":
+            await asyncio.sleep(FLUSH_EVERY)
+            if self.batch:
+                batch, self.batch = self.batch, []
+                self.channel.send(json.dumps({"frames": batch}))
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+
+class Histogram:
+    def __init__(self):
+        self.values = []        # sorted, in ms
+
+    def add(self, ms):
+        bisect.insort(self.values, ms)
+
+    def percentile(self, p):
+        if not self.values:
+            return float("nan")
+        return self.values[min(len(self.values) - 1, int(p / 100 * len(self.values)))]
+
+    def buckets(self):
+        counts, lower = {}, 0
+        for bound in BUCKETS_MS + [float("inf")]:
+            upper = bisect.bisect_right(self.values, bound)
+            counts[f"<={bound:g}ms" if bound != float("inf") else f">{BUCKETS_MS[-1]}ms"] = upper - lower
+            lower = upper
+        return counts
+
+
+class ReceiverTracer:
+    """Stamps every incoming video frame, matches it with the sender's stamps, keeps histograms."""
+
+    def __init__(self, pc):
+        self.channel = None
+        self.receiver = None
+        self.offset = 0.0            # sender clock - our clock (s)
+        self.best_rtt = None
+        self.local = {}              # wire RTP timestamp -> our stamps
+        self.remote = {}             # wire RTP timestamp -> sender's stamps
+        self.lock = threading.Lock() # rendered() runs on the render thread
+        self.histograms = {name: Histogram() for name, _, _ in STAGES}
+        self.trace = []              # matched frames, for export()
+        self.tasks = []
+
+        @pc.on("datachannel")
+        def on_datachannel(channel):
+            if channel.label != CHANNEL:
+                return
+            self.channel = channel
+            channel.on("message", self._on_message)
+            self.tasks.append(asyncio.ensure_future(self._ping()))
+            if REPORT_EVERY:
+                self.tasks.append(asyncio.ensure_future(self._report_loop()))
+
+    def attach(self, pc, track):
+        """Tap `track`'s encoded frames as they leave the jitter buffer (call in the "track" event)."""
+        self.receiver = next(t.receiver for t in pc.getTransceivers() if t.receiver.track is track)
+
+        def on_encoded(codec, frame):
+            self._stamp(frame.timestamp, "received")
+            return False            # not ours to keep: let aiortc decode it as usual
+
+        # (the decoder thread picks the queue up when the transport starts, like recorder.py)
+        self.receiver._RTCRtpReceiver__decoder_queue = TapQueue(on_encoded)
+
+    def decoded(self, frame):
+        self._stamp(frame.pts, "decoded")
+
+    def rendered(self, frame):
+        self._stamp(frame.pts, "rendered")
+
+    def _wire(self, mapped):
+        """aiortc rebases incoming timestamps to start at 0; undo that to match the sender's."""
+        origin = self.receiver._RTCRtpReceiver__timestamp_mapper._origin if self.receiver else None
+        return None if origin is None or mapped is None else (mapped + origin) & 0xFFFFFFFF
+
+    def _stamp(self, mapped, stage):
+        rtp = self._wire(mapped)
+        if rtp is not None:
+            with self.lock:
+                self.local.setdefault(rtp, {})[stage] = time.time()
+
+    def _on_message(self, message):
+        msg = json.loads(message)
+        if "pong" in msg:
+            now = time.time()
+            rtt = now - msg["pong"]
+            if self.best_rtt is None or rtt < self.best_rtt:
+                self.best_rtt = rtt
+                self.offset = msg["t"] - (msg["pong"] + now) / 2
+        for stamps in msg.get("frames", []):
+            self.remote[stamps.pop("rtp")] = stamps
+        self._match()
+
+    async def _ping(self):
+        while self.channel.readyState in ("connecting", "open"):
+            if self.channel.readyState == "open":
+                self.channel.send(json.dumps({"ping": time.time()}))
+            await asyncio.sleep(PING_EVERY)
+
+    def _match(self):
+        """Pair complete local stamps with the sender's; feed histograms; forget stale ones."""
+        cutoff = time.time() - KEEP_SECONDS
+        with self.lock:
+            for rtp in list(self.local):
+                local = self.local[rtp]
+                remote = self.remote.get(rtp)
+                done = "rendered" in local or ("decoded" in local and local["decoded"] < time.time() - 1)
+                if remote is not None and done:
+                    del self.local[rtp], self.remote[rtp]
+                    self._record(rtp, remote, local)
+                elif min(local.values()) < cutoff:
+                    del self.local[rtp]
+        for rtp in [r for r, s in self.remote.items() if s["sent"] - self.offset < cutoff]:
+            del self.remote[rtp]
+
+    def _record(self, rtp, remote, local):
+        # Everything on our clock: sender stamps shifted by the estimated offset
+        stamps = {k: v - self.offset for k, v in remote.items()}
+        stamps.update(local)
+        if "rendered" not in stamps:
+            stamps["rendered"] = stamps["decoded"]   # e.g. mosaic / no window: stop at decode
+        for name, start, end in STAGES:
+            if start in stamps and end in stamps:
+                self.histograms[name].add((stamps[end] - stamps[start]) * 1000)
+        if len(self.trace) < MAX_TRACE_FRAMES:
+            self.trace.append((rtp, stamps))
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(REPORT_EVERY)
+            self.report()
+
+    def report(self):
+        self._match()
+        frames = len(self.histograms["total"].values)
+        print(f"[latency] {frames} frames, clock offset {self.offset * 1000:+.1f} ms "
+              f"(rtt {self.best_rtt * 1000 if self.best_rtt else float('nan'):.1f} ms)")
+        for name, _, _ in STAGES:
+            h = self.histograms[name]
+            print(f"[latency]   {name:15s} p50 {h.percentile(50):7.1f}  p95 {h.percentile(95):7.1f}  "
+                  f"max {h.percentile(100):7.1f} ms")
+
+    def export(self, path):
+        """Chrome trace-event JSON: one bar per stage per frame, plus the histograms."""
+        events = []
+        for tid, (name, _, _) in enumerate(STAGES[:-1]):
+            events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": tid, "args": {"name": name}})
+        for rtp, stamps in self.trace:
+            for tid, (name, start, end) in enumerate(STAGES[:-1]):
+                if start in stamps and end in stamps:
+                    events.append({
+                        "name": name, "ph": "X", "pid": 1, "tid": tid,
+                        "ts": stamps[start] * 1e6, "dur": max(stamps[end] - stamps[start], 0) * 1e6,
+                        "args": {"rtp": rtp},
+                    })
+        histograms = {name: h.buckets() for name, h in self.histograms.items()}
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"clock_offset_ms": self.offset * 1000, "histograms_ms": histograms}}, f)
+        print(f"[latency] trace of {len(self.trace)} frames written to {path}")
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
@@ -0,0 +1,157 @@
+# mosaic.py — many incoming video tracks tiled into ONE window (a monitoring wall)
+#
+# One window per track does not scale to 16+ cameras: 16 windows, 16 full-size
+# conversions per frame time. Here:
+# - Every track gets a tile in a grid; the canvas (CANVAS_WIDTH x CANVAS_HEIGHT) is
+#   allocated ONCE and each tile is a NumPy view into it.
+# - Tracks drop their newest frame into their tile's one-slot mailbox (latest wins).
+# - One render thread converts each due tile on its own, scaling and converting to BGR
+#   in the same frame.reformat(width, height, "bgr24") call (one per tile, not batched),
+#   and copies the pixels into the tile's view; then ONE imshow for the whole wall.
+# - Each tile is refreshed at most min(TILE_FPS, CONVERSION_BUDGET / tiles) times a
+#   second, so the total conversion work stays bounded however many cameras join.
+#
+#   mosaic = Mosaic("Wall (press q)").start()
+#   mosaic.offer(key, frame)     # from the asyncio loop, one key per track
+#   mosaic.remove(key)           # track ended
+#   mosaic.stop()                # prints rendered / dropped per tile
+
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+CANVAS_WIDTH, CANVAS_HEIGHT = 1280, 720
+TILE_FPS = 15                  # max refreshes per second of one tile
+CONVERSION_BUDGET = 120        # max tile conversions per second, all tiles together
+REPORT_EVERY = 5.0
+
+
+class Tile:
+    def __init__(self, key):
+        self.key = key
+        self.slot = None           # newest frame not shown yet
+        self.view = None           # this tile's area of the canvas
+        self.next_due = 0.0
+        self.rendered = 0
+        self.dropped = 0
+
+
+class Mosaic:
+    def __init__(self, title, width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+        self.title = title
+        self.canvas = np.zeros((height, width, 3), np.uint8)
+        self.tiles = {}            # key -> Tile, in arrival order
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self._loop, name=f"mosaic-{title}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def offer(self, key, frame):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is None:
+                tile = self.tiles[key] = Tile(key)
+                self._layout()
+            if tile.slot is not None:
+                tile.dropped += 1
+            tile.slot = frame
+        self.wake.set()
+
+    def remove(self, key):
+        with self.lock:
+            tile = self.tiles.pop(key, None)
+            if tile is not None:
+                print(f"[mosaic] {key}: {tile.rendered} rendered, {tile.dropped} dropped")
+                self._layout()
+
+    def stop(self):
+        self.closed = True
+        self.wake.set()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        for tile in list(self.tiles.values()):
+            print(f"[mosaic] {tile.key}: {tile.rendered} rendered, {tile.dropped} dropped")
+
+    def _layout(self):
+        """Grid for the current tiles (lock held). Tiles are views: no new buffers."""
+        self.canvas[:] = 0
+        n = len(self.tiles)
+        if not n:
+            return
+        cols = math.ceil(math.sqrt(n))
+        rows = math.ceil(n / cols)
+        height, width = self.canvas.shape[:2]
+        tile_w, tile_h = width // cols & ~1, height // rows & ~1
+        for i, tile in enumerate(self.tiles.values()):
+            y, x = (i // cols) * tile_h, (i % cols) * tile_w
+            tile.view = self.canvas[y:y + tile_h, x:x + tile_w]
+            tile.next_due = 0.0        # redraw into its new place right away
+
+    @staticmethod
+    def _convert(frame, shape):
+        """Fit the frame in a tile of `shape` (aspect kept): BGR pixels, converted and scaled in one pass."""
+        tile_h, tile_w = shape[:2]
+        scale = min(tile_w / frame.width, tile_h / frame.height)
+        w = max(2, int(frame.width * scale) & ~1)
+        h = max(2, int(frame.height * scale) & ~1)
+        return frame.reformat(width=w, height=h, format="bgr24").to_ndarray()
+
+    @staticmethod
+    def _paste(view, img):
+        """Copy `img` into the centre of a tile's view (lock held)."""
+        (tile_h, tile_w), (h, w) = view.shape[:2], img.shape[:2]
+        y, x = (tile_h - h) // 2, (tile_w - w) // 2
+        np.copyto(view[y:y + h, x:x + w], img)
+
+    def _loop(self):
+        last_report = time.monotonic()
+        try:
+            while not self.closed:
+                self.wake.wait(timeout=0.05)
+                self.wake.clear()
+                now = time.monotonic()
+
+                # Take the frames that are due (throttled per tile), leave the rest in their slots
+                with self.lock:
+                    n = len(self.tiles)
+                    interval = 1 / min(TILE_FPS, CONVERSION_BUDGET / n) if n else 0
+                    due = []
+                    for tile in self.tiles.values():
+                        if tile.slot is not None and now >= tile.next_due:
+                            due.append((tile, tile.slot, tile.view))
+                            tile.slot = None
+                            tile.next_due = now + interval
+
+                for tile, frame, view in due:
+                    img = self._convert(frame, view.shape)   # the slow part, outside the lock
+                    with self.lock:
+                        # offer()/remove() may have re-laid out the grid meanwhile: the old view
+                        # is now (part of) another tile, so only paste into the current one.
+                        if view is tile.view:
+                            self._paste(view, img)
+                            tile.rendered += 1
+                        elif tile.slot is None and self.tiles.get(tile.key) is tile:
+                            tile.slot = frame    # draw it again at its new size on the next pass
+
+                if due:
+                    with self.lock:
+                        cv2.imshow(self.title, self.canvas)   # never a half-cleared canvas
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    print("q pressed")
+                    self.closed = True
+
+                if REPORT_EVERY and now - last_report >= REPORT_EVERY:
+                    last_report = now
+                    with self.lock:
+                        shown = sum(t.rendered for t in self.tiles.values())
+                        dropped = sum(t.dropped for t in self.tiles.values())
+                    print(f"[mosaic] {n} tiles: {shown} rendered, {dropped} dropped")
+        finally:
+            cv2.destroyAllWindows()
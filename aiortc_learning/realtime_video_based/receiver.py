@@ -3,61 +3,151 @@
 # =========================
 
 import asyncio
-import cv2
+import uuid
 from aiortc import RTCPeerConnection, RTCSessionDescription  # WebRTC peer + SDP type
+from aiortc.contrib.signaling import BYE                    # "peer hung up" marker
 from aiortc.contrib.signaling import TcpSocketSignaling     # TCP-based signaling helper
+from relay_signaling import RelaySignaling                  # room-scoped signaling through server.py
 from av import VideoFrame                                   # aiortc/PyAV video frame type
+from render import Renderer                                 # render thread + latest-frame mailbox
+from mosaic import Mosaic                                   # many tracks tiled into one window
+from recorder import Recorder                               # headless: tracks -> rolling files
+from latency import ReceiverTracer                          # per-stage latency, matched with the sender's stamps
 
 # --- Signaling relay address: must match your running server.py and the sender ---
 HOST, PORT = "127.0.0.1", 10001
 
+# --- Optional: signal through server.py in a ROOM (only peers in that room see our answer) ---
+ROOM = None  # e.g. "cam1"; must match the sender's ROOM
+RELAY_PORT = 10000
+SFU = False  # with a ROOM: subscribe to sfu.py instead of waiting for the sender's own offer
+MOSAIC = False  # one tiled window for ALL incoming video tracks; with a ROOM, answer EVERY sender in it
+RECORD_DIR = None      # e.g. "recordings": archive every track to rolling segments, no window
+RECORD_FORMAT = "mkv"  # "mkv" / "webm" / "mp4" (see recorder.py for what is passed through)
+TRACE = False          # needs TRACE = True on the sender: per-stage latency histograms ("[latency] ...")
+TRACE_FILE = "latency-trace.json"  # Chrome trace written on exit (chrome://tracing / ui.perfetto.dev)
+PEER_ID = f"receiver-{uuid.uuid4().hex[:6]}"  # unique, so several receivers can share a room
 
-async def display_frames(track):
+
+async def display_frames(track, tracer=None):
     """
-    Read frames from the incoming WebRTC video track and show them with OpenCV.
-    Press 'q' in the window to quit.
+    Read frames from the incoming WebRTC video track and hand them to a render thread
+    (render.py), which shows the newest one with OpenCV. Press 'q' in the window to quit.
     """
     print("display_frames started")
 
-    while True:
+    # The window lives on its own thread; this loop only receives frames
+    renderer = Renderer("Receiver (press q)", on_render=tracer.rendered if tracer else None).start()
+
+    while not renderer.closed:
         try:
             # Await the next video frame from the WebRTC pipeline
             frame = await track.recv()
 
-            # aiortc delivers PyAV VideoFrame objects; convert to NumPy (BGR) for OpenCV
+            # Newest frame wins: if the window is still busy with an older one, that one is dropped
             if isinstance(frame, VideoFrame):
-                img = frame.to_ndarray(format="bgr24")
-
-                # Show the frame in a window titled "Receiver (press q)"
-                cv2.imshow("Receiver (press q)", img)
-
-                # Close when user presses 'q'
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    print("q pressed")
-                    break
+                if tracer: tracer.decoded(frame)
+                renderer.offer(frame)
 
         except Exception as e:
             # Any error (e.g., connection closed) breaks the loop
             print("display_frames error:", e)
             break
 
-    # Make sure all OpenCV windows are closed when leaving
-    cv2.destroyAllWindows()
+    # Stop the render thread (closes the window, prints rendered / dropped counts)
+    renderer.stop()
+
+
+async def feed_mosaic(track, mosaic, key, tracer=None):
+    """Like display_frames, but into our tile of the shared mosaic window."""
+    while not mosaic.closed:
+        try:
+            frame = await track.recv()
+            if isinstance(frame, VideoFrame):
+                if tracer: tracer.decoded(frame)
+                mosaic.offer(key, frame)
+        except Exception as e:
+            print(f"{key} ended:", e)
+            break
+    mosaic.remove(key)
+
+
+async def receive_wall(signaling, mosaic):
+    """MOSAIC + ROOM: one peer connection per sender in the room, every video track tiled."""
+    pcs = {}
+    # sender peer id -> RTCPeerConnection
+
+    while not mosaic.closed:
+        try:
+            event = await asyncio.wait_for(signaling.next_event(), 0.5)
+        except asyncio.TimeoutError:
+            continue
+            # Wake up now and then to notice 'q' in the window.
+        if event is None:
+            break
+
+        kind, peer, obj = event
+        if kind == "message" and isinstance(obj, RTCSessionDescription) and obj.type == "offer":
+            if peer in pcs:
+                await pcs.pop(peer).close()
+            pc = pcs[peer] = RTCPeerConnection()
+
+            @pc.on("track")
+            def on_track(track, peer=peer):
+                if track.kind == "video":
+                    asyncio.create_task(feed_mosaic(track, mosaic, f"{peer}/{track.id[:6]}"))
+
+            await pc.setRemoteDescription(obj)
+            await pc.setLocalDescription(await pc.createAnswer())
+            await signaling.send(pc.localDescription, to=peer)
+            print(f"Receiver: answered {peer} ({len(pcs)} senders)")
+
+        elif (kind == "leave" or obj is BYE) and peer in pcs:
+            await pcs.pop(peer).close()
+            print(f"Receiver: {peer} gone ({len(pcs)} senders)")
+
+    for pc in pcs.values():
+        await pc.close()
 
 
 async def main():
     # 1) Create signaling helper that connects to the TCP relay (server.py)
-    signaling = TcpSocketSignaling(HOST, PORT)
+    signaling = RelaySignaling(HOST, RELAY_PORT, ROOM, PEER_ID) if ROOM else TcpSocketSignaling(HOST, PORT)
+
+    # Optional: one tiled window for every video track instead of one window per track
+    mosaic = Mosaic("Receiver wall (press q)").start() if MOSAIC else None
+
+    if mosaic and ROOM:
+        # A monitoring wall: take every sender in the room
+        await signaling.connect()
+        try:
+            await receive_wall(signaling, mosaic)
+        finally:
+            mosaic.stop()
+            await signaling.close()
+        return
 
     # 2) Create the WebRTC peer connection for the receiver
     pc = RTCPeerConnection()
 
+    # Optional: record instead of display (compressed packets written as they arrive)
+    recorder = Recorder(RECORD_DIR, RECORD_FORMAT) if RECORD_DIR else None
+
+    # Optional: latency breakdown per stage (the sender's stamps arrive on a data channel)
+    tracer = ReceiverTracer(pc) if TRACE and not recorder else None
+
     # 3) When a media track arrives (from the sender), start showing its frames
     @pc.on("track")
     def on_track(track):
         print("Track received:", track.kind)
-        if track.kind == "video":                 # only handle video tracks here
-            asyncio.create_task(display_frames(track))
+        if recorder:                              # archive every track (video and audio)
+            recorder.add(pc, track, PEER_ID)
+        elif track.kind == "video" and mosaic:      # tile it into the shared window
+            if tracer: tracer.attach(pc, track)
+            asyncio.create_task(feed_mosaic(track, mosaic, track.id[:6], tracer))
+        elif track.kind == "video":               # only handle video tracks here
+            if tracer: tracer.attach(pc, track)
+            asyncio.create_task(display_frames(track, tracer))
 
     # 4) Optional: log connection state changes for visibility/debugging
     @pc.on("connectionstatechange")
@@ -66,8 +156,13 @@ async def main():
 
     # 5) Connect to the relay and wait for the sender's SDP OFFER
     await signaling.connect()
+    if ROOM and SFU:
+        await signaling.subscribe("sfu")   # the SFU answers with an offer of its own
     print("Receiver: Waiting for offer…")
     offer = await signaling.receive()
+    while ROOM and isinstance(offer, RTCSessionDescription) and offer.type != "offer":
+        offer = await signaling.receive()
+        # In a shared room, skip other receivers' answers.
     print("Receiver: offer received:", isinstance(offer, RTCSessionDescription))
 
     # 6) Apply the sender's OFFER as our remote description
@@ -76,7 +171,11 @@ async def main():
     # 7) Create our ANSWER, set it locally, and send it back via signaling
     answer = await pc.createAnswer()
     await pc.setLocalDescription(answer)
-    await signaling.send(pc.localDescription)
+    if ROOM:
+        await signaling.send(pc.localDescription, to=signaling.last_sender)
+        # Answer only whoever sent the offer (not every receiver in the room).
+    else:
+        await signaling.send(pc.localDescription)
     print("Receiver: answer sent")
 
     # 8) Keep the program alive while the connection is active so frames keep coming
@@ -86,6 +185,10 @@ async def main():
     finally:
         # 9) Clean up when done
         await pc.close()
+        if mosaic: mosaic.stop()
+        if recorder: await recorder.close()   # finish + fsync the open segments
+        if tracer:
+            tracer.stop(); tracer.report(); tracer.export(TRACE_FILE)
         print("Receiver closed")
 
 
@@ -0,0 +1,274 @@
+# recorder.py — headless receiver sink: incoming tracks -> rolling MKV / WebM / MP4 segments
+#
+# WHAT THIS DOES
+# - Every incoming track (video and audio) is written to its own series of files:
+#     <RECORD_DIR>/<label>-<kind>-00001-20250101-120000.mkv, ...-00002-..., one per SEGMENT_SECONDS.
+# - PASSTHROUGH when the container can hold the codec as is (VP8 / H.264 / Opus, see
+#   PASSTHROUGH): the ENCODED frames are taken straight out of aiortc's jitter buffer
+#   and muxed. Nothing is decoded or encoded.
+# - Otherwise (e.g. VP8 into .mp4, PCMU audio) the track is decoded as usual and the
+#   frames are re-encoded (FALLBACK_ENCODERS). Slower, but always works.
+# - A new video segment starts on a keyframe; when a segment is due we ask the
+#   sender for one (RTCP PLI) so segments stay close to SEGMENT_SECONDS.
+# - ALL disk work (open, mux, close, fsync) runs in one background thread per track
+#   (a single-worker executor keeps the order). The asyncio loop only decides and
+#   hands work over, so a slow disk never stalls RTP/RTCP.
+#
+#   recorder = Recorder("recordings", "mkv")
+#   @pc.on("track")
+#   def on_track(track): recorder.add(pc, track, "cam1")
+#   ...
+#   await recorder.close()       # finishes + fsyncs the open segments
+
+import asyncio
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+import av
+from aiortc.mediastreams import MediaStreamError
+
+SEGMENT_SECONDS = 60
+PLI_INTERVAL = 1.0         # seconds between keyframe requests while a segment is due
+
+# container -> {negotiated codec: stream codec name we can mux without re-encoding}
+PASSTHROUGH = {
+    "mkv": {"video/VP8": "vp8", "video/H264": "h264", "audio/opus": "libopus"},
+    "webm": {"video/VP8": "vp8", "audio/opus": "libopus"},
+    "mp4": {"video/H264": "h264", "audio/opus": "libopus"},
+}
+# container -> (video encoder, audio encoder) when a track can't be passed through
+FALLBACK_ENCODERS = {
+    "mkv": ("libvpx", "libopus"),
+    "webm": ("libvpx", "libopus"),
+    "mp4": ("libx264", "aac"),
+}
+
+
+def is_keyframe(codec_name, data):
+    if codec_name == "vp8":
+        return len(data) > 0 and not data[0] & 0x01       # VP8 frame tag P bit
+    if codec_name == "h264":
+        # Annex B: look for an IDR slice (NAL type 5) after a start code
+        i = data.find(b"\x00\x00\x01")
+        while i != -1 and i + 3 < len(data):
+            if data[i + 3] & 0x1F == 5:
+                return True
+            i = data.find(b"\x00\x00\x01", i + 3)
+        return False
+    return True                                           # audio: every packet
+
+
+def probe_size(codec_name, data):
+    """Width/height of a video keyframe (decoded once, only to learn the size)."""
+    decoder = av.CodecContext.create(codec_name, "r")
+    for frame in decoder.decode(av.Packet(data)):
+        return frame.width, frame.height
+    return None
+
+
+class TapQueue(queue.Queue):
+    """
+    Stands in for the receiver's decoder queue. Frames the recorder takes as they
+    are never reach the decoder; anything else is decoded as usual (fallback).
+    """
+
+    def __init__(self, on_frame):
+        super().__init__()
+        self.on_frame = on_frame
+
+    def put(self, item, block=True, timeout=None):
+        if item is None or not self.on_frame(*item):
+            super().put(item, block, timeout)
+
+
+class TrackRecorder:
+    def __init__(self, recorder, track, receiver, label):
+        self.recorder = recorder
+        self.track = track
+        self.receiver = receiver
+        self.label = label
+        self.kind = track.kind
+        self.mode = None           # "passthrough" | "encode", decided on the first frame
+        self.codec_name = None
+        self.time_base = None
+        self.first_ts = None       # media timestamp of the first frame written
+        self.segment_start = None  # media time (s) the current segment started at
+        self.last_pli = 0.0
+        self.task = None
+        # Everything that touches the disk runs here, in order
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f"rec-{label}-{self.kind}")
+        # (owned by the executor thread)
+        self.container = None
+        self.stream = None
+        self.path = None
+        self.segment = 0
+        self.written = 0
+
+    # --- asyncio loop side: decide, never touch the disk ---------------
+
+    def on_encoded(self, codec, frame):
+        """From the tap: True if we muxed the frame ourselves, False to let aiortc decode it."""
+        if self.mode is None:
+            name = PASSTHROUGH[self.recorder.fmt].get(codec.mimeType)
+            self.mode = "passthrough" if name else "encode"
+            print(f"[rec] {self.label}/{self.kind}: {codec.mimeType} -> {self.mode}")
+            if name is None:
+                self.task = asyncio.ensure_future(self._read_decoded())
+            self.codec_name = name
+            self.time_base = Fraction(1, codec.clockRate)
+        if self.mode != "passthrough":
+            return False
+
+        keyframe = is_keyframe(self.codec_name, frame.data)
+        if self.first_ts is None:
+            if not keyframe:
+                self._request_keyframe()
+                return True        # a file has to start on a keyframe
+            self.first_ts = frame.timestamp
+        pts = frame.timestamp - self.first_ts
+        rotate = self._segment_due(float(pts * self.time_base), keyframe)
+        self.executor.submit(self._write_packet, frame.data, pts, keyframe, rotate)
+        return True
+
+    def on_decoded(self, frame):
+        if self.first_ts is None:
+            self.first_ts = frame.pts
+            self.time_base = frame.time_base
+        pts = frame.pts - self.first_ts
+        rotate = self._segment_due(float(pts * self.time_base), True)
+        self.executor.submit(self._write_frame, frame, pts, rotate)
+
+    def _segment_due(self, now, can_cut):
+        if self.segment_start is None:
+            self.segment_start = now
+            return True            # first segment
+        if now - self.segment_start < SEGMENT_SECONDS:
+            return False
+        if not can_cut:
+            self._request_keyframe()   # due, but video can only be cut on a keyframe
+            return False
+        self.segment_start = now
+        return True
+
+    def _request_keyframe(self):
+        if self.kind != "video" or self.receiver is None or time.monotonic() - self.last_pli < PLI_INTERVAL:
+            return
+        self.last_pli = time.monotonic()
+        for source in self.receiver.getSynchronizationSources():
+            asyncio.ensure_future(self.receiver._send_rtcp_pli(source.source))
+
+    async def _read_decoded(self):
+        while True:
+            try:
+                frame = await self.track.recv()
+            except MediaStreamError:
+                break
+            self.on_decoded(frame)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close_segment)
+        self.executor.shutdown(wait=False)
+
+    # --- executor side: the disk ----------------------------------------
+
+    def _open_segment(self, stream_codec, **options):
+        self._close_segment()
+        self.segment += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = f"{self.label}-{self.kind}-{self.segment:05d}-{stamp}.{self.recorder.fmt}"
+        self.path = os.path.join(self.recorder.directory, name)
+        self.container = av.open(self.path, "w")
+        if self.kind == "video":
+            self.stream = self.container.add_stream(stream_codec, rate=30)
+            self.stream.width, self.stream.height = options["size"]
+            self.stream.pix_fmt = "yuv420p"
+        else:
+            self.stream = self.container.add_stream(stream_codec, rate=options["rate"])
+            self.stream.layout = options["layout"]
+        self.stream.time_base = self.time_base
+        self.written = 0
+        self.segment_pts = options["pts"]
+        print(f"[rec] {self.label}/{self.kind}: writing {name}")
+
+    def _close_segment(self):
+        if self.container is None:
+            return
+        if self.mode == "encode":
+            for packet in self.stream.encode(None):   # flush the encoder
+                self.container.mux(packet)
+        self.container.close()
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            os.fsync(fd)   # the finished segment is really on disk before we move on
+        finally:
+            os.close(fd)
+        self.container = None
+        print(f"[rec] {self.label}/{self.kind}: closed {os.path.basename(self.path)} ({self.written} packets)")
+
+    def _write_packet(self, data, pts, keyframe, rotate):
+        try:
+            if rotate:
+                if self.kind == "video":
+                    options = {"size": probe_size(self.codec_name, data), "pts": pts}
+                else:
+                    options = {"rate": 48000, "layout": "stereo", "pts": pts}
+                self._open_segment(self.codec_name, **options)
+            if self.container is None:
+                return
+            packet = av.Packet(data)
+            packet.pts = packet.dts = pts - self.segment_pts   # each segment starts at 0
+            packet.time_base = self.time_base
+            packet.stream = self.stream
+            packet.is_keyframe = keyframe
+            self.container.mux(packet)
+            self.written += 1
+        except Exception as e:
+            print(f"[rec] {self.label}/{self.kind}: write failed:", e)
+
+    def _write_frame(self, frame, pts, rotate):
+        try:
+            if rotate:
+                video_encoder, audio_encoder = FALLBACK_ENCODERS[self.recorder.fmt]
+                if self.kind == "video":
+                    self._open_segment(video_encoder, size=(frame.width, frame.height), pts=pts)
+                else:
+                    self._open_segment(audio_encoder, rate=frame.sample_rate, layout=frame.layout.name, pts=pts)
+            if self.container is None:
+                return
+            frame.pts, frame.time_base = pts - self.segment_pts, self.time_base
+            for packet in self.stream.encode(frame):
+                self.container.mux(packet)
+                self.written += 1
+        except Exception as e:
+            print(f"[rec] {self.label}/{self.kind}: encode failed:", e)
+
+
+class Recorder:
+    def __init__(self, directory, fmt="mkv"):
+        if fmt not in PASSTHROUGH:
+            raise ValueError(f"format must be one of {sorted(PASSTHROUGH)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fmt = fmt
+        self.tracks = []
+
+    def add(self, pc, track, label="track"):
+        """Record `track` (call from pc's "track" event, before the connection starts)."""
+        receiver = next(t.receiver for t in pc.getTransceivers() if t.receiver.track is track)
+        rec = TrackRecorder(self, track, receiver, label)
+        # aiortc has no API for encoded frames: swap its decoder queue for our tap
+        # (the decoder thread picks the queue up when the transport starts).
+        receiver._RTCRtpReceiver__decoder_queue = TapQueue(rec.on_encoded)
+        self.tracks.append(rec)
+        return rec
+
+    async def close(self):
+        for rec in self.tracks:
+            await rec.close()
+        self.tracks = []
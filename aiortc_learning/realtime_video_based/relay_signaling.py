@@ -0,0 +1,121 @@
+# relay_signaling.py — talk to server.py through a ROOM instead of broadcasting to everyone
+#
+# Same methods as aiortc's TcpSocketSignaling (connect / send / receive / close),
+# but it speaks the relay's framed protocol and joins `room` as `peer_id` on connect.
+# Only members of the same room see our messages; send(obj, to="other") targets one peer.
+#
+# next_event() also reports peers joining / leaving the room, for a sender that
+# opens one connection per viewer (see SIMULCAST in sender.py); subscribe() /
+# unsubscribe() ask a forwarding peer (sfu.py) for its media.
+#
+# version=2 (default) uses the relay's v2 framing: no 64 KB limit on an SDP,
+# compression of large payloads, and several messages per frame (send_many).
+# version=1 keeps the original 2-byte length framing.
+#
+#   signaling = RelaySignaling("127.0.0.1", 10000, room="cam1", peer_id="sender")
+
+import asyncio
+from collections import deque
+
+from aiortc.contrib.signaling import BYE, object_from_string, object_to_string
+
+from server import (
+    ERROR, JOIN, LEAVE, MAX_FRAME, MSG, SUBSCRIBE, UNSUBSCRIBE, V2_MAGIC,
+    frame_v1, frame_v2, pack_routed, read_varint, unframe_v2, unpack_routed,
+)
+
+
+class RelaySignaling:
+    def __init__(self, host, port, room, peer_id, version=2):
+        self._host, self._port = host, port
+        self.room = room.encode()
+        self.peer_id = peer_id.encode()
+        self.version = version
+        self.last_sender = None     # peer id (str) of the last message receive() returned
+        self._reader = None
+        self._writer = None
+        self._pending = deque()     # payloads from a batched v2 frame not returned yet
+
+    async def _write(self, payloads):
+        self._writer.write(frame_v2(payloads) if self.version == 2 else frame_v1(payloads))
+        await self._writer.drain()
+
+    async def _read(self):
+        """Next payload from the relay (unpacking v2 batches)."""
+        while not self._pending:
+            if self.version == 2:
+                size = await read_varint(self._reader)
+                if not 0 < size <= MAX_FRAME:
+                    raise ConnectionError(f"bad frame size {size}")
+                self._pending.extend(unframe_v2(await self._reader.readexactly(size)))
+            else:
+                size = int.from_bytes(await self._reader.readexactly(2), "big")
+                self._pending.append(await self._reader.readexactly(size))
+        return self._pending.popleft()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        if self.version == 2:
+            self._writer.write(V2_MAGIC)
+        await self._write([pack_routed(JOIN, self.room, self.peer_id)])
+
+    async def send(self, obj, to=""):
+        """Send a description/candidate/BYE to `to` ("" = everyone else in the room)."""
+        await self.send_many([obj], to)
+
+    async def send_many(self, objs, to=""):
+        """Several objects (e.g. trickled candidates) in ONE frame when using v2."""
+        await self._write([
+            pack_routed(MSG, self.room, to.encode(), object_to_string(o).encode("utf8")) for o in objs
+        ])
+
+    async def subscribe(self, to="sfu"):
+        """Ask `to` (a forwarding peer in the room) to send us its media; it replies with an offer."""
+        await self._write([pack_routed(SUBSCRIBE, self.room, to.encode())])
+
+    async def unsubscribe(self, to="sfu"):
+        await self._write([pack_routed(UNSUBSCRIBE, self.room, to.encode())])
+
+    async def next_event(self):
+        """
+        Next ("join" | "leave" | "subscribe" | "unsubscribe", peer, None) or
+        ("message", peer, obj) from the room, or None when the relay goes away.
+        """
+        while True:
+            try:
+                payload = await self._read()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return None
+            op, _, peer, body = unpack_routed(payload)
+            if op == ERROR:
+                print("relay error:", body.decode(errors="replace"))
+            elif op == MSG:
+                self.last_sender = peer.decode()
+                return "message", self.last_sender, object_from_string(body.decode("utf8"))
+            elif op == JOIN:
+                return "join", peer.decode(), None
+            elif op == LEAVE:
+                return "leave", peer.decode(), None
+            elif op == SUBSCRIBE:
+                return "subscribe", peer.decode(), None
+            elif op == UNSUBSCRIBE:
+                return "unsubscribe", peer.decode(), None
+
+    async def receive(self):
+        """Next description/candidate/BYE from the room, or None when the relay goes away."""
+        while True:
+            event = await self.next_event()
+            if event is None:
+                return None
+            if event[0] == "message":
+                return event[2]
+
+    async def close(self):
+        if self._writer is not None:
+            try:
+                await self.send(BYE)
+                await self._write([pack_routed(LEAVE)])
+            except ConnectionError:
+                pass
+            self._writer.close()
+            self._reader = self._writer = None
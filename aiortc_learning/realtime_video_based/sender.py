@@ -1,7 +1,8 @@
-import asyncio, cv2
-# asyncio: for async/await; cv2: OpenCV for camera access
+import asyncio, cv2, threading, time
+# asyncio: for async/await; cv2: OpenCV for camera access; threading: capture thread; time: capture stamps
 
 from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+from aiortc.contrib.signaling import BYE
 # RTCPeerConnection = the WebRTC peer
 # RTCSessionDescription = offer/answer objects
 # VideoStreamTrack = base class to send video frames
@@ -9,6 +10,18 @@ from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
 from aiortc.contrib.signaling import TcpSocketSignaling
 # TcpSocketSignaling = helper to send/receive offer/answer over a TCP relay
 
+from relay_signaling import RelaySignaling
+# RelaySignaling = same idea, but through server.py inside a named ROOM
+
+from adaptive import AdaptiveController, AdaptiveVideoTrack
+# Adaptive* = scale bitrate/resolution/fps to the receiver's RTCP feedback
+
+from simulcast import LAYER_LADDER, SimulcastEncoder, prefer_vp8
+# Simulcast = encode a few resolutions once each, every viewer gets the one it can take
+
+from latency import SenderTracer
+# SenderTracer = per-frame capture/encode/send stamps for the receiver's latency breakdown
+
 from av import VideoFrame
 # VideoFrame = wrapper type aiortc uses for video frames
 
@@ -18,27 +31,81 @@ from datetime import datetime
 HOST, PORT = "127.0.0.1", 10001
 # Address/port of your signaling relay (server). Must match server/receiver.
 
+ROOM = None  # e.g. "cam1": signal through server.py (RELAY_PORT) in that room instead
+RELAY_PORT = 10000
+# With a ROOM, only peers in the same room see our offer (see relay_signaling.py).
+
 CAMERA_ID = 0
 # Which camera to open. Try 0, then 1 or 2 if 0 doesn’t work.
 
 LOCAL_PREVIEW = False  # set True to see your own camera in a window
 # If True, show a local OpenCV preview window in the sender.
 
+CAPTURE_FORMAT = "yuv420p"
+# Pixel format handed to aiortc: "yuv420p" (what the VP8/H.264 encoders want, so they
+# skip their own conversion) or "bgr24" (OpenCV's native order, no conversion here).
+
+RING_SIZE = 3
+# Preallocated frame buffers that the VideoFrames handed to aiortc WRAP (no copy, no
+# per-frame allocation). A buffer is rewritten only when it is neither waiting in the
+# latest-frame slot nor lent out by recv(): consumers (aiortc's sender, the simulcast
+# encoder) are done with a frame when they ask for the next one, so 3 always leaves one
+# free (one being written + one waiting + one lent).
+
+ADAPTIVE = True
+# Follow the receiver's loss / REMB feedback (see adaptive.py) instead of always
+# sending full resolution and frame rate.
+
+SIMULCAST = False
+# Needs a ROOM: one connection per receiver in the room, all fed from ONE capture
+# encoded once per layer (simulcast.py); each receiver's layer follows its feedback.
+
+SFU = False
+# Needs a ROOM: publish ONCE to sfu.py, which forwards our encoded video to every
+# receiver that subscribes (our upload/CPU don't grow with the audience).
+
+TRACE = False
+# Send per-frame stamps (capture, encode, send) on a "latency" data channel; a receiver
+# with TRACE = True prints where each frame's time goes (see latency.py).
+
 class CameraTrack(VideoStreamTrack):
     kind = "video"
     # This class produces video frames for WebRTC.
 
-    def __init__(self, camera_id=0):
+    def __init__(self, camera_id=0, capture=None):
         super().__init__()
         # Call parent constructor.
 
-        # CAP_DSHOW helps on Windows; fall back if needed
-        cap = cv2.VideoCapture(camera_id, cv2.CAP_DSHOW)
-        # Try to open the camera with DirectShow backend (Windows friendly).
-
-        if not cap.isOpened():
-            cap = cv2.VideoCapture(camera_id)
-            # If that failed, try again with default backend.
+        self.lock = threading.Lock()
+        self.slot = None
+        self.fresh = asyncio.Event()
+        # Latest-frame slot: the capture thread overwrites it, recv() takes it.
+
+        self.thread = None
+        self.stopping = threading.Event()
+        self.error = None
+        self.dropped = 0
+        # Capture thread (started on the first recv), its stop flag, and stats.
+
+        self.ring = []
+        self.waiting = None
+        self.lent = None
+        self.writing = 0
+        self.bgr = None
+        # Preallocated buffers, created on the first frame once we know its size, and
+        # which of them sits in the slot / was last returned by recv() / is being written.
+
+        if capture is not None:
+            cap = capture
+            # Use an already-open capture (e.g. a fake one in bench_capture.py).
+        else:
+            # CAP_DSHOW helps on Windows; fall back if needed
+            cap = cv2.VideoCapture(camera_id, cv2.CAP_DSHOW)
+            # Try to open the camera with DirectShow backend (Windows friendly).
+
+            if not cap.isOpened():
+                cap = cv2.VideoCapture(camera_id)
+                # If that failed, try again with default backend.
 
         self.cap = cap
         print("cap.isOpened():", self.cap.isOpened())
@@ -51,16 +118,106 @@ class CameraTrack(VideoStreamTrack):
     async def recv(self):
         # Called repeatedly by aiortc to get the next frame to send.
 
+        if self.thread is None:
+            loop = asyncio.get_running_loop()
+            self.thread = threading.Thread(target=self.capture_loop, args=(loop,), daemon=True)
+            self.thread.start()
+            # First call: start reading the camera on its own thread, so a slow
+            # cap.read() never blocks RTCP, ICE or the other tracks on this loop.
+
         pts, time_base = await self.next_timestamp()
         # Get the next presentation timestamp & time base (proper pacing).
 
-        ok, frame = self.cap.read()
-        # Grab a frame from the webcam (BGR image).
+        while True:
+            self.fresh.clear()
+            with self.lock:
+                vf, self.slot = self.slot, None
+                if vf is not None:
+                    self.lent, self.waiting = self.waiting, None
+                    # The consumer is done with the previous frame: its buffer is free again.
+            if vf is not None:
+                break
+            if self.error is not None:
+                raise self.error
+            await self.fresh.wait()
+            # Take the newest frame; if the thread hasn't produced one since last time, wait for it.
+
+        vf.pts, vf.time_base = pts, time_base
+        # Attach the timestamp info so the receiver plays it smoothly.
+
+        return vf
+        # Return the frame to aiortc; it will send it over the WebRTC connection.
+
+    def capture_loop(self, loop):
+        # Runs on the capture thread: read frames as fast as the camera delivers them.
+
+        try:
+            while not self.stopping.is_set():
+                try:
+                    vf = self.capture_frame()
+                except Exception as e:
+                    self.error = e
+                    break
+                    # recv() re-raises it on the event loop.
+
+                with self.lock:
+                    if self.slot is not None:
+                        self.dropped += 1
+                    self.slot, self.waiting = vf, self.writing
+                    # Overwrite, never queue: if sending falls behind, the stale frame is dropped.
+
+                loop.call_soon_threadsafe(self.fresh.set)
+                # Wake recv() on the event loop.
+        except RuntimeError:
+            pass
+            # The event loop was closed under us (program exiting).
+        finally:
+            self.cap.release()
+            if LOCAL_PREVIEW:
+                cv2.destroyAllWindows()
+            # Release the camera (and preview window) from the thread that uses them.
+            print(f"Camera capture stopped ({self.dropped} stale frames dropped)")
+            try:
+                loop.call_soon_threadsafe(self.fresh.set)
+            except RuntimeError:
+                pass
+
+    def free_buffer(self):
+        # A ring buffer nobody else holds (not waiting in the slot, not lent out).
+        with self.lock:
+            busy = (self.waiting, self.lent)
+        return next(i for i in range(RING_SIZE) if i not in busy)
+
+    def capture_frame(self):
+        # One camera frame -> VideoFrame wrapping a preallocated buffer.
+
+        if self.ring:
+            self.writing = self.free_buffer()
+        if CAPTURE_FORMAT == "yuv420p":
+            buf = self.bgr
+            # BGR is only a scratch buffer here: the ring holds the I420 planes.
+        else:
+            buf = self.ring[self.writing] if self.ring else None
+        ok, frame = self.cap.read(image=buf)
+        # Read straight into that buffer (OpenCV reuses it when the size matches).
 
         if not ok:
             raise RuntimeError("Camera read failed")
             # If reading failed, stop with an error.
 
+        captured = time.time()
+        # When the camera delivered it (travels with the frame as frame.opaque, for latency.py).
+
+        if not self.ring:
+            if CAPTURE_FORMAT == "yuv420p":
+                self.bgr = frame
+                self.ring = [cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420) for _ in range(RING_SIZE)]
+                # Planar I420 buffers (height * 3/2 rows).
+            else:
+                self.ring = [frame] + [frame.copy() for _ in range(RING_SIZE - 1)]
+            self.writing = 0
+            # First frame: now we know the size, allocate the ring once.
+
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
         # Create a text timestamp like "2025-10-16 12:34:56.789".
 
@@ -76,39 +233,109 @@ class CameraTrack(VideoStreamTrack):
                 raise RuntimeError("Sender preview quit")
                 # If you press 'q', stop the track (raises to exit).
 
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        # Convert OpenCV's BGR image to RGB (PyAV/aiortc expect RGB here).
+        if CAPTURE_FORMAT == "yuv420p":
+            yuv = self.ring[self.writing]
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=yuv)
+            # Convert BGR -> yuv420p into the ring buffer.
 
-        vf = VideoFrame.from_ndarray(frame_rgb, format="rgb24")
-        # Wrap the numpy array as a VideoFrame (24-bit RGB).
-
-        vf.pts, vf.time_base = pts, time_base
-        # Attach the timestamp info so the receiver plays it smoothly.
+            vf = VideoFrame.from_numpy_buffer(yuv, format="yuv420p")
+            # Wraps the buffer (no copy); the encoder gets its native format.
+        else:
+            vf = VideoFrame.from_numpy_buffer(frame, format="bgr24")
+            # Wraps OpenCV's BGR buffer directly (no copy, no intermediate RGB array).
 
+        vf.opaque = captured
         return vf
-        # Return the frame to aiortc; it will send it over the WebRTC connection.
 
-    async def stop(self):
-        # Called when the track is being stopped/cleaned up.
-        if self.cap: self.cap.release()
-        # Release the camera device.
+    def stop(self):
+        # Called when the track is being stopped/cleaned up (aiortc calls it synchronously).
+        super().stop()
+        # Let the parent do its cleanup too.
+
+        self.stopping.set()
+        # No join: we're on the event loop, and waiting out a camera read would stall RTCP
+        # and every other track. The (daemon) thread sees the flag after its current read,
+        # releases the camera itself and exits.
 
-        cv2.destroyAllWindows()
-        # Close any local preview window if it was open.
+        if self.thread is None and self.cap:
+            self.cap.release()
+            # Never started: release the camera device here.
+
+async def serve_simulcast(signaling):
+    # One capture, encoded once per layer; one peer connection per receiver in the room.
+
+    encoder = SimulcastEncoder(CameraTrack(CAMERA_ID))
+    viewers = {}
+    # receiver peer id -> (pc, ViewerTrack, AdaptiveController)
+
+    async def drop(peer):
+        pc, track, controller = viewers.pop(peer, (None, None, None))
+        if pc:
+            controller.stop()
+            await pc.close()
+            print(f"Sender: {peer} left ({len(viewers)} viewers)")
+
+    while True:
+        event = await signaling.next_event()
+        if event is None:
+            print("Sender: signaling ended"); break
+
+        kind, peer, obj = event
+        if kind == "join":
+            pc = RTCPeerConnection()
+            track = encoder.subscribe()
+            prefer_vp8(pc.addTransceiver(track, direction="sendonly"))
+            # This receiver's own track: packets of one layer, already encoded.
+
+            controller = AdaptiveController(pc.getTransceivers()[0].sender, track, peer, ladder=LAYER_LADDER)
+            viewers[peer] = (pc, track, controller)
+
+            await pc.setLocalDescription(await pc.createOffer())
+            await signaling.send(pc.localDescription, to=peer)
+            print(f"Sender: offer sent to {peer}")
+
+        elif kind == "message" and isinstance(obj, RTCSessionDescription) and peer in viewers:
+            pc, track, controller = viewers[peer]
+            await pc.setRemoteDescription(obj)
+            controller.start()
+            # Its bandwidth estimate now picks its layer ("[adapt] ..." / "[simulcast] ..." lines).
+            print(f"Sender: streaming to {peer} ({len(viewers)} viewers)")
+
+        elif kind == "leave" or obj is BYE:
+            await drop(peer)
+
+    for peer in list(viewers):
+        await drop(peer)
+    encoder.stop()
 
-        await super().stop()
-        # Let the parent do its cleanup too.
 
 async def main():
-    signaling = TcpSocketSignaling(HOST, PORT)
+    signaling = RelaySignaling(HOST, RELAY_PORT, ROOM, "sender") if ROOM else TcpSocketSignaling(HOST, PORT)
     # Create a signaling helper that connects to your TCP relay.
 
+    if SIMULCAST and ROOM:
+        await signaling.connect()
+        try:
+            await serve_simulcast(signaling)
+        finally:
+            await signaling.close()
+        return
+
     pc = RTCPeerConnection()
     # Create the WebRTC peer connection (your “sender” peer).
 
-    pc.addTrack(CameraTrack(CAMERA_ID))
+    track = CameraTrack(CAMERA_ID)
+    if ADAPTIVE:
+        track = AdaptiveVideoTrack(track)
+        # Wrap it so resolution/fps can be lowered at runtime.
+
+    video_sender = pc.addTrack(track)
     # Add your camera stream as an outgoing video track.
 
+    controller = None
+    tracer = SenderTracer(pc, video_sender) if TRACE else None
+    # Must exist before the offer: it adds the "latency" data channel to it.
+
     @pc.on("connectionstatechange")
     async def on_state():
         print("Sender state:", pc.connectionState)
@@ -124,8 +351,12 @@ async def main():
     await pc.setLocalDescription(offer)
     # Set that offer as our local description.
 
-    await signaling.send(pc.localDescription)
-    # Send the offer to the other side via the relay.
+    if ROOM and SFU:
+        await signaling.send(pc.localDescription, to="sfu")
+        # Publish to the SFU only; viewers get our video from it.
+    else:
+        await signaling.send(pc.localDescription)
+        # Send the offer to the other side via the relay.
 
     print("Sender: offer sent, waiting for answer…")
 
@@ -141,16 +372,27 @@ async def main():
             # Set the receiver’s ANSWER as our remote description.
 
             print("Sender: answer set; streaming…")
+
+            if ADAPTIVE:
+                controller = AdaptiveController(video_sender, track, "camera")
+                controller.start()
+                # From now on, RTCP feedback drives bitrate/resolution/fps ("[adapt] ..." lines).
             break
 
         if obj is None:
             print("Sender: signaling ended"); break
             # If signaling closed unexpectedly, exit.
 
+        if obj is BYE:
+            print("Sender: offer refused"); await pc.close(); break
+            # e.g. the SFU, which only takes VP8. No answer is coming; closing also ends the wait below.
+
     while pc.connectionState not in ("failed", "closed"):
         await asyncio.sleep(0.5)
         # Keep the program alive while the connection is up.
 
+    if controller: controller.stop()
+    if tracer: tracer.stop()
     await pc.close(); print("Sender closed")
     # Cleanly close when the connection ends.
 
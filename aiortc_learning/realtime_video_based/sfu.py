@@ -0,0 +1,246 @@
+# sfu.py — Selective Forwarding Unit: one publisher in, many viewers out, no re-encode
+#
+# WHAT THIS DOES
+# - Joins the relay (server.py) ROOM as peer "sfu".
+# - The publisher (sender.py with ROOM + SFU = True) sends its offer to "sfu":
+#   we answer with a receive-only connection and tap its ENCODED video frames
+#   (VP8, straight out of aiortc's jitter buffer). Nothing is decoded.
+# - A viewer (receiver.py with ROOM + SFU = True) sends SUBSCRIBE to "sfu" through the
+#   relay: we open a connection to it and send those same encoded frames as av.Packet,
+#   which aiortc only re-packetizes. UNSUBSCRIBE, BYE or leaving the room ends it.
+# - New viewers (and viewers that fell behind) start at a keyframe: we ask the
+#   publisher for one with an RTCP PLI.
+#
+# So the publisher's upload and CPU are the same for 1 or 500 viewers; the SFU does
+# per-viewer packetization + encryption only.
+#
+# HOW TO RUN
+#   python server.py      # relay
+#   python sfu.py
+#   python sender.py      # ROOM = "cam1", SFU = True
+#   python receiver.py    # ROOM = "cam1", SFU = True  (as many as you like)
+
+import asyncio
+import queue
+import time
+from fractions import Fraction
+
+import av
+from aiortc import MediaStreamTrack, RTCPeerConnection, RTCRtpSender, RTCSessionDescription
+from aiortc.contrib.signaling import BYE
+from aiortc.exceptions import OperationError
+from aiortc.mediastreams import MediaStreamError
+
+from relay_signaling import RelaySignaling
+
+HOST, RELAY_PORT = "127.0.0.1", 10000
+ROOM = "cam1"
+PEER_ID = "sfu"
+
+CODEC = "video/VP8"        # negotiated on both sides, so frames can be forwarded as they are
+VIEWER_QUEUE = 30          # frames a viewer may lag behind before it is resynced
+PLI_INTERVAL = 0.5         # seconds; at most one keyframe request to the publisher per interval
+TIME_BASE = Fraction(1, 90000)
+
+
+def prefer_codec(transceiver):
+    caps = RTCRtpSender.getCapabilities("video").codecs
+    transceiver.setCodecPreferences(
+        [c for c in caps if c.mimeType == CODEC] + [c for c in caps if c.mimeType == "video/rtx"]
+    )
+
+
+def is_keyframe(data):
+    # VP8 frame tag: lowest bit of the first byte is 0 for a keyframe
+    return len(data) > 0 and not data[0] & 0x01
+
+
+class TapQueue(queue.Queue):
+    """
+    Stands in for the receiver's decoder queue: encoded frames go to the SFU instead
+    of the decoder thread (which only ever sees the final None and exits).
+    """
+
+    def __init__(self, on_frame):
+        super().__init__()
+        self.on_frame = on_frame
+
+    def put(self, item, block=True, timeout=None):
+        if item is None:
+            super().put(item, block, timeout)
+            return
+        codec, frame = item
+        self.on_frame(frame.data, frame.timestamp)
+
+
+class ForwardTrack(MediaStreamTrack):
+    """One viewer: hands aiortc already-encoded frames (av.Packet)."""
+
+    kind = "video"
+
+    def __init__(self, sfu):
+        super().__init__()
+        self.sfu = sfu
+        self.queue = asyncio.Queue(maxsize=VIEWER_QUEUE)
+        self.waiting_keyframe = True
+
+    def push(self, data, timestamp, keyframe):
+        if self.waiting_keyframe:
+            if not keyframe:
+                return
+            self.waiting_keyframe = False
+        packet = av.Packet(data)
+        packet.pts, packet.time_base = timestamp, TIME_BASE
+        try:
+            self.queue.put_nowait(packet)
+        except asyncio.QueueFull:
+            # Fell behind: flush and restart from the next keyframe
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.waiting_keyframe = True
+            self.sfu.request_keyframe()
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        packet = await self.queue.get()
+        if packet is None:
+            self.stop()
+            raise MediaStreamError
+        return packet
+
+
+class Sfu:
+    def __init__(self, signaling):
+        self.signaling = signaling
+        self.publisher = None       # (peer id, pc, receiver)
+        self.viewers = {}           # peer id -> (pc, ForwardTrack)
+        self.last_pli = 0.0
+        self.forwarded = 0
+
+    # --- media ---------------------------------------------------------
+
+    def on_frame(self, data, timestamp):
+        keyframe = is_keyframe(data)
+        for _, track in list(self.viewers.values()):
+            track.push(data, timestamp, keyframe)
+        self.forwarded += 1
+
+    def request_keyframe(self):
+        if self.publisher is None or time.monotonic() - self.last_pli < PLI_INTERVAL:
+            return
+        self.last_pli = time.monotonic()
+        receiver = self.publisher[2]
+        for source in receiver.getSynchronizationSources():
+            asyncio.ensure_future(receiver._send_rtcp_pli(source.source))
+
+    # --- publisher -----------------------------------------------------
+
+    async def publish(self, peer, offer):
+        await self.unpublish()
+        pc = RTCPeerConnection()
+        # aiortc fixes the answer's codecs inside setRemoteDescription, from the preferences of
+        # the transceiver each m-line lands on: prefer VP8 on a receiving transceiver made up front.
+        video = pc.addTransceiver("video", direction="recvonly")
+        prefer_codec(video)
+
+        @pc.on("track")
+        def on_track(track):
+            if track is not video.receiver.track:
+                return   # audio, or another video m-line (not limited to VP8)
+            receiver = video.receiver
+            # aiortc has no API for encoded frames: swap its decoder queue for our tap
+            # (the decoder thread picks the queue up later, when the transport starts).
+            receiver._RTCRtpReceiver__decoder_queue = TapQueue(self.on_frame)
+            self.publisher = (peer, pc, receiver)
+
+        try:
+            await pc.setRemoteDescription(offer)
+        except OperationError:
+            # No VP8 in the offer: whatever it sent, VP8 viewers could not decode it
+            await pc.close()
+            await self.signaling.send(BYE, to=peer)
+            print(f"[sfu] {peer} offered no {CODEC}; rejected")
+            return
+        await pc.setLocalDescription(await pc.createAnswer())
+        await self.signaling.send(pc.localDescription, to=peer)
+        print(f"[sfu] publisher {peer} connected")
+        if self.publisher is None:
+            await pc.close()
+            print(f"[sfu] {peer} offered no video")
+
+    async def unpublish(self):
+        if self.publisher is not None:
+            peer, pc, _ = self.publisher
+            self.publisher = None
+            await pc.close()
+            print(f"[sfu] publisher {peer} gone")
+
+    # --- viewers -------------------------------------------------------
+
+    async def subscribe(self, peer):
+        await self.unsubscribe(peer)
+        pc = RTCPeerConnection()
+        track = ForwardTrack(self)
+        prefer_codec(pc.addTransceiver(track, direction="sendonly"))
+        sender = pc.getTransceivers()[0].sender
+        # The viewer's own PLIs (decoder lost the picture) become PLIs to the publisher
+        original = sender._send_keyframe
+        sender._send_keyframe = lambda: (original(), self.request_keyframe())
+
+        self.viewers[peer] = (pc, track)
+        await pc.setLocalDescription(await pc.createOffer())
+        await self.signaling.send(pc.localDescription, to=peer)
+        self.request_keyframe()
+        print(f"[sfu] {peer} subscribed ({len(self.viewers)} viewers)")
+
+    async def unsubscribe(self, peer):
+        pc, track = self.viewers.pop(peer, (None, None))
+        if pc is not None:
+            await pc.close()
+            print(f"[sfu] {peer} unsubscribed ({len(self.viewers)} viewers)")
+
+    # --- signaling loop ------------------------------------------------
+
+    async def run(self):
+        while True:
+            event = await self.signaling.next_event()
+            if event is None:
+                print("[sfu] relay gone")
+                break
+            kind, peer, obj = event
+            if kind == "subscribe":
+                await self.subscribe(peer)
+            elif kind == "unsubscribe":
+                await self.unsubscribe(peer)
+            elif kind == "leave" or (kind == "message" and obj is BYE):
+                await self.unsubscribe(peer)
+                if self.publisher and self.publisher[0] == peer:
+                    await self.unpublish()
+            elif kind == "message" and isinstance(obj, RTCSessionDescription):
+                if obj.type == "offer":
+                    await self.publish(peer, obj)
+                elif peer in self.viewers:
+                    await self.viewers[peer][0].setRemoteDescription(obj)
+                    # The viewer's answer: forwarding starts at the next keyframe.
+
+    async def close(self):
+        for peer in list(self.viewers):
+            await self.unsubscribe(peer)
+        await self.unpublish()
+
+
+async def main():
+    signaling = RelaySignaling(HOST, RELAY_PORT, ROOM, PEER_ID)
+    await signaling.connect()
+    sfu = Sfu(signaling)
+    print(f"[sfu] waiting in room {ROOM!r}")
+    try:
+        await sfu.run()
+    finally:
+        await sfu.close()
+        await signaling.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
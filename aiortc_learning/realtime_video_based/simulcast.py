@@ -0,0 +1,220 @@
+# simulcast.py — one capture, a few spatial layers, each viewer gets the layer it can take
+#
+# Without this, every viewer needs its own encode (or everyone gets the same quality).
+# Here:
+# - SimulcastEncoder reads each frame ONCE from the source track (CameraTrack),
+#   scales it to every LAYER (e.g. 1080p / 540p / 270p of a 1080p camera) and
+#   encodes each layer ONCE with its own VP8 encoder.
+# - Every viewer gets a ViewerTrack. It returns already-encoded av.Packet objects
+#   of ONE layer, so aiortc only packetizes them (no encode per viewer).
+# - The viewer's layer follows its bandwidth estimate: AdaptiveController (adaptive.py)
+#   runs with LAYER_LADDER and sets `track.scale`, which picks the matching layer.
+#   A switch waits for a keyframe of the new layer (requested right away), so the
+#   picture never breaks.
+#
+# (aiortc can't negotiate real RTP simulcast (rid / multiple encodings on one m-line),
+#  so the layers are selected here on the sending side, per viewer connection.)
+#
+#   simulcast = SimulcastEncoder(CameraTrack(0))
+#   track = simulcast.subscribe()          # per viewer; pc.addTrack(track)
+#   prefer_vp8(transceiver)                # the layers are VP8
+#   AdaptiveController(sender, track, "viewer", ladder=LAYER_LADDER).start()
+
+import asyncio
+
+import av
+from aiortc import MediaStreamTrack, RTCRtpSender
+from aiortc.mediastreams import MediaStreamError
+
+# (name, scale of the source, bitrate), best first
+LAYERS = [
+    ("high", 1.0, 2_500_000),
+    ("mid", 0.5, 800_000),
+    ("low", 0.25, 250_000),
+]
+GOP = 60                  # frames between keyframes (~2 s at 30 fps)
+VIEWER_QUEUE = 30         # packets a viewer may lag behind before it is resynced
+
+# AdaptiveController ladder: a viewer whose estimate covers a layer's bitrate gets that layer
+LAYER_LADDER = [(bitrate, scale, None) for _, scale, bitrate in LAYERS[:-1]] + [(0, LAYERS[-1][1], None)]
+
+
+def prefer_vp8(transceiver):
+    """Negotiate VP8 (+ RTX) only: the layers are VP8 packets."""
+    caps = RTCRtpSender.getCapabilities("video").codecs
+    transceiver.setCodecPreferences(
+        [c for c in caps if c.mimeType == "video/VP8"] + [c for c in caps if c.mimeType == "video/rtx"]
+    )
+
+
+class ViewerTrack(MediaStreamTrack):
+    kind = "video"
+
+    def __init__(self, encoder, layer):
+        super().__init__()
+        self.encoder = encoder
+        self.layer = layer           # index into LAYERS we are forwarding
+        self.pending = None          # layer we switch to on its next keyframe
+        self.waiting_keyframe = True
+        self.fps = None              # set by AdaptiveController; layers keep the source rate
+        self.queue = asyncio.Queue(maxsize=VIEWER_QUEUE)
+
+    @property
+    def scale(self):
+        return LAYERS[self.layer if self.pending is None else self.pending][1]
+
+    @scale.setter
+    def scale(self, scale):
+        # The largest layer not bigger than what the controller asks for
+        wanted = next((i for i, (_, s, _) in enumerate(LAYERS) if s <= scale), len(LAYERS) - 1)
+        self.select(wanted)
+
+    def select(self, layer):
+        if layer == (self.layer if self.pending is None else self.pending):
+            return
+        if layer == self.layer:
+            self.pending = None      # changed our mind before the switch happened
+            return
+        print(f"[simulcast] viewer -> {LAYERS[layer][0]}")
+        self.pending = layer
+        self.encoder.request_keyframe(layer)
+
+    def push(self, layer, packet):
+        """Called by SimulcastEncoder for every packet of every layer."""
+        if layer == self.pending and packet.is_keyframe:
+            self.layer, self.pending = layer, None
+            self.waiting_keyframe = False
+            # The new layer's keyframe: switch here, the decoder restarts at the new size.
+        if layer != self.layer:
+            return
+        if self.waiting_keyframe:
+            if not packet.is_keyframe:
+                return
+            self.waiting_keyframe = False
+        try:
+            self.queue.put_nowait(packet)
+        except asyncio.QueueFull:
+            # Fell behind: flush and restart from the next keyframe (dropping single
+            # inter-frames would corrupt the picture).
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.waiting_keyframe = True
+            self.encoder.request_keyframe(self.layer)
+
+    def end(self):
+        """No more packets: recv() raises MediaStreamError once the queue is drained."""
+        if self.queue.full():
+            self.queue.get_nowait()   # a dropped packet beats a viewer that never ends
+        self.queue.put_nowait(None)
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        packet = await self.queue.get()
+        if packet is None:
+            self.stop()
+            raise MediaStreamError
+        return packet
+
+    def stop(self):
+        super().stop()
+        if self.encoder is not None:
+            self.encoder.unsubscribe(self)
+            self.encoder = None
+
+
+class SimulcastEncoder:
+    def __init__(self, source, layers=LAYERS):
+        self.source = source
+        self.layers = layers
+        self.codecs = [None] * len(layers)
+        self.force_keyframe = [True] * len(layers)
+        self.viewers = set()
+        self.task = None
+
+    def subscribe(self, layer=None):
+        """New ViewerTrack; starts on the lowest layer unless told otherwise (fast first frame)."""
+        layer = len(self.layers) - 1 if layer is None else layer
+        track = ViewerTrack(self, layer)
+        self.viewers.add(track)
+        self.request_keyframe(layer)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+        return track
+
+    def unsubscribe(self, track):
+        self.viewers.discard(track)
+
+    def request_keyframe(self, layer):
+        self.force_keyframe[layer] = True
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.source.stop()
+
+    def _open_codec(self, layer, width, height, time_base):
+        codec = av.CodecContext.create("libvpx", "w")
+        codec.options = {"deadline": "realtime", "cpu-used": "-6", "lag-in-frames": "0"}
+        codec.width, codec.height = width, height
+        codec.pix_fmt = "yuv420p"
+        codec.bit_rate = self.layers[layer][2]
+        codec.gop_size = GOP
+        codec.time_base = time_base
+        return codec
+
+    def _scale(self, frame, needed):
+        """One frame per needed layer. Done serially: PyAV frames must not be reformatted concurrently."""
+        frames = {}
+        for layer in needed:
+            scale = self.layers[layer][1]
+            width = max(2, int(frame.width * scale) & ~1)
+            height = max(2, int(frame.height * scale) & ~1)
+            frames[layer] = frame.reformat(width=width, height=height, format="yuv420p")
+        return frames
+
+    def _encode(self, layer, frame, pts, time_base, force_keyframe):
+        """Runs in a worker thread; each layer has its own codec and frame."""
+        codec = self.codecs[layer]
+        if codec is None or (codec.width, codec.height) != (frame.width, frame.height):
+            codec = self.codecs[layer] = self._open_codec(layer, frame.width, frame.height, time_base)
+            force_keyframe = True
+        frame.pts, frame.time_base = pts, time_base
+        if force_keyframe:
+            frame.pict_type = av.video.frame.PictureType.I
+        packets = codec.encode(frame)
+        for packet in packets:
+            # aiortc's packer reads pts/time_base to build the RTP timestamp
+            packet.pts, packet.time_base = pts, time_base
+        return packets
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    frame = await self.source.recv()
+                except MediaStreamError:
+                    break
+
+                # Only encode layers somebody watches (or is switching to)
+                needed = sorted({v.layer for v in self.viewers}
+                                | {v.pending for v in self.viewers if v.pending is not None})
+                if not needed:
+                    continue
+                frames = await loop.run_in_executor(None, self._scale, frame, needed)
+
+                jobs = []
+                for layer in needed:
+                    force, self.force_keyframe[layer] = self.force_keyframe[layer], False
+                    jobs.append(loop.run_in_executor(
+                        None, self._encode, layer, frames[layer], frame.pts, frame.time_base, force))
+                # All layers encode in parallel worker threads
+                for layer, packets in zip(needed, await asyncio.gather(*jobs)):
+                    for packet in packets:
+                        for viewer in list(self.viewers):
+                            viewer.push(layer, packet)
+        finally:
+            for viewer in list(self.viewers):
+                viewer.end()
@@ -0,0 +1,368 @@
+# bench_transport.py — ZeroMQ JPEG frames vs aiortc WebRTC, same clip, over loopback
+#
+# WHAT THIS DOES
+# - Makes a synthetic clip per resolution (ffmpeg's testsrc2 -> H.264 mp4, cached in
+#   --clip-dir) so both transports start from the very same file.
+# - Streams it through each transport, sender and receiver in their own processes:
+#     zmq    : cv2.VideoCapture -> imencode(".jpg", quality) -> PUSH  ~~>  PULL -> imdecode
+#              (what producer.py / consumer.py do, minus the window; framing.py headers)
+#     aiortc : MediaPlayer -> VP8 -> RTP/SRTP over UDP  ~~>  decode -> bgr24 ndarray
+#              (what ofline_video_based/sender.py / receiver.py do; signaling over a pipe)
+#   Both senders are paced to the clip's frame rate; receivers decode to BGR and stop there.
+# - Per run: received fps, end-to-end latency (source frame read -> decoded at the
+#   receiver, same machine so one clock), CPU % of one core per side, payload bytes
+#   (JPEG bytes / RTP payload bytes) and Mbit/s, loopback interface bytes (headers
+#   included, needs psutil, counts anything else on lo too), peak RSS per side.
+# - Matrix: every resolution x every JPEG quality for zmq; quality doesn't apply to
+#   aiortc (its bitrate is set by congestion control), so it runs once per resolution.
+#
+# HOW TO RUN
+#   python bench_transport.py [--resolutions 640x360,1280x720,1920x1080 --qualities 50,80,95
+#                              --seconds 10 --fps 30 --json results.json]
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from fractions import Fraction
+
+ZMQ_PORT = 5599
+VIDEO_TIME_BASE = Fraction(1, 90000)
+WARMUP = 1.0        # seconds at the start of every run left out of fps / latency
+GRACE = 5.0         # extra seconds a receiver waits for the end of the stream
+
+try:
+    import psutil   # optional: loopback byte counters
+except ImportError:
+    psutil = None
+
+
+def make_clip(path, width, height, fps, seconds):
+    """testsrc2 at width x height, `seconds` long, H.264 (every transport decodes the same bits)."""
+    import av
+    if os.path.exists(path):
+        return path
+    src = av.open(f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}", format="lavfi")
+    out = av.open(path, "w")
+    stream = out.add_stream("libx264", rate=fps)
+    stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+    stream.options = {"preset": "veryfast", "crf": "18"}
+    for frame in src.decode(video=0):
+        out.mux(stream.encode(frame.reformat(format="yuv420p")))
+    out.mux(stream.encode())
+    out.close()
+    src.close()
+    print(f"[bench] made {path}")
+    return path
+
+
+def peak_rss():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024   # KiB on Linux
+    except ImportError:
+        return psutil.Process().memory_info().peak_wset if psutil else None  # Windows
+
+
+def usage(started_cpu, started):
+    """CPU % of one core since (process_time, perf_counter) and peak RSS, for the result dict."""
+    return {"cpu_pct": (time.process_time() - started_cpu) / (time.perf_counter() - started) * 100,
+            "rss": peak_rss()}
+
+
+# ---------------------------------------------------------------------------
+# ZeroMQ: JPEG per frame over PUSH/PULL
+# ---------------------------------------------------------------------------
+
+def zmq_sender(clip, quality, fps, ready, results):
+    import cv2
+    import zmq
+    import framing
+
+    ctx = zmq.Context()
+    push = ctx.socket(zmq.PUSH)
+    push.bind(f"tcp://127.0.0.1:{ZMQ_PORT}")
+    cap = cv2.VideoCapture(clip)
+    ready.wait()                      # receiver connected: nothing gets queued before it
+    started, started_cpu = time.perf_counter(), time.process_time()
+    frames = sent_bytes = 0
+    next_at = time.monotonic()
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        read_at = time.time()
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            continue
+        data = encoded.tobytes()
+        height, width = frame.shape[:2]
+        push.send_multipart([framing.pack(frames, width, height, framing.JPEG, read_at), data])
+        frames += 1
+        sent_bytes += len(data)
+        next_at += 1 / fps            # deadline pacing: encode time doesn't stretch the interval
+        time.sleep(max(next_at - time.monotonic(), 0))
+    push.send_multipart([framing.pack_end(frames), b""])
+    results.put(("sender", dict(usage(started_cpu, started), frames=frames, payload_bytes=sent_bytes)))
+    cap.release()
+    push.close(linger=2000)
+    ctx.term()
+
+
+def zmq_receiver(timeout, ready, results):
+    import cv2
+    import numpy as np
+    import zmq
+    import framing
+
+    ctx = zmq.Context()
+    pull = ctx.socket(zmq.PULL)
+    pull.connect(f"tcp://127.0.0.1:{ZMQ_PORT}")
+    pull.RCVTIMEO = int(timeout * 1000)
+    ready.wait()
+    started, started_cpu = time.perf_counter(), time.process_time()
+    stamps = []                       # (read at sender, decoded here)
+    while True:
+        try:
+            raw_header, data = pull.recv_multipart()
+        except zmq.Again:
+            break
+        header = framing.unpack(raw_header)
+        if header.kind == framing.END:
+            break
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            stamps.append((header.captured, time.time()))
+    results.put(("receiver", dict(usage(started_cpu, started), stamps=stamps)))
+    pull.close()
+    ctx.term()
+
+
+# ---------------------------------------------------------------------------
+# aiortc: WebRTC (VP8 over RTP) with MediaPlayer as the source
+# ---------------------------------------------------------------------------
+
+def _restamp(track, stamps):
+    """Number the player's frames 0, 1, 2... on the 90 kHz clock and remember when each was read.
+    The receiver's pts is the RTP timestamp rebased to its first packet: the same clock, give or
+    take a tick of rounding in the encoder, so frames are matched by index (see frame_index)."""
+    recv = track.recv
+    count = 0
+
+    async def restamped_recv():
+        nonlocal count
+        frame = await recv()
+        frame.pts = round(count / track.fps / VIDEO_TIME_BASE)
+        frame.time_base = VIDEO_TIME_BASE
+        stamps[count] = time.time()
+        count += 1
+        return frame
+
+    track.recv = restamped_recv
+
+
+async def _aiortc_sender(clip, fps, conn, results):
+    from aiortc import RTCPeerConnection, RTCSessionDescription
+    from aiortc.contrib.media import MediaPlayer
+    from aiortc.mediastreams import MediaStreamError
+
+    player = MediaPlayer(clip)
+    player.video.fps = fps
+    stamps = {}
+    _restamp(player.video, stamps)
+    pc = RTCPeerConnection()
+    sender = pc.addTrack(player.video)
+    ended = asyncio.Event()
+    recv = player.video.recv
+
+    async def watching_recv():
+        try:
+            return await recv()
+        except MediaStreamError:
+            ended.set()               # clip over
+            raise
+
+    player.video.recv = watching_recv
+    await pc.setLocalDescription(await pc.createOffer())
+    conn.send({"sdp": pc.localDescription.sdp, "type": pc.localDescription.type})
+    loop = asyncio.get_running_loop()
+    answer = await loop.run_in_executor(None, conn.recv)
+    started, started_cpu = time.perf_counter(), time.process_time()
+    await pc.setRemoteDescription(RTCSessionDescription(**answer))
+    await ended.wait()
+    sent = sum(s.bytesSent for s in (await sender.getStats()).values() if s.type == "outbound-rtp")
+    result = dict(usage(started_cpu, started), frames=len(stamps), payload_bytes=sent,
+                  sent_at={str(index): t for index, t in stamps.items()})
+    await pc.close()                  # RTCP BYE: ends the receiver's track
+    results.put(("sender", result))
+
+
+async def _aiortc_receiver(timeout, conn, results):
+    from aiortc import RTCPeerConnection, RTCSessionDescription
+    from aiortc.mediastreams import MediaStreamError
+
+    pc = RTCPeerConnection()
+    done = asyncio.Event()
+    decoded = []                      # (pts, decoded here)
+
+    async def consume(track):
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                break
+            frame.to_ndarray(format="bgr24")   # same end point as imdecode
+            decoded.append((frame.pts, time.time()))
+        done.set()
+
+    @pc.on("track")
+    def on_track(track):
+        asyncio.ensure_future(consume(track))
+
+    loop = asyncio.get_running_loop()
+    offer = await loop.run_in_executor(None, conn.recv)
+    started, started_cpu = time.perf_counter(), time.process_time()
+    await pc.setRemoteDescription(RTCSessionDescription(**offer))
+    await pc.setLocalDescription(await pc.createAnswer())
+    conn.send({"sdp": pc.localDescription.sdp, "type": pc.localDescription.type})
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        print("[bench] aiortc receiver timed out")
+    results.put(("receiver", dict(usage(started_cpu, started), decoded=decoded)))
+    await pc.close()
+
+
+def aiortc_sender(clip, fps, conn, results):
+    asyncio.run(_aiortc_sender(clip, fps, conn, results))
+
+
+def aiortc_receiver(timeout, conn, results):
+    asyncio.run(_aiortc_receiver(timeout, conn, results))
+
+
+# ---------------------------------------------------------------------------
+# Runs and the matrix
+# ---------------------------------------------------------------------------
+
+def frame_index(pts, fps):
+    return str(round(pts * VIDEO_TIME_BASE * fps))
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def loopback_bytes():
+    if psutil is None:
+        return None
+    counters = psutil.net_io_counters(pernic=True)
+    lo = counters.get("lo") or counters.get("lo0") or next(
+        (c for name, c in counters.items() if "loopback" in name.lower()), None)
+    return lo.bytes_sent if lo else None
+
+
+def run(transport, clip, quality, args):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    timeout = args.seconds + GRACE
+    if transport == "zmq":
+        ready = ctx.Barrier(2)
+        procs = [ctx.Process(target=zmq_sender, args=(clip, quality, args.fps, ready, results)),
+                 ctx.Process(target=zmq_receiver, args=(timeout, ready, results))]
+    else:
+        sender_end, receiver_end = ctx.Pipe()
+        procs = [ctx.Process(target=aiortc_sender, args=(clip, args.fps, sender_end, results)),
+                 ctx.Process(target=aiortc_receiver, args=(timeout, receiver_end, results))]
+    lo_before = loopback_bytes()
+    for proc in procs:
+        proc.start()
+    sides = dict(results.get(timeout=timeout + 30) for _ in procs)
+    for proc in procs:
+        proc.join(timeout=10)
+    lo_after = loopback_bytes()
+    sender, receiver = sides["sender"], sides["receiver"]
+
+    if transport == "zmq":
+        stamps = receiver["stamps"]
+    else:
+        sent_at = sender["sent_at"]
+        stamps = [(sent_at[frame_index(pts, args.fps)], t) for pts, t in receiver["decoded"]
+                  if frame_index(pts, args.fps) in sent_at]
+    if not stamps:
+        return None
+    first = stamps[0][1]
+    steady = [(s, r) for s, r in stamps if r - first >= WARMUP] or stamps
+    latency = [(r - s) * 1000 for s, r in steady]
+    span = steady[-1][1] - steady[0][1]
+    return {
+        "transport": transport,
+        "resolution": os.path.basename(clip).split("_")[1],
+        "quality": quality,
+        "frames_sent": sender["frames"],
+        "frames_received": len(stamps),
+        "fps": (len(steady) - 1) / span if span > 0 else float("nan"),
+        "latency_p50_ms": percentile(latency, 50),
+        "latency_p95_ms": percentile(latency, 95),
+        "latency_max_ms": max(latency),
+        "sender_cpu_pct": sender["cpu_pct"],
+        "receiver_cpu_pct": receiver["cpu_pct"],
+        "payload_mb": sender["payload_bytes"] / 1e6,
+        "payload_mbps": sender["payload_bytes"] * 8 / 1e6 / args.seconds,
+        "loopback_mb": (lo_after - lo_before) / 1e6 if lo_before is not None else None,
+        "sender_rss_mb": sender["rss"] / 2**20 if sender["rss"] else None,
+        "receiver_rss_mb": receiver["rss"] / 2**20 if receiver["rss"] else None,
+    }
+
+
+def print_row(r):
+    optional = lambda v: f"{v:8.1f}" if v is not None else f"{'n/a':>8}"
+    print(f"{r['transport']:>7} {r['resolution']:>10} {str(r['quality'] or '-'):>4} "
+          f"{r['frames_received']:>5}/{r['frames_sent']:<5} {r['fps']:6.1f} "
+          f"{r['latency_p50_ms']:7.1f} {r['latency_p95_ms']:7.1f} "
+          f"{r['sender_cpu_pct']:7.1f} {r['receiver_cpu_pct']:7.1f} "
+          f"{r['payload_mb']:8.1f} {r['payload_mbps']:7.1f} {optional(r['loopback_mb'])} "
+          f"{optional(r['sender_rss_mb'])} {optional(r['receiver_rss_mb'])}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--resolutions", default="640x360,1280x720,1920x1080")
+    ap.add_argument("--qualities", default="50,80,95", help="JPEG qualities (zmq only)")
+    ap.add_argument("--transports", default="zmq,aiortc")
+    ap.add_argument("--seconds", type=float, default=10.0, help="clip length")
+    ap.add_argument("--fps", type=int, default=30)
+    ap.add_argument("--clip-dir", default="bench_clips")
+    ap.add_argument("--json", help="also write every row to this file")
+    args = ap.parse_args()
+
+    os.makedirs(args.clip_dir, exist_ok=True)
+    rows = []
+    print(f"{'':>7} {'res':>10} {'q':>4} {'recv/sent':>11} {'fps':>6} {'lat50':>7} {'lat95':>7} "
+          f"{'cpu tx':>7} {'cpu rx':>7} {'MB':>8} {'Mbit/s':>7} {'lo MB':>8} {'rss tx':>8} {'rss rx':>8}")
+    for resolution in args.resolutions.split(","):
+        width, height = map(int, resolution.split("x"))
+        clip = make_clip(os.path.join(args.clip_dir, f"testsrc2_{resolution}_{args.fps}fps_{args.seconds:g}s.mp4"),
+                         width, height, args.fps, args.seconds)
+        for transport in args.transports.split(","):
+            qualities = [int(q) for q in args.qualities.split(",")] if transport == "zmq" else [None]
+            for quality in qualities:
+                row = run(transport, clip, quality, args)
+                if row is None:
+                    print(f"[bench] {transport} {resolution} q={quality}: nothing received")
+                    continue
+                print_row(row)
+                rows.append(row)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"[bench] {len(rows)} rows written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
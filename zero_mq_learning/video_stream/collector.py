@@ -0,0 +1,148 @@
+# collector.py — the sink behind parallel consumers: results back in frame order
+#
+#   producer.py (PUSH :5555) --> consumer.py x N (SINK set) --> collector.py (PULL :5556)
+#
+# Workers finish frames out of order (frames are round-robined, some take longer),
+# so results arrive shuffled. Every result carries the frame's header (framing.py);
+# we hold results in a reorder buffer and release them strictly by seq.
+# The buffer is bounded:
+# - at most WINDOW results wait for a missing one; beyond that the missing seq is given up,
+# - a missing seq is also given up after MAX_WAIT seconds (a worker died / a frame failed),
+# - a result for a seq already given up (or already released) is dropped as late.
+# END (forwarded by whichever worker got it) says how many frames there were; we stop once
+# every seq before it was released or given up.
+
+# --- Imports
+import time
+import cv2
+import numpy as np
+import zmq
+import framing
+
+BIND = "tcp://*:5556"
+WINDOW = 32          # results held waiting for a missing seq
+MAX_WAIT = 0.5       # seconds a missing seq may hold everything up
+SHOW = True          # show the in-order results in a window (False: stats only)
+REPORT_EVERY = 1.0   # seconds between stats lines
+
+
+class Reorderer:
+    """Reorder buffer keyed by seq: push() results as they come, pop_ready() them in order."""
+
+    def __init__(self, window=WINDOW, max_wait=MAX_WAIT):
+        self.window = window
+        self.max_wait = max_wait
+        self.next_seq = None     # the seq we release next
+        self.buffer = {}         # seq -> (header, payload)
+        self.waiting_since = None  # when we started waiting for next_seq
+        self.highest = -1
+        self.reordered = 0       # arrived after a higher seq
+        self.skipped = 0         # seqs given up on
+        self.late = 0            # arrived after being given up / released
+
+    def push(self, header, payload):
+        seq = header.seq
+        if self.next_seq is None:
+            # --- first result: start at 0, unless we joined a stream already running
+            self.next_seq = 0 if seq < self.window else seq
+        if seq < self.next_seq or seq in self.buffer:
+            self.late += 1
+            return
+        if seq < self.highest:
+            self.reordered += 1
+        self.highest = max(self.highest, seq)
+        self.buffer[seq] = (header, payload)
+
+    def pop_ready(self, now=None):
+        """Results that can be released now, in seq order (skipping seqs waited on for too long)."""
+        now = time.monotonic() if now is None else now
+        ready = []
+        while self.buffer:
+            if self.next_seq in self.buffer:
+                ready.append(self.buffer.pop(self.next_seq))
+                self.next_seq += 1
+                self.waiting_since = None
+                continue
+            # --- next_seq is missing: wait for it, up to WINDOW results or MAX_WAIT seconds
+            if self.waiting_since is None:
+                self.waiting_since = now
+            if len(self.buffer) < self.window and now - self.waiting_since < self.max_wait:
+                break
+            oldest = min(self.buffer)
+            self.skipped += oldest - self.next_seq
+            self.next_seq = oldest
+            self.waiting_since = None
+        return ready
+
+    def finish(self, end_seq):
+        """After END: give up on whatever is still missing before end_seq. -> the rest, in order."""
+        ready = []
+        for seq in sorted(self.buffer):
+            ready.append(self.buffer.pop(seq))
+        if self.next_seq is not None and end_seq > self.next_seq:
+            self.skipped += end_seq - self.next_seq - len(ready)
+        self.next_seq = end_seq
+        return ready
+
+
+def main():
+    ctx = zmq.Context()
+    pull = ctx.socket(zmq.PULL)
+    pull.bind(BIND)
+    poller = zmq.Poller()
+    poller.register(pull, zmq.POLLIN)
+
+    reorder = Reorderer()
+    end_seq = None
+    end_at = None
+    released = 0
+    latencies = []
+    last_report = time.monotonic()
+    print(f"Collecting on {BIND} (window {WINDOW}, max wait {MAX_WAIT:g}s)...")
+
+    while True:
+        # --- Wake up at least every 50 ms so a missing seq is given up on time
+        if poller.poll(50):
+            raw_header, payload = pull.recv_multipart()
+            header = framing.unpack(raw_header)
+            if header.kind == framing.END:
+                end_seq, end_at = header.seq, time.monotonic()
+                print(f"END: {end_seq} frames were sent.")
+            else:
+                reorder.push(header, payload)
+
+        ready = reorder.pop_ready()
+        done = end_seq is not None and (reorder.next_seq is None or reorder.next_seq >= end_seq
+                                        or time.monotonic() - end_at > MAX_WAIT)
+        if done:
+            ready += reorder.finish(end_seq)
+
+        for header, payload in ready:
+            released += 1
+            latencies.append((time.time() - header.captured) * 1000)
+            if SHOW and header.codec == framing.JPEG:
+                cv2.imshow("Collected", cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR))
+        if SHOW and ready and cv2.waitKey(1) & 0xFF == ord('q'):
+            print("User requested quit. Exiting.")
+            break
+
+        now = time.monotonic()
+        if done or now - last_report >= REPORT_EVERY:
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] if latencies else float("nan")
+            print(f"[collector] {released} in order ({released / max(now - last_report, 1e-6):.1f}/s), "
+                  f"latency p50 {p50:.0f} ms, reordered {reorder.reordered}, skipped {reorder.skipped}, "
+                  f"late {reorder.late}, buffered {len(reorder.buffer)}")
+            released, latencies, last_report = 0, [], now
+        if done:
+            print("All frames accounted for. Exiting.")
+            break
+
+    if SHOW:
+        cv2.destroyAllWindows()
+    pull.close()
+    ctx.term()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
 # worker_display.py
+# --- Two ways to run it:
+#   SINK = None  : display the stream in a window (one consumer)
+#   SINK = "tcp://localhost:5556" : headless analytics worker. Start as many as you like;
+#                  PUSH round-robins frames between them, each one processes its frames and
+#                  PUSHes [header, result] to collector.py, which puts them back in order.
+# Messages are [header, payload] (see framing.py).
+
 # --- Imports
 import cv2          # OpenCV for decoding/Display
 import numpy as np  # Needed to convert bytes back into an array
 import zmq          # ZeroMQ for messaging
+import framing      # the [header, payload] message format
+
+SINK = None         # e.g. "tcp://localhost:5556" (collector.py) to run as an analytics worker
+IDLE_EXIT = 5.0     # worker mode: seconds without frames, once they started, before giving up
+                    # (END reaches one worker only)
+THUMB_WIDTH = 320   # worker mode: width of the processed result sent to the collector
 
 # --- Create a ZeroMQ context
 ctx = zmq.Context()
@@ -13,29 +26,61 @@ pull = ctx.socket(zmq.PULL)
 # --- Connect to the producer. If running on same machine, localhost is fine.
 pull.connect("tcp://localhost:5555")
 
-print("Waiting for frames... Press 'q' in the video window to quit.")
+# --- Worker mode: a PUSH socket back to the collector
+sink = None
+if SINK:
+    sink = ctx.socket(zmq.PUSH)
+    sink.connect(SINK)
 
-while True:
-    # --- Receive one message (bytes). This blocks until a message arrives.
-    msg = pull.recv()
 
-    # --- Check for END marker (tells us to stop gracefully)
-    if msg == b"END":
-        print("Received END. Exiting.")
+def process(header, frame):
+    # --- The "analytics": here a thumbnail stamped with its mean brightness. Put real work here.
+    scale = THUMB_WIDTH / frame.shape[1]
+    thumb = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    cv2.putText(thumb, f"#{header.seq} mean {frame.mean():.0f}", (8, 24),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    ok, encoded = cv2.imencode(".jpg", thumb, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    height, width = thumb.shape[:2]
+    # --- same seq and capture time: the collector orders and times by them
+    return [framing.pack(header.seq, width, height, framing.JPEG, header.captured), encoded.tobytes()]
+
+
+print("Waiting for frames..." + (f" Results go to {SINK}." if sink else " Press 'q' in the video window to quit."))
+
+processed = 0
+while True:
+    # --- Receive one message ([header, payload]). This blocks until a message arrives.
+    try:
+        raw_header, payload = pull.recv_multipart()
+    except zmq.Again:
+        print(f"No frames for {IDLE_EXIT:g}s. Exiting after {processed} frames.")
         break
+    header = framing.unpack(raw_header)
+    if sink and pull.RCVTIMEO < 0:
+        # --- The idle timeout starts with the first frame: workers may wait for the producer forever
+        pull.RCVTIMEO = int(IDLE_EXIT * 1000)
 
-    # --- Convert raw JPEG bytes back to a NumPy array buffer
-    jpg_array = np.frombuffer(msg, dtype=np.uint8)
+    # --- Check for END (tells us to stop gracefully; the collector needs it too)
+    if header.kind == framing.END:
+        if sink:
+            sink.send_multipart([raw_header, payload])
+        print(f"Received END after {processed} frames. Exiting.")
+        break
 
-    # --- Decode the JPEG bytes into an actual image (BGR)
-    frame = cv2.imdecode(jpg_array, cv2.IMREAD_COLOR)
-    frame = cv2.resize(frame, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    # --- Convert raw JPEG bytes back to a NumPy array buffer, and decode into an image (BGR)
+    frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
 
     # --- If decoding failed, skip
     if frame is None:
         continue
+    processed += 1
+
+    if sink:
+        sink.send_multipart(process(header, frame))
+        continue
 
     # --- Show the frame in a window titled "Stream"
+    frame = cv2.resize(frame, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
     cv2.imshow("Stream", frame)
 
     # --- waitKey(1): process window events; also lets us detect 'q' to quit
@@ -44,6 +89,9 @@ while True:
         break
 
 # --- Cleanup windows and sockets
-cv2.destroyAllWindows()
 pull.close()
+if sink:
+    sink.close()
+else:
+    cv2.destroyAllWindows()
 ctx.term()
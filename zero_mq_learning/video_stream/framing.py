@@ -0,0 +1,51 @@
+# framing.py — the small binary header in front of every video message
+#
+# Every message is two ZeroMQ frames (multipart):  [header, payload]
+#
+#   header (20 bytes, network byte order):
+#     version   u8    HEADER_VERSION
+#     kind      u8    FRAME, or END (no more frames; seq = how many frames were sent)
+#     codec     u8    what the payload is: JPEG / PNG / BGR (raw HxWx3 bytes) / DATA (anything else)
+#     (pad)     u8
+#     seq       u32   frame number, from 0, in capture order
+#     captured  u64   capture time, µs since the epoch (time.time())
+#     width     u16
+#     height    u16
+#
+# With several PULL workers frames are round-robined and finish out of order;
+# seq + captured is what lets collector.py put them back in order and measure latency.
+# A magic payload (b"END") can't be told apart from data; END is a header kind instead.
+
+import struct
+import time
+from collections import namedtuple
+
+HEADER_VERSION = 1
+HEADER = struct.Struct("!BBBxIQHH")
+
+FRAME, END = 0, 1
+JPEG, PNG, BGR, DATA = 1, 2, 3, 4
+CODEC_NAMES = {JPEG: "jpeg", PNG: "png", BGR: "bgr", DATA: "data"}
+
+Header = namedtuple("Header", "kind codec seq captured width height")
+
+
+def pack(seq, width, height, codec=JPEG, captured=None, kind=FRAME):
+    """Header bytes. `captured` is time.time() seconds (now if None)."""
+    captured = time.time() if captured is None else captured
+    return HEADER.pack(HEADER_VERSION, kind, codec, seq & 0xFFFFFFFF, int(captured * 1e6), width, height)
+
+
+def pack_end(frames):
+    """The END header: `frames` frames were sent (seq 0 .. frames - 1)."""
+    return pack(frames, 0, 0, codec=DATA, kind=END)
+
+
+def unpack(data):
+    """Header bytes -> Header (captured back in time.time() seconds). ValueError if it isn't one."""
+    if len(data) != HEADER.size:
+        raise ValueError(f"not a frame header ({len(data)} bytes)")
+    version, kind, codec, seq, captured, width, height = HEADER.unpack(data)
+    if version != HEADER_VERSION:
+        raise ValueError(f"unsupported header version {version}")
+    return Header(kind, codec, seq, captured / 1e6, width, height)
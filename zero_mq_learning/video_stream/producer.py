@@ -1,8 +1,35 @@
 # producer_video.py
+# --- Pipelined version: the three jobs of a frame run at the same time, on different frames
+#
+#   [reader thread]  cap.read() frame N+k ... submits "encode frame N+k" to the pool
+#   [encoder pool]   ENCODERS threads, each cv2.imencode()-ing one frame (OpenCV releases
+#                    the GIL while it encodes, so the threads really use several cores)
+#   [main thread]    the sequencer: takes the encodes back IN FRAME ORDER, waits for the
+#                    frame's send time on a monotonic clock, and push.send()s it
+#
+# A frame now costs max(read, encode / ENCODERS, send) instead of read + encode + send,
+# and the pacing is "frame N goes out at start + N / fps": encode time no longer adds
+# to every frame interval, and a late frame is sent right away (catch-up) instead of
+# pushing every later frame back.
+#
+# Every message is [header, JPEG bytes] (framing.py): sequence number, capture time,
+# width/height and codec, so parallel consumers + collector.py can restore order.
+
 # --- Imports we need
 import cv2          # OpenCV for reading/encoding video frames
 import zmq          # ZeroMQ for messaging
-import time         # tiny sleeps (optional) to throttle sending
+import time         # monotonic clock for pacing
+import queue        # bounded hand-off between the reader and the sequencer
+import threading    # the reader runs next to the sequencer
+from concurrent.futures import ThreadPoolExecutor   # the encoder pool
+import framing      # the [header, payload] message format
+
+# --- Settings
+VIDEO_PATH = "video/sample.mp4"   # put your video under a 'video' folder
+JPEG_QUALITY = 80
+ENCODERS = 4                      # encoder threads (about the number of cores to spare)
+IN_FLIGHT = 8                     # frames read but not yet sent; the reader waits beyond this
+RESIZE = None                     # e.g. (640, 360) to reduce bandwidth (done by the encoders)
 
 # --- Create a ZeroMQ context (shared resources for sockets)
 ctx = zmq.Context()
@@ -13,9 +40,6 @@ push = ctx.socket(zmq.PUSH)
 # --- Bind the socket so workers can connect to us on TCP port 5555
 push.bind("tcp://*:5555")
 
-# --- Path to your video file (put your video under a 'video' folder)
-VIDEO_PATH = "video/sample.mp4"
-
 # --- Open the video with OpenCV
 cap = cv2.VideoCapture(VIDEO_PATH)
 
@@ -26,43 +50,92 @@ if not cap.isOpened():
 
 # --- Optional: read FPS from file (may be 0 if unknown); fallback to 25
 fps = cap.get(cv2.CAP_PROP_FPS) or 25
-delay = 1.0 / fps   # delay between frames to roughly match source FPS
+interval = 1.0 / fps   # time between frame send times
+
+
+def encode(seq, captured, frame):
+    # --- Runs on an encoder thread: (optional) resize, then [header, JPEG bytes] (None if it failed)
+    if RESIZE:
+        frame = cv2.resize(frame, RESIZE, interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        return None
+    height, width = frame.shape[:2]
+    return [framing.pack(seq, width, height, framing.JPEG, captured), encoded.tobytes()]
+
+
+# --- Encodes in flight, oldest first. Bounded: when the encoders or the network fall
+#     behind, the reader blocks here instead of decoding the whole file into memory.
+pending = queue.Queue(maxsize=IN_FLIGHT)
+stop = threading.Event()
 
-print("Streaming frames... Press Ctrl+C to stop.")
+
+def reader(pool):
+    # --- Stage 1: decode frames and hand each one to the pool; None marks the end
+    seq = 0
+    try:
+        while not stop.is_set():
+            ok, frame = cap.read()
+            if not ok:
+                break
+            # --- blocks while IN_FLIGHT frames are pending
+            pending.put(pool.submit(encode, seq, time.time(), frame))
+            seq += 1
+    finally:
+        pending.put(None)
+
+
+print(f"Streaming frames with {ENCODERS} encoder threads... Press Ctrl+C to stop.")
+pool = ThreadPoolExecutor(max_workers=ENCODERS, thread_name_prefix="jpeg")
+reading = threading.Thread(target=reader, args=(pool,), name="reader", daemon=True)
+reading.start()
+
+sent = late = 0
+end_seq = 0         # seq after the last frame sent: what END reports
+start = None
 try:
     while True:
-        # --- Read a frame from the video
-        ok, frame = cap.read()
-        if not ok:
+        # --- Stage 3: the sequencer. Futures come out in the order they were read,
+        #     whichever encoder finishes first, so frame order is kept for free.
+        job = pending.get()
+        if job is None:
             # --- No more frames: send an END marker so the worker exits cleanly
-            push.send(b"END")
-            print("End of video. Sent END.")
+            push.send_multipart([framing.pack_end(end_seq), b""])
+            print(f"End of video. Sent {sent} frames ({late} late). Sent END.")
             break
-
-        # --- (Optional) resize down to reduce bandwidth
-        # frame = cv2.resize(frame, (640, 360))
-
-        # --- Encode the frame as JPEG (compress to bytes for sending)
-        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-        if not ok:
-            # --- If encoding fails, skip this frame
+        message = job.result()
+        if message is None:
+            # --- If encoding failed, skip this frame
             continue
 
-        # --- Convert to raw bytes
-        jpg_bytes = encoded.tobytes()
-
-        # --- Send the bytes in one message
-        push.send(jpg_bytes)
+        # --- Pace on the monotonic clock: frame N is due at start + N * interval
+        now = time.monotonic()
+        if start is None:
+            start = now
+        due = start + sent * interval
+        if due > now:
+            time.sleep(due - now)
+        elif now - due > interval:
+            late += 1                 # behind schedule: send now, the next ones catch up
 
-        # --- Sleep a bit so the display looks like video (and not a burst)
-        time.sleep(delay)
+        # --- Send [header, JPEG bytes] as one multipart message
+        push.send_multipart(message)
+        sent += 1
+        end_seq = framing.unpack(message[0]).seq + 1
 
 except KeyboardInterrupt:
     # --- If user stops with Ctrl+C, try to notify the worker
-    push.send(b"END")
+    push.send_multipart([framing.pack_end(end_seq), b""])
     print("\nStopped by user. Sent END.")
 
-# --- Cleanup
+# --- Cleanup: stop the reader (drain so it isn't stuck on a full queue), then the pool
+stop.set()
+while reading.is_alive():
+    try:
+        pending.get(timeout=0.1)
+    except queue.Empty:
+        pass
+pool.shutdown(wait=True, cancel_futures=True)
 cap.release()
 push.close()
 ctx.term()